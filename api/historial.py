@@ -0,0 +1,50 @@
+from http.server import BaseHTTPRequestHandler
+from urllib.parse import parse_qs, urlsplit
+import json
+import sys
+from pathlib import Path
+
+# El núcleo compartido vive en backend/viajeia (Root Directory vacío o = backend)
+_raiz = Path(__file__).resolve().parent.parent
+_backend = _raiz / 'backend' if (_raiz / 'backend').is_dir() else _raiz
+if str(_backend) not in sys.path:
+    sys.path.insert(0, str(_backend))
+
+# GET /api/sesion/<id>/historial?since=<cursor> llega aquí por el rewrite de
+# vercel.json como /api/historial?session_id=<id>&since=<cursor>. Solo ve
+# historial de otras instancias con SESIONES_REDIS_URL (ver viajeia/sesiones.py)
+
+class handler(BaseHTTPRequestHandler):
+    def do_OPTIONS(self):
+        self.send_response(200)
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.send_header('Access-Control-Allow-Methods', 'GET, OPTIONS')
+        self.send_header('Access-Control-Allow-Headers', 'Content-Type')
+        self.end_headers()
+    
+    def do_GET(self):
+        try:
+            parametros = parse_qs(urlsplit(self.path).query)
+            session_id = parametros.get('session_id', [''])[0]
+            if not session_id:
+                self.send_json(400, {'error': 'No se proporcionó session_id'})
+                return
+            
+            from viajeia import planificacion
+            desde = planificacion.leer_cursor(parametros.get('since', [''])[0])
+            if desde is None:
+                self.send_json(400, {'error': "'since' debe ser un cursor (entero >= 0)"})
+                return
+            
+            self.send_json(200, planificacion.historial_desde(session_id, desde))
+        
+        except Exception as e:
+            print(f"Error en historial: {str(e)}")
+            self.send_json(500, {'error': 'Error al leer el historial de la sesión'})
+    
+    def send_json(self, status_code, data):
+        self.send_response(status_code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.end_headers()
+        self.wfile.write(json.dumps(data).encode('utf-8'))
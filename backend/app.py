@@ -1,13 +1,11 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
 from flask_cors import CORS
 from functools import wraps
-import google.generativeai as genai
+import json
 import os
-import re
-import requests
 from pathlib import Path
 
-# Cargar variables de entorno de forma segura
+# Cargar variables de entorno de forma segura (antes de importar viajeia, que lee la configuración al importar)
 try:
     from dotenv import load_dotenv
     # Cargar desde el directorio del backend
@@ -20,657 +18,298 @@ except Exception as e:
     print(f"Advertencia: No se pudo cargar dotenv: {e}")
     print("Continuando con variables de entorno del sistema...")
 
+from viajeia import (
+    calentador, circuitos, coalescencia, contexto, http_cliente, itinerarios, limite, lote, metricas, planificacion,
+    plazos, secciones
+)
+from viajeia.cache import cache
+from viajeia.planificacion import (
+    almacen_sesiones, calcular_diferencia_horaria, construir_prompt, error_planificacion,
+    esperar_clima, guardar_turno, preparar_planificacion, recoger_fotos, recoger_tipo_cambio,
+    trozos_compartidos, turno_historial, validate_input
+)
+from viajeia.secciones import DetectorSecciones
+
 app = Flask(__name__)
 
 # Configuración de CORS - Seguro para producción
 allowed_origins = os.getenv('ALLOWED_ORIGINS', 'http://localhost:3000').split(',')
 CORS(app, origins=allowed_origins, supports_credentials=True)
 
-# Configurar la API Key de Gemini desde variables de entorno
-GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
-if not GEMINI_API_KEY:
+# La API Key de Gemini es obligatoria; el modelo (GEMINI_MODEL) se crea en la primera
+# generación, así que importar la app no paga el import de google.generativeai
+if not planificacion.GEMINI_API_KEY:
     raise ValueError("GEMINI_API_KEY no está configurada. Por favor, configura la variable de entorno.")
 
-genai.configure(api_key=GEMINI_API_KEY)
-
-# Configurar el modelo - Gemini 2.0 Flash
-# Puedes cambiar el modelo desde la variable de entorno GEMINI_MODEL
-# Opciones: 'gemini-2.0-flash', 'gemini-2.0-flash-exp', 'gemini-1.5-flash', 'gemini-pro'
-# Nota: 'gemini-2.0-flash' es el modelo recomendado y funcional
-model_name = os.getenv('GEMINI_MODEL', 'gemini-2.0-flash')
-model = genai.GenerativeModel(model_name)
-
-# Configurar API Key de Weatherbit (opcional)
-WEATHERBIT_API_KEY = os.getenv('WEATHERBIT_API_KEY', '')
-
-# Configurar API Key de Unsplash (opcional)
-UNSPLASH_API_KEY = os.getenv('UNSPLASH_API_KEY', '')
-UNSPLASH_ACCESS_KEY = os.getenv('UNSPLASH_ACCESS_KEY', '')  # Para acceso público
+# Rate limiting por IP compartido entre workers (ver viajeia/limite.py)
+limitador = limite.limitador
 
-# Rate limiting simple (en producción usar Redis o similar)
-request_counts = {}
-
-# Historial de conversaciones por sesión (en producción usar Redis o base de datos)
-conversation_history = {}
-# Almacenar destino principal por sesión para mantener contexto
-session_destinations = {}
+def permitir_peticion(client_ip, max_requests=10, window=60, costo=1, cubo=None):
+    """
+    Consume `costo` tokens del cubo de la IP (todos o ninguno); retorna False si
+    superó el límite (compartido entre workers)
+    Con `cubo` la IP tiene un cubo aparte con su propio límite (p. ej. 'historial'),
+    sin gastar los tokens de planificación
+    """
+    clave = f'{cubo}:{client_ip}' if cubo else client_ip
+    return limitador.permitir(clave, max_requests, window, costo)
 
-def rate_limit(max_requests=10, window=60):
+def rate_limit(max_requests=10, window=60, cubo=None):
     """Decorador simple para rate limiting"""
     def decorator(f):
         @wraps(f)
         def decorated_function(*args, **kwargs):
-            client_ip = request.remote_addr
-            current_time = __import__('time').time()
-            
-            # Limpiar entradas antiguas
-            if client_ip in request_counts:
-                request_counts[client_ip] = [
-                    t for t in request_counts[client_ip] 
-                    if current_time - t < window
-                ]
-            else:
-                request_counts[client_ip] = []
-            
-            # Verificar límite
-            if len(request_counts[client_ip]) >= max_requests:
+            if not permitir_peticion(request.remote_addr, max_requests, window, cubo=cubo):
                 return jsonify({
                     'error': 'Demasiadas solicitudes. Por favor, espera un momento.'
                 }), 429
-            
-            # Registrar solicitud
-            request_counts[client_ip].append(current_time)
             return f(*args, **kwargs)
         return decorated_function
     return decorator
 
-def validate_input(text, max_length=2000):
-    """Validar y sanitizar entrada del usuario"""
-    if not text or not isinstance(text, str):
-        return False, "El texto no es válido"
-    
-    if len(text.strip()) == 0:
-        return False, "El texto no puede estar vacío"
-    
-    if len(text) > max_length:
-        return False, f"El texto es demasiado largo (máximo {max_length} caracteres)"
-    
-    # Sanitizar: remover caracteres peligrosos pero permitir texto normal
-    sanitized = re.sub(r'[<>]', '', text)
-    
-    return True, sanitized
-
-def obtener_clima_ciudad(ciudad):
+def leer_pregunta():
     """
-    Obtiene el clima actual de una ciudad usando Weatherbit API
-    Retorna un diccionario con la información del clima o None si hay error
+    Valida el cuerpo JSON de una petición de planificación
+    Retorna (pregunta, session_id, incluir, None) o (None, None, None, respuesta de error);
+    incluir son los campos opcionales pedidos con 'include' (None: los de por defecto)
     """
-    if not WEATHERBIT_API_KEY:
-        return None
+    # Validar Content-Type
+    if not request.is_json:
+        return None, None, None, (jsonify({'error': 'Content-Type debe ser application/json'}), 400)
     
-    try:
-        # Weatherbit API - Current Weather
-        url = "https://api.weatherbit.io/v2.0/current"
-        params = {
-            'city': ciudad,
-            'key': WEATHERBIT_API_KEY,
-            'lang': 'es',
-            'units': 'M'  # Métrico (Celsius)
-        }
-        
-        response = requests.get(url, params=params, timeout=5)
-        
-        if response.status_code == 200:
-            data = response.json()
-            if data.get('data') and len(data['data']) > 0:
-                clima = data['data'][0]
-                return {
-                    'temperatura': clima.get('temp', 'N/A'),
-                    'descripcion': clima.get('weather', {}).get('description', 'N/A'),
-                    'sensacion_termica': clima.get('app_temp', 'N/A'),
-                    'humedad': clima.get('rh', 'N/A'),
-                    'viento': clima.get('wind_spd', 'N/A'),
-                    'ciudad': clima.get('city_name', ciudad),
-                    'pais': clima.get('country_code', ''),
-                    'icono': clima.get('weather', {}).get('icon', '')
-                }
-        elif response.status_code == 429:
-            app.logger.warning("Límite de rate de Weatherbit alcanzado")
-        else:
-            app.logger.warning(f"Weatherbit API error: {response.status_code}")
+    data = request.get_json()
+    if not data:
+        return None, None, None, (jsonify({'error': 'No se proporcionaron datos'}), 400)
     
-    except Exception as e:
-        app.logger.error(f"Error obteniendo clima: {str(e)}")
+    pregunta = data.get('pregunta', '')
+    session_id, error = planificacion.leer_session_id(data.get('session_id'))
+    if error:
+        return None, None, None, (jsonify({'error': error}), 400)
     
-    return None
-
-def obtener_tipo_cambio(base_currency='USD', target_currency='EUR'):
-    """
-    Obtiene el tipo de cambio usando exchangerate-api.com (gratuito)
-    Retorna el tipo de cambio o None si hay error
-    """
-    try:
-        # API gratuita sin key requerida
-        url = f"https://api.exchangerate-api.com/v4/latest/{base_currency}"
-        response = requests.get(url, timeout=5)
-        
-        if response.status_code == 200:
-            data = response.json()
-            if 'rates' in data and target_currency in data['rates']:
-                rate = data['rates'][target_currency]
-                return {
-                    'base': base_currency,
-                    'target': target_currency,
-                    'rate': round(rate, 4),
-                    'fecha': data.get('date', '')
-                }
-    except Exception as e:
-        app.logger.error(f"Error obteniendo tipo de cambio: {str(e)}")
+    # Validar y sanitizar entrada
+    is_valid, result = validate_input(pregunta)
+    if not is_valid:
+        return None, None, None, (jsonify({'error': result}), 400)
+    
+    incluir, error = planificacion.leer_incluir(data.get('include'))
+    if error:
+        return None, None, None, (jsonify({'error': error}), 400)
     
-    return None
+    return result, session_id, incluir, None
 
-def obtener_diferencia_horaria(ciudad):
-    """
-    Obtiene la diferencia horaria de una ciudad usando worldtimeapi.org (gratuito)
-    Retorna información de zona horaria o None si hay error
-    """
+@app.route('/api/planificar', methods=['POST'])
+@rate_limit(max_requests=10, window=60)
+def planificar_viaje():
     try:
-        # Mapeo de ciudades comunes a zonas horarias
-        timezone_map = {
-            'paris': 'Europe/Paris',
-            'parís': 'Europe/Paris',
-            'barcelona': 'Europe/Madrid',
-            'madrid': 'Europe/Madrid',
-            'london': 'Europe/London',
-            'londres': 'Europe/London',
-            'tokyo': 'Asia/Tokyo',
-            'tokio': 'Asia/Tokyo',
-            'new york': 'America/New_York',
-            'nueva york': 'America/New_York',
-            'mexico': 'America/Mexico_City',
-            'méxico': 'America/Mexico_City',
-            'bogota': 'America/Bogota',
-            'bogotá': 'America/Bogota',
-            'buenos aires': 'America/Argentina/Buenos_Aires',
-            'lima': 'America/Lima',
-            'santiago': 'America/Santiago',
-            'rio de janeiro': 'America/Sao_Paulo',
-            'cancun': 'America/Cancun',
-            'cancún': 'America/Cancun',
-            'bali': 'Asia/Makassar',
-            'bangkok': 'Asia/Bangkok',
-            'dubai': 'Asia/Dubai',
-            'singapore': 'Asia/Singapore',
-            'singapur': 'Asia/Singapore',
-            'sydney': 'Australia/Sydney',
-            'sídney': 'Australia/Sydney',
-        }
+        pregunta, session_id, incluir, error = leer_pregunta()
+        if error:
+            return error
         
-        ciudad_lower = ciudad.lower()
-        timezone = timezone_map.get(ciudad_lower)
+        respuesta_json = planificacion.planificar(pregunta, session_id, incluir=incluir)
         
-        if not timezone:
-            # Intentar buscar por nombre parcial
-            for key, tz in timezone_map.items():
-                if key in ciudad_lower or ciudad_lower in key:
-                    timezone = tz
-                    break
+        # Log para debugging
+        clima_data = respuesta_json['clima']
+        app.logger.info(f"📤 Respuesta preparada:")
+        app.logger.info(f"   - Es primera pregunta: {respuesta_json['es_primera_pregunta']}")
+        app.logger.info(f"   - Clima: {clima_data is not None} ({clima_data['ciudad'] if clima_data else 'N/A'})")
+        app.logger.info(f"   - Fotos: {len(respuesta_json['fotos'])} fotos")
+        app.logger.info(f"   - Destino: {respuesta_json['destino']}")
+        app.logger.info(f"   - Info adicional: {bool(respuesta_json['info_adicional'])}")
+        app.logger.info(f"   - Longitud respuesta: {len(respuesta_json['respuesta'])} caracteres")
         
-        if timezone:
-            url = f"http://worldtimeapi.org/api/timezone/{timezone}"
-            response = requests.get(url, timeout=5)
-            
-            if response.status_code == 200:
-                data = response.json()
-                # Calcular diferencia con UTC
-                utc_offset = data.get('utc_offset', '')
-                datetime_str = data.get('datetime', '')
-                
-                # Obtener hora actual formateada
-                hora_actual = None
-                if datetime_str:
-                    try:
-                        from datetime import datetime
-                        dt = datetime.fromisoformat(datetime_str.replace('Z', '+00:00'))
-                        hora_actual = dt.strftime('%H:%M:%S')
-                    except:
-                        pass
-                
-                return {
-                    'timezone': timezone,
-                    'utc_offset': utc_offset,
-                    'datetime': datetime_str,
-                    'hora_actual': hora_actual,
-                    'ciudad': ciudad
-                }
-    except Exception as e:
-        app.logger.error(f"Error obteniendo diferencia horaria: {str(e)}")
+        with metricas.etapa('serializacion'):
+            respuesta = jsonify(respuesta_json)
+        return respuesta, 200
     
-    return None
+    except Exception as e:
+        # Log detallado para debugging (solo en desarrollo)
+        app.logger.error(f"Error en planificar_viaje: {str(e)}")
+        return jsonify(error_planificacion(e)), planificacion.codigo_error(e)
 
-def obtener_fotos_unsplash(destino, cantidad=3):
+@app.route('/api/planificar/batch', methods=['POST'])
+def planificar_viaje_lote():
     """
-    Obtiene fotos de un destino usando Unsplash API
-    Retorna una lista de URLs de fotos o lista vacía si hay error
+    Compara varios destinos con los mismos datos del viaje (ver viajeia/lote.py)
+    Cada plan del lote gasta un token del límite de la IP; si no alcanzan para
+    todos, el lote se rechaza sin gastar ninguno
     """
-    # Usar Access Key si está disponible, sino usar API Key
-    api_key = UNSPLASH_ACCESS_KEY or UNSPLASH_API_KEY
+    if not request.is_json:
+        return jsonify({'error': 'Content-Type debe ser application/json'}), 400
     
-    if not api_key:
-        return []
+    data = request.get_json()
+    if not data:
+        return jsonify({'error': 'No se proporcionaron datos'}), 400
     
-    try:
-        # Unsplash API - Search Photos
-        url = "https://api.unsplash.com/search/photos"
-        headers = {
-            'Authorization': f'Client-ID {api_key}'
-        }
-        params = {
-            'query': destino,
-            'per_page': cantidad,
-            'orientation': 'landscape',
-            'order_by': 'popularity'
-        }
-        
-        response = requests.get(url, headers=headers, params=params, timeout=5)
-        
-        if response.status_code == 200:
-            data = response.json()
-            if data.get('results'):
-                fotos = []
-                for foto in data['results'][:cantidad]:
-                    fotos.append({
-                        'url': foto['urls']['regular'],
-                        'url_small': foto['urls']['small'],
-                        'url_thumb': foto['urls']['thumb'],
-                        'autor': foto['user']['name'],
-                        'autor_url': foto['user']['links']['html'],
-                        'descripcion': foto.get('description', '') or foto.get('alt_description', '') or f'Foto de {destino}'
-                    })
-                app.logger.info(f"Unsplash: {len(fotos)} fotos obtenidas para '{destino}'")
-                return fotos
-            else:
-                app.logger.warning(f"Unsplash: No se encontraron resultados para '{destino}'")
-        elif response.status_code == 401:
-            app.logger.error(f"Unsplash API error 401: API Key inválida o no autorizada")
-        elif response.status_code == 403:
-            app.logger.error(f"Unsplash API error 403: Acceso denegado - verifica tu API key")
-        else:
-            app.logger.warning(f"Unsplash API error: {response.status_code} - {response.text[:200]}")
+    session_id, error = planificacion.leer_session_id(data.get('session_id'))
+    if error:
+        return jsonify({'error': error}), 400
     
-    except Exception as e:
-        app.logger.error(f"Error obteniendo fotos de Unsplash: {str(e)}")
+    planes, error = lote.leer(data, session_id)
+    if error:
+        return jsonify({'error': error}), 400
     
-    return []
+    if not permitir_peticion(request.remote_addr, costo=len(planes)):
+        return jsonify({
+            'error': 'Demasiadas solicitudes. Por favor, espera un momento.'
+        }), 429
+    
+    cuerpo, codigo = lote.planificar(planes)
+    app.logger.info(f"📤 Lote: {cuerpo['correctos']}/{cuerpo['total']} planes correctos")
+    return jsonify(cuerpo), codigo
 
-def extraer_destinos(pregunta):
+def evento_sse(evento, datos):
+    """Serializa un evento Server-Sent Events"""
+    return f"event: {evento}\ndata: {json.dumps(datos, ensure_ascii=False)}\n\n"
+
+@app.route('/api/planificar/stream', methods=['POST'])
+@rate_limit(max_requests=10, window=60)
+def planificar_viaje_stream():
     """
-    Intenta extraer nombres de ciudades/destinos de la pregunta
-    Retorna una lista de posibles destinos
+    Igual que /api/planificar pero transmite la respuesta como Server-Sent Events
+    Eventos: inicio, clima, fotos, tipo_cambio, diferencia_horaria, delta (texto de
+    Gemini), section (cada sección completa de la primera pregunta), fin y error
+    Los de enriquecimiento solo se envían si su campo está en 'include'
     """
-    # Lista de ciudades comunes para mejorar la detección
-    ciudades_comunes = [
-        'paris', 'parís', 'london', 'londres', 'tokyo', 'tokio', 'new york', 
-        'nueva york', 'mexico', 'méxico', 'barcelona', 'madrid', 'roma', 'rome',
-        'bogota', 'bogotá', 'buenos aires', 'lima', 'santiago', 'rio de janeiro',
-        'cancun', 'cancún', 'playa del carmen', 'tulum', 'bali', 'bangkok',
-        'dubai', 'singapore', 'singapur', 'sydney', 'sídney', 'melbourne'
-    ]
-    
-    pregunta_lower = pregunta.lower()
-    destinos_encontrados = []
-    
-    # Buscar ciudades comunes
-    for ciudad in ciudades_comunes:
-        if ciudad in pregunta_lower:
-            destinos_encontrados.append(ciudad.title())
-    
-    # Si no encontramos ciudades conocidas, intentar extraer después de palabras clave
-    if not destinos_encontrados:
-        # Mejorar patrones para detectar destinos del formulario
-        # Patrón específico para el formulario: "Quiero planear un viaje a [destino] desde..."
-        patrones = [
-            r'planear\s+un\s+viaje\s+a\s+([A-ZÁÉÍÓÚÑ][a-záéíóúñ]+(?:\s+[A-ZÁÉÍÓÚÑ][a-záéíóúñ]+)*)',  # "planear un viaje a Paris"
-            r'viaje\s+a\s+([A-ZÁÉÍÓÚÑ][a-záéíóúñ]+(?:\s+[A-ZÁÉÍÓÚÑ][a-záéíóúñ]+)*)',  # "viaje a Paris"
-            r'(?:a|en|desde|hacia|hasta)\s+([A-ZÁÉÍÓÚÑ][a-záéíóúñ]+(?:\s+[A-ZÁÉÍÓÚÑ][a-záéíóúñ]+)*)',  # "a Paris"
-            r'viajar\s+(?:a|a|en)\s+([A-ZÁÉÍÓÚÑ][a-záéíóúñ]+(?:\s+[A-ZÁÉÍÓÚÑ][a-záéíóúñ]+)*)',  # "viajar a Paris"
-            r'destino[:\s]+([A-ZÁÉÍÓÚÑ][a-záéíóúñ]+(?:\s+[A-ZÁÉÍÓÚÑ][a-záéíóúñ]+)*)',  # "destino: Paris"
-            r'¿A\s+dónde\s+quieres\s+viajar\??\s*([A-ZÁÉÍÓÚÑ][a-záéíóúñ]+(?:\s+[A-ZÁÉÍÓÚÑ][a-záéíóúñ]+)*)',  # Para preguntas directas
-        ]
-        
-        for patron in patrones:
-            matches = re.findall(patron, pregunta)
-            if matches:
-                # Limpiar el destino encontrado (remover palabras comunes que no son parte del nombre)
-                for match in matches:
-                    destino = match.strip()
-                    # Remover palabras comunes que pueden aparecer después del destino
-                    destino = re.sub(r'\s+(desde|hasta|hacia|con|y|o|mi|el|la|los|las).*$', '', destino, flags=re.IGNORECASE)
-                    if destino and len(destino) > 2:  # Asegurar que tiene al menos 3 caracteres
-                        destinos_encontrados.append(destino)
-                if destinos_encontrados:
-                    break
-    
-    # Si aún no encontramos nada, intentar extraer cualquier palabra capitalizada después de "a"
-    if not destinos_encontrados:
-        # Buscar patrones más flexibles - incluir acentos y caracteres especiales
-        match = re.search(r'\b(?:a|en|viaje\s+a|viajar\s+a|planear\s+un\s+viaje\s+a)\s+([A-ZÁÉÍÓÚÑ][a-záéíóúñ]+(?:\s+[A-ZÁÉÍÓÚÑ][a-záéíóúñ]+)*)', pregunta, re.IGNORECASE)
-        if match:
-            destino = match.group(1).strip()
-            # Remover palabras comunes
-            destino = re.sub(r'\s+(desde|hasta|hacia|con|y|o|mi|el|la|los|las).*$', '', destino, flags=re.IGNORECASE)
-            if destino and len(destino) > 2:
-                destinos_encontrados.append(destino)
+    pregunta, session_id, incluir, error = leer_pregunta()
+    if error:
+        return error
     
-    # Si aún no encontramos nada, intentar buscar cualquier palabra capitalizada que parezca un lugar
-    # después de "viaje a" o "a" (último recurso)
-    if not destinos_encontrados:
-        # Buscar "viaje a [palabra capitalizada]" de forma más flexible
-        match = re.search(r'(?:viaje|viajar|planear.*viaje).*?\ba\s+([A-ZÁÉÍÓÚÑ][a-záéíóúñ]+(?:\s+[a-záéíóúñ]+)*)', pregunta, re.IGNORECASE)
-        if match:
-            destino = match.group(1).strip()
-            # Remover palabras comunes al final
-            destino = re.sub(r'\s+(desde|hasta|hacia|con|y|o|mi|el|la|los|las|un|una|unos|unas).*$', '', destino, flags=re.IGNORECASE)
-            if destino and len(destino) > 2:
-                destinos_encontrados.append(destino)
-    
-    # Log para debugging
-    if destinos_encontrados:
-        app.logger.info(f"Destinos detectados: {destinos_encontrados}")
-    else:
-        app.logger.warning(f"No se detectaron destinos en: {pregunta[:100]}")
+    plan = preparar_planificacion(pregunta, session_id, incluir=incluir)
+    enriquecimiento = plan['enriquecimiento']
     
-    return destinos_encontrados
-
-@app.route('/api/planificar', methods=['POST'])
-@rate_limit(max_requests=10, window=60)
-def planificar_viaje():
-    try:
-        # Validar Content-Type
-        if not request.is_json:
-            return jsonify({'error': 'Content-Type debe ser application/json'}), 400
-        
-        data = request.get_json()
-        if not data:
-            return jsonify({'error': 'No se proporcionaron datos'}), 400
-        
-        pregunta = data.get('pregunta', '')
-        session_id = data.get('session_id', request.remote_addr)
-        
-        # Validar y sanitizar entrada
-        is_valid, result = validate_input(pregunta)
-        if not is_valid:
-            return jsonify({'error': result}), 400
-        
-        pregunta = result
-        
-        # Obtener historial de conversación si existe
-        historial = conversation_history.get(session_id, [])
-        es_primera_pregunta = len(historial) == 0
-        
-        app.logger.info(f"🔍 Sesión: {session_id}, Es primera pregunta: {es_primera_pregunta}, Historial: {len(historial)} preguntas")
+    def generar():
+        enviados = set()
         
-        # Intentar extraer destinos y obtener clima y fotos (solo en primera pregunta o si se menciona nuevo destino)
-        destinos = extraer_destinos(pregunta)
-        clima_data = None
-        fotos_data = []
-        info_clima = ""
-        destino_detectado = None
+        def eventos_listos(esperar=False):
+            # Fotos y tipo de cambio se envían en cuanto terminan, sin frenar el texto
+            for nombre, recoger in (('fotos', recoger_fotos), ('tipo_cambio', recoger_tipo_cambio)):
+                if nombre in enviados or not enriquecimiento.lanzada(nombre):
+                    continue
+                if esperar or enriquecimiento.terminada(nombre):
+                    enviados.add(nombre)
+                    yield evento_sse(nombre, recoger(plan))
         
-        # Solo buscar clima y fotos en primera pregunta
-        if destinos and es_primera_pregunta:
-            destino_principal = destinos[0]
-            destino_detectado = destino_principal
+        try:
+            yield evento_sse('inicio', {
+                'session_id': session_id,
+                'destino': plan['destino_para_info'],
+                'correccion_destino': plan['correccion_destino'],
+                'es_primera_pregunta': plan['es_primera_pregunta'],
+                'include': sorted(plan['incluir'])
+            })
             
-            app.logger.info(f"🎯 Destino detectado: {destino_principal}")
+            diferencia_horaria = calcular_diferencia_horaria(plan)
+            if diferencia_horaria:
+                yield evento_sse('diferencia_horaria', diferencia_horaria)
             
-            # Obtener clima si hay API key
-            if WEATHERBIT_API_KEY:
-                app.logger.info(f"🌤️ Buscando clima para: {destino_principal}")
-                clima_data = obtener_clima_ciudad(destino_principal)
-                if clima_data:
-                    app.logger.info(f"✅ Clima obtenido exitosamente para {destino_principal}")
-                    info_clima = f"""
-
-INFORMACIÓN DEL CLIMA ACTUAL:
-🌡️ **Temperatura actual en {clima_data['ciudad']}**: {clima_data['temperatura']}°C
-🌤️ **Condiciones**: {clima_data['descripcion']}
-🌡️ **Sensación térmica**: {clima_data['sensacion_termica']}°C
-💧 **Humedad**: {clima_data['humedad']}%
-💨 **Viento**: {clima_data['viento']} m/s
-
-Usa esta información del clima para dar recomendaciones sobre qué ropa llevar y actividades apropiadas para las condiciones climáticas actuales."""
-                else:
-                    app.logger.warning(f"⚠️ No se pudo obtener clima para {destino_principal}")
-            else:
-                app.logger.warning("⚠️ Weatherbit API key no configurada")
+            clima_data, info_clima = esperar_clima(plan)
+            if enriquecimiento.lanzada('clima'):
+                yield evento_sse('clima', clima_data)
+            yield from eventos_listos()
             
-            # Obtener fotos automáticamente si hay API key
-            if UNSPLASH_ACCESS_KEY or UNSPLASH_API_KEY:
-                app.logger.info(f"📸 Buscando fotos para: {destino_principal}")
-                fotos_data = obtener_fotos_unsplash(destino_principal, cantidad=3)
-                if fotos_data:
-                    app.logger.info(f"✅ Fotos obtenidas exitosamente: {len(fotos_data)} fotos para {destino_principal}")
-                else:
-                    app.logger.warning(f"⚠️ No se pudieron obtener fotos para {destino_principal}")
+            prompt = construir_prompt(plan, info_clima)
+            clave_itinerario = planificacion.clave_itinerario(plan)
+            respuesta_cacheada = itinerarios.buscar(clave_itinerario)
+            if respuesta_cacheada is not None:
+                # Las secciones vienen ya separadas de la caché: el texto no pasa por el detector
+                trozos = [planificacion.texto_respuesta(plan, respuesta_cacheada)]
+                detector = None
             else:
-                app.logger.warning("⚠️ Unsplash API key no configurada - las fotos no se obtendrán")
-                app.logger.info("💡 Para habilitar fotos automáticas, agrega UNSPLASH_ACCESS_KEY a backend/.env")
-                app.logger.info("💡 Ver instrucciones en UNSPLASH_SETUP.md")
-        elif historial and not destinos:
-            # En preguntas de seguimiento, usar el destino de la primera pregunta si está disponible
-            if session_id in session_destinations:
-                destino_detectado = session_destinations[session_id]
-                app.logger.info(f"📍 Usando destino de sesión anterior: {destino_detectado}")
-        
-        # Obtener destino de la sesión si existe
-        destino_sesion = session_destinations.get(session_id, None)
-        
-        # Construir contexto del historial
-        contexto_historial = ""
-        if historial:
-            contexto_historial = "\n\nCONTEXTO DE LA CONVERSACIÓN ANTERIOR:\n"
-            for i, (preg, resp) in enumerate(historial[-3:], 1):  # Últimas 3 interacciones
-                contexto_historial += f"\nPregunta {i}: {preg}\nRespuesta {i}: {resp[:200]}...\n"
-        
-        # Agregar información del destino al contexto si existe
-        if destino_sesion and not es_primera_pregunta:
-            contexto_historial += f"\n\nIMPORTANTE: El usuario está preguntando sobre {destino_sesion}. Cuando use palabras como 'allí', 'ese lugar', 'ese destino', 'el transporte allí', etc., se refiere a {destino_sesion}."
-        
-        # Crear el prompt para Axl, el consultor personal de viajes
-        if es_primera_pregunta:
-            # Primera pregunta: estructura completa requerida
-            app.logger.info("📝 Generando prompt para PRIMERA PREGUNTA - estructura completa obligatoria")
-            prompt = f"""Eres Axl, un consultor personal de viajes entusiasta y amigable. Tu personalidad es:
+                trozos = trozos_compartidos(clave_itinerario, prompt, plan['plazo'])
+                detector = DetectorSecciones() if plan['es_primera_pregunta'] else None
             
-- Te presentas siempre como "Axl, tu consultor personal de viajes" 🧳
-- Eres muy entusiasta, amigable y positivo
-- Das respuestas organizadas y estructuradas
-- Usas emojis de viajes relevantes (✈️ 🧳 🗺️ 🏨 🍽️ 🎫 🌍 🏖️ 🏛️ 🎨 etc.)
-- Formateas el texto usando **texto** para negritas (el usuario verá esto resaltado)
-
-⚠️⚠️⚠️ ESTRUCTURA OBLIGATORIA - DEBES SEGUIRLA EXACTAMENTE ⚠️⚠️⚠️
-
-TU RESPUESTA DEBE COMENZAR INMEDIATAMENTE CON ESTA ESTRUCTURA EXACTA. NO AGREGUES INTRODUCCIÓN NI SALUDO ANTES DE LAS SECCIONES.
-
-FORMATO EXACTO OBLIGATORIO (copia y pega esta estructura, solo reemplaza el contenido entre corchetes):
-
-ALOJAMIENTO:
-[recomendaciones detalladas de hoteles, hostales, Airbnb, etc. con precios aproximados, ubicaciones y características. Usa bullets (•) para organizar.]
-
-COMIDA LOCAL:
-[recomendaciones de restaurantes, platos típicos, lugares para comer, precios aproximados, y experiencias gastronómicas. Usa bullets (•) para organizar.]
-
-LUGARES IMPERDIBLES:
-[lista de lugares que no se pueden perder, con descripciones breves, horarios y tips de visita. Usa bullets (•) para organizar.]
-
-CONSEJOS LOCALES:
-[tips especiales, advertencias, costumbres locales, qué evitar, transporte, seguridad, y cualquier información práctica importante. Usa bullets (•) para organizar.{info_clima}]
-
-ESTIMACIÓN DE COSTOS:
-[breakdown aproximado de costos diarios/semanales: alojamiento, comida, transporte, actividades, entretenimiento, etc. Usa bullets (•) para organizar.]
-
-REGLAS ESTRICTAS - DEBES SEGUIRLAS SIN EXCEPCIÓN:
-1. TU RESPUESTA DEBE COMENZAR DIRECTAMENTE CON "ALOJAMIENTO:" (sin introducción previa)
-2. DEBES usar EXACTAMENTE estos títulos en este orden exacto:
-   - ALOJAMIENTO:
-   - COMIDA LOCAL:
-   - LUGARES IMPERDIBLES:
-   - CONSEJOS LOCALES:
-   - ESTIMACIÓN DE COSTOS:
-3. Cada título DEBE estar en MAYÚSCULAS, seguido de DOS PUNTOS (:), y en su propia línea
-4. Después de cada título, DEBES incluir contenido detallado con bullets (•)
-5. NO respondas en un solo párrafo
-6. NO omitas ninguna sección
-7. NO cambies el orden de las secciones
-8. NO uses emojis en los títulos (solo el texto exacto: ALOJAMIENTO:, COMIDA LOCAL:, etc.)
-9. NO agregues texto antes de "ALOJAMIENTO:"
-10. Todas las 5 secciones son OBLIGATORIAS
-
-EJEMPLO DE FORMATO CORRECTO (tu respuesta debe verse así):
-ALOJAMIENTO:
-• Hotel XYZ - $100/noche - Ubicado en el centro
-• Hostal ABC - $30/noche - Ambiente joven y social
-
-COMIDA LOCAL:
-• Restaurante DEF - Platos típicos desde $15
-• Mercado local - Comida callejera desde $5
-
-LUGARES IMPERDIBLES:
-• Plaza Principal - Visita recomendada en la mañana
-• Museo de Arte - Abierto de 9am a 6pm
-
-CONSEJOS LOCALES:
-• Lleva efectivo para mercados locales
-• Evita taxis no oficiales
-
-ESTIMACIÓN DE COSTOS:
-• Alojamiento: $50-100/día
-• Comida: $20-40/día
-• Transporte: $10-20/día
-
-Pregunta del usuario: {pregunta}
-
-IMPORTANTE: Esta es la PRIMERA PREGUNTA. Tu respuesta DEBE comenzar directamente con "ALOJAMIENTO:" sin introducción. Responde EXACTAMENTE con las 5 secciones en el orden especificado. NO uses un solo párrafo. NO omitas ninguna sección."""
-        else:
-            # Preguntas de seguimiento: respuesta libre y concisa (máximo un párrafo)
-            app.logger.info("📝 Generando prompt para PREGUNTA DE SEGUIMIENTO - respuesta concisa en un párrafo")
-            prompt = f"""Eres Axl, un consultor personal de viajes entusiasta y amigable.{contexto_historial}
-
-El usuario está haciendo una pregunta de seguimiento sobre el mismo destino. Responde de manera conversacional, útil y CONCISA.
-
-⚠️⚠️⚠️ ESTA ES UNA PREGUNTA DE SEGUIMIENTO - RESPUESTA CONCISA ⚠️⚠️⚠️
-
-INSTRUCCIONES ESTRICTAS PARA PREGUNTAS DE SEGUIMIENTO:
-- Responde en MÁXIMO UN PÁRRAFO (no más de 4-5 oraciones)
-- Sé directo, específico y útil
-- Responde de forma natural y conversacional, como si estuvieras teniendo una charla
-- Usa **texto entre dos asteriscos** para resaltar información importante si es necesario
-- Incluye 1-2 emojis relevantes si aportan valor
-- NO uses bullets (•) ni listas - solo texto fluido en párrafo
-- NO uses estructura de secciones (no uses 🏨 🍽️ 📍 💡 💰)
-- NO repitas información que ya diste antes - sé conciso
-- Si la pregunta requiere información que ya diste, haz una referencia breve a la respuesta anterior
-- Mantén el tono entusiasta y amigable pero sé breve
-
-IMPORTANTE: Tu respuesta DEBE ser UN SOLO PÁRRAFO. No uses estructura de secciones, no uses bullets, solo texto fluido y natural en un párrafo continuo.
-
-Pregunta actual del usuario: {pregunta}
-
-Responde como Axl, siendo entusiasta, amigable, útil y CONCISO (máximo un párrafo, sin secciones)."""
-        
-        # Generar respuesta con Gemini
-        response = model.generate_content(prompt)
-        respuesta = response.text
-        
-        # Guardar destino en la sesión si es la primera pregunta y hay destino
-        if destino_detectado and es_primera_pregunta:
-            session_destinations[session_id] = destino_detectado
-            app.logger.info(f"💾 Destino guardado para sesión {session_id}: {destino_detectado}")
-        
-        # Guardar en historial de conversación
-        if session_id not in conversation_history:
-            conversation_history[session_id] = []
-        conversation_history[session_id].append((pregunta, respuesta))
-        
-        # Limitar historial a 10 interacciones por sesión
-        if len(conversation_history[session_id]) > 10:
-            conversation_history[session_id] = conversation_history[session_id][-10:]
-        
-        # Obtener información adicional para el panel lateral (solo si hay destino)
-        info_adicional = {}
-        destino_para_info = destino_detectado or destino_sesion or (destinos[0] if destinos else None)
-        
-        if destino_para_info:
-            app.logger.info(f"Obteniendo información adicional para: {destino_para_info}")
+            separadas = []
+            partes = []
+            for texto in trozos:
+                partes.append(texto)
+                yield evento_sse('delta', {'texto': texto})
+                if detector:
+                    for seccion in detector.alimentar(texto):
+                        separadas.append(seccion)
+                        yield evento_sse('section', seccion)
+                yield from eventos_listos()
+            if detector:
+                for seccion in detector.terminar():
+                    separadas.append(seccion)
+                    yield evento_sse('section', seccion)
+            elif respuesta_cacheada is not None:
+                for seccion in plan['secciones'] or []:
+                    yield evento_sse('section', seccion)
             
-            # Obtener tipo de cambio (USD a EUR como ejemplo)
-            tipo_cambio = obtener_tipo_cambio('USD', 'EUR')
-            if tipo_cambio:
-                info_adicional['tipo_cambio'] = tipo_cambio
-                app.logger.info(f"Tipo de cambio obtenido: {tipo_cambio}")
-            else:
-                app.logger.warning("No se pudo obtener tipo de cambio")
+            respuesta = ''.join(partes)
+            if respuesta_cacheada is None:
+                itinerarios.guardar(clave_itinerario, respuesta, separadas)
+            # El historial de la sesión se actualiza al terminar el stream
+            guardar_turno(plan, respuesta)
             
-            # Obtener diferencia horaria
-            diferencia_horaria = obtener_diferencia_horaria(destino_para_info)
-            if diferencia_horaria:
-                info_adicional['diferencia_horaria'] = diferencia_horaria
-                app.logger.info(f"Diferencia horaria obtenida: {diferencia_horaria}")
-            else:
-                app.logger.warning(f"No se pudo obtener diferencia horaria para {destino_para_info}")
-        else:
-            app.logger.warning("No hay destino detectado para obtener información adicional")
-        
-        # Preparar respuesta con clima y fotos
-        destino_final = destino_detectado or destino_sesion or (destinos[0] if destinos else None)
-        respuesta_json = {
-            'respuesta': respuesta,
-            'clima': clima_data,
-            'fotos': fotos_data,
-            'destino': destino_final,
-            'session_id': session_id,
-            'es_primera_pregunta': es_primera_pregunta,
-            'info_adicional': info_adicional if info_adicional else None,
-            'historial': [{'pregunta': p, 'respuesta': r[:100] + '...' if len(r) > 100 else r} for p, r in historial] if historial else []
-        }
-        
-        # Log para debugging
-        app.logger.info(f"📤 Respuesta preparada:")
-        app.logger.info(f"   - Es primera pregunta: {es_primera_pregunta}")
-        app.logger.info(f"   - Clima: {clima_data is not None} ({clima_data['ciudad'] if clima_data else 'N/A'})")
-        app.logger.info(f"   - Fotos: {len(fotos_data)} fotos")
-        app.logger.info(f"   - Destino: {respuesta_json['destino']}")
-        app.logger.info(f"   - Info adicional: {bool(info_adicional)}")
-        app.logger.info(f"   - Longitud respuesta: {len(respuesta)} caracteres")
-        
-        return jsonify(respuesta_json), 200
+            yield from eventos_listos(esperar=True)
+            yield evento_sse('fin', {
+                'session_id': session_id,
+                'destino': plan['destino_para_info'],
+                'es_primera_pregunta': plan['es_primera_pregunta'],
+                'cache_itinerario': respuesta_cacheada is not None,
+                'turno': turno_historial(plan.get('cursor'), pregunta, respuesta),
+                'cursor': plan.get('cursor'),
+                'uso_prompt': plan.get('uso_prompt')
+            })
+        except Exception as e:
+            app.logger.error(f"Error en planificar_viaje_stream: {str(e)}")
+            yield evento_sse('error', error_planificacion(e))
     
-    except Exception as e:
-        error_message = str(e)
-        # Log detallado para debugging (solo en desarrollo)
-        app.logger.error(f"Error en planificar_viaje: {error_message}")
-        
-        # Manejar errores específicos de la API
-        if 'API_KEY' in error_message or 'quota' in error_message.lower() or 'permission' in error_message.lower():
-            return jsonify({
-                'error': 'Error con la API de Gemini. Por favor, verifica la configuración.',
-                'details': error_message if os.getenv('FLASK_DEBUG', 'False').lower() == 'true' else None
-            }), 500
-        elif 'model' in error_message.lower() or 'not found' in error_message.lower():
-            return jsonify({
-                'error': f'Error con el modelo de Gemini. Verifica que el modelo esté disponible. Error: {error_message}',
-                'details': error_message if os.getenv('FLASK_DEBUG', 'False').lower() == 'true' else None
-            }), 500
-        return jsonify({
-            'error': 'Error al procesar la solicitud. Por favor, intenta de nuevo.',
-            'details': error_message if os.getenv('FLASK_DEBUG', 'False').lower() == 'true' else None
-        }), 500
+    return Response(
+        stream_with_context(generar()),
+        mimetype='text/event-stream',
+        # X-Accel-Buffering: nginx no debe acumular el stream antes de enviarlo
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@app.route('/api/sesion/<session_id>/historial', methods=['GET'])
+@rate_limit(max_requests=60, window=60, cubo='historial')
+def historial_sesion(session_id):
+    """Turnos de la sesión posteriores al cursor ?since= (ver planificacion.historial_desde)"""
+    desde = planificacion.leer_cursor(request.args.get('since'))
+    if desde is None:
+        return jsonify({'error': "'since' debe ser un cursor (entero >= 0)"}), 400
+    return jsonify(planificacion.historial_desde(session_id, desde)), 200
 
 @app.route('/api/health', methods=['GET'])
 def health_check():
     return jsonify({'status': 'ok', 'service': 'ViajeIA API'}), 200
 
+@app.route('/api/estadisticas', methods=['GET'])
+def estadisticas():
+    """Estadísticas internas de este worker (pools HTTP por host y caché)"""
+    return jsonify({
+        'http': http_cliente.estadisticas(),
+        'cache': cache.estadisticas(),
+        'cache_itinerarios': itinerarios.cache_itinerarios.estadisticas(),
+        'sesiones': almacen_sesiones.estadisticas(),
+        'contexto': contexto.estadisticas(),
+        'coalescencia': coalescencia.vuelos.estadisticas(),
+        'plazos': plazos.estadisticas(),
+        'circuitos': circuitos.estadisticas(),
+        'calentador': calentador.estadisticas(),
+        'salida_estructurada': secciones.estadisticas(),
+        'rate_limit': limitador.estadisticas()
+    }), 200
+
+@app.route('/api/metrics', methods=['GET'])
+def metrics():
+    """Métricas de todos los workers en formato Prometheus (ver viajeia/metricas.py)"""
+    cuerpo, tipo = metricas.exportar()
+    if cuerpo is None:
+        return jsonify({'error': 'Métricas no disponibles: instala prometheus-client'}), 503
+    return Response(cuerpo, content_type=tipo)
+
+# Peticiones en curso en el worker (con stream, hasta que termina el stream)
+@app.before_request
+def empezar_peticion():
+    metricas.empezar_peticion()
+
+@app.teardown_request
+def terminar_peticion(error=None):
+    metricas.terminar_peticion()
+
 # Headers de seguridad
 @app.after_request
 def set_security_headers(response):
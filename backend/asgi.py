@@ -0,0 +1,340 @@
+"""
+ASGI entry point (modo asíncrono)
+
+Sirve /api/planificar, /api/planificar/batch, el historial de sesión y
+/api/health con Quart sobre un event loop: las consultas a Weatherbit,
+Unsplash y exchangerate-api van por httpx y la llamada a Gemini usa
+generate_content_async, así que una petición que espera a la red no ocupa un
+hilo. El contrato JSON es el mismo que el de app.py; la validación, el estado
+de sesión y los prompts vienen del núcleo compartido viajeia/planificacion.py.
+Lo que usa SQLite (sesiones, caché de itinerarios, rate limiting) se llama
+con asyncio.to_thread: una espera por bloqueo no detiene el loop.
+
+Uso: pip install -r requirements-asgi.txt && uvicorn asgi:app --port 5000
+"""
+import asyncio
+import os
+
+from quart import Quart, jsonify, request
+from quart_cors import cors
+
+import app as base
+from viajeia import (
+    asincrono, calentador, circuitos, coalescencia, contexto, itinerarios, lote, metricas, planificacion, plazos,
+    secciones
+)
+from viajeia.cache import cache
+
+app = Quart(__name__)
+app = cors(app, allow_origin=base.allowed_origins, allow_credentials=True)
+logger = base.app.logger
+
+
+async def permitir_peticion(client_ip, max_requests=10, window=60, costo=1, cubo=None):
+    """base.permitir_peticion fuera del loop (el limitador compartido es un UPSERT en SQLite)"""
+    return await asyncio.to_thread(base.permitir_peticion, client_ip, max_requests, window, costo, cubo)
+
+
+async def _clima_sin_cache(clave):
+    try:
+        response = await asincrono.get(planificacion.URL_WEATHERBIT, params=planificacion.parametros_clima(clave), timeout=5)
+        return planificacion.procesar_clima(response, clave)
+    except circuitos.CircuitoAbierto:
+        raise
+    except Exception as e:
+        logger.error(f"Error obteniendo clima: {str(e)}")
+    return None
+
+
+async def obtener_clima_ciudad(ciudad):
+    """Clima actual de una ciudad (misma caché que clima_destino de app.py)"""
+    if not planificacion.WEATHERBIT_API_KEY:
+        return None
+    return await asincrono.obtener_cacheado('clima', (planificacion.clave_clima(ciudad),), _clima_sin_cache)
+
+
+async def obtener_tipo_cambio(base_currency='USD', target_currency='EUR'):
+    try:
+        return await asincrono.tipo_cambio(base_currency, target_currency)
+    except Exception as e:
+        logger.error(f"Error obteniendo tipo de cambio: {str(e)}")
+    return None
+
+
+async def obtener_fotos_unsplash(destino, cantidad=3):
+    try:
+        return await asincrono.seleccionar_fotos(destino, cantidad)
+    except Exception as e:
+        logger.error(f"Error obteniendo fotos de Unsplash: {str(e)}")
+    return []
+
+
+async def generar(prompt, plazo, configuracion=None):
+    opciones = planificacion.opciones_generacion(plazo)
+    if configuracion:
+        opciones['generation_config'] = configuracion
+    circuitos.gemini.permitir()
+    try:
+        with metricas.etapa('gemini'):
+            response = await planificacion.modelo().generate_content_async(prompt, **opciones)
+    except Exception as e:
+        circuitos.gemini.fallo(e)
+        raise
+    circuitos.gemini.exito()
+    return response.text
+
+
+async def generar_itinerario(prompt, plazo):
+    """Equivalente asíncrono de planificacion.generar_itinerario (salida estructurada validada)"""
+    original = await generar(prompt, plazo, secciones.configuracion())
+    encontradas = secciones.leer_salida(original)
+    faltan = secciones.faltantes(encontradas)
+    if not faltan or not encontradas:
+        return secciones.componer(encontradas, original)
+
+    logger.warning(f"⚠️ Faltan secciones en la salida estructurada: {faltan}; se piden solo esas")
+    try:
+        reparacion = await generar(secciones.prompt_reparacion(prompt, faltan), plazo, secciones.configuracion(faltan))
+        encontradas.update(secciones.leer_salida(reparacion, faltan))
+    except Exception as e:
+        logger.error(f"Error pidiendo las secciones que faltan: {str(e)}")
+    return secciones.componer(encontradas, original, reparada=True)
+
+
+async def resultado(tareas, nombre, por_defecto=None, espera=None):
+    """
+    Espera una tarea de enriquecimiento como mucho `espera` segundos; si no se
+    lanzó, falló o no terminó a tiempo retorna por_defecto (la tarea sigue y llena la caché)
+    """
+    tarea = tareas.get(nombre)
+    if tarea is None:
+        return por_defecto
+    try:
+        return await asyncio.wait_for(asyncio.shield(tarea), espera)
+    except asyncio.TimeoutError:
+        plazos.omitida(nombre)
+        return por_defecto
+    except circuitos.CircuitoAbierto as e:
+        logger.warning(f"Enriquecimiento '{nombre}' omitido: {str(e)}")
+        return por_defecto
+    except Exception as e:
+        logger.error(f"Error en enriquecimiento '{nombre}': {str(e)}")
+        return por_defecto
+
+
+async def leer_pregunta():
+    """Equivalente asíncrono de leer_pregunta de app.py"""
+    if not request.is_json:
+        return None, None, None, (jsonify({'error': 'Content-Type debe ser application/json'}), 400)
+
+    data = await request.get_json()
+    if not data:
+        return None, None, None, (jsonify({'error': 'No se proporcionaron datos'}), 400)
+
+    pregunta = data.get('pregunta', '')
+    session_id, error = planificacion.leer_session_id(data.get('session_id'))
+    if error:
+        return None, None, None, (jsonify({'error': error}), 400)
+
+    is_valid, result = planificacion.validate_input(pregunta)
+    if not is_valid:
+        return None, None, None, (jsonify({'error': result}), 400)
+
+    incluir, error = planificacion.leer_incluir(data.get('include'))
+    if error:
+        return None, None, None, (jsonify({'error': error}), 400)
+
+    return result, session_id, incluir, None
+
+
+async def planificar(pregunta, session_id, plazo=None, incluir=None):
+    """Planificación completa de una pregunta ya validada (equivalente asíncrono de planificacion.planificar)"""
+    # El almacén de sesiones puede ser SQLite o Redis: se consulta fuera del loop
+    plan = await asyncio.to_thread(planificacion.resolver_planificacion, pregunta, session_id, plazo, incluir)
+
+    # Todas las consultas externas se lanzan a la vez como tareas del loop
+    tareas = {}
+    destino = plan['destino_detectado']
+    if plan['pedir_clima']:
+        tareas['clima'] = asyncio.create_task(metricas.medir_async('clima', obtener_clima_ciudad(destino)))
+    if plan['pedir_fotos']:
+        tareas['fotos'] = asyncio.create_task(metricas.medir_async('fotos', obtener_fotos_unsplash(destino, cantidad=3)))
+    if plan['moneda']:
+        tareas['tipo_cambio'] = asyncio.create_task(
+            metricas.medir_async('tipo_cambio', obtener_tipo_cambio('USD', plan['moneda']))
+        )
+
+    plazo = plan['plazo']
+    clima_data = await resultado(tareas, 'clima', espera=plazo.espera(reserva=plazos.RESERVA_GENERACION))
+    prompt = planificacion.construir_prompt(
+        plan, planificacion.formatear_info_clima(clima_data), estructurado=planificacion.SALIDA_ESTRUCTURADA
+    )
+
+    clave_itinerario = planificacion.clave_itinerario(plan)
+    respuesta = await asyncio.to_thread(itinerarios.buscar, clave_itinerario)
+    cache_itinerario = respuesta is not None
+    if cache_itinerario:
+        logger.info(f"⚡ Itinerario servido desde caché: {clave_itinerario}")
+    else:
+        # Generaciones idénticas en vuelo en este worker se comparten (viajeia.coalescencia)
+        respuesta = await coalescencia.vuelos.ejecutar_async(
+            clave_itinerario or planificacion.clave_prompt(prompt),
+            generar_itinerario if plan['estructurado'] else generar, prompt, plazo, plazo_espera=plazo
+        )
+
+    respuesta = planificacion.texto_respuesta(plan, respuesta)
+    if not cache_itinerario:
+        await asyncio.to_thread(itinerarios.guardar, clave_itinerario, respuesta, plan['secciones'])
+
+    await asyncio.to_thread(planificacion.guardar_turno, plan, respuesta)
+
+    fotos_data = await resultado(tareas, 'fotos', [], espera=plazo.espera())
+    info_adicional = {}
+    tipo_cambio = await resultado(tareas, 'tipo_cambio', espera=plazo.espera())
+    if tipo_cambio:
+        info_adicional['tipo_cambio'] = tipo_cambio
+    diferencia_horaria = planificacion.calcular_diferencia_horaria(plan)
+    if diferencia_horaria:
+        info_adicional['diferencia_horaria'] = diferencia_horaria
+
+    return planificacion.respuesta_planificacion(
+        plan, respuesta, cache_itinerario, clima_data, fotos_data, info_adicional
+    )
+
+
+@app.route('/api/planificar', methods=['POST'])
+async def planificar_viaje():
+    if not await permitir_peticion(request.remote_addr, max_requests=10, window=60):
+        return jsonify({
+            'error': 'Demasiadas solicitudes. Por favor, espera un momento.'
+        }), 429
+
+    try:
+        pregunta, session_id, incluir, error = await leer_pregunta()
+        if error:
+            return error
+
+        respuesta_json = await planificar(pregunta, session_id, incluir=incluir)
+        with metricas.etapa('serializacion'):
+            respuesta = jsonify(respuesta_json)
+        return respuesta, 200
+
+    except Exception as e:
+        logger.error(f"Error en planificar_viaje (asgi): {str(e)}")
+        return jsonify(planificacion.error_planificacion(e)), planificacion.codigo_error(e)
+
+
+@app.route('/api/planificar/batch', methods=['POST'])
+async def planificar_viaje_lote():
+    """Equivalente asíncrono del lote de app.py: los planes son tareas del loop, LOTE_CONCURRENCIA a la vez"""
+    if not request.is_json:
+        return jsonify({'error': 'Content-Type debe ser application/json'}), 400
+
+    data = await request.get_json()
+    if not data:
+        return jsonify({'error': 'No se proporcionaron datos'}), 400
+
+    session_id, error = planificacion.leer_session_id(data.get('session_id'))
+    if error:
+        return jsonify({'error': error}), 400
+
+    planes, error = lote.leer(data, session_id)
+    if error:
+        return jsonify({'error': error}), 400
+
+    if not await permitir_peticion(request.remote_addr, costo=len(planes)):
+        return jsonify({
+            'error': 'Demasiadas solicitudes. Por favor, espera un momento.'
+        }), 429
+
+    plazo = plazos.Plazo()
+    limite = asyncio.Semaphore(lote.CONCURRENCIA)
+
+    async def uno(plan):
+        async with limite:
+            try:
+                return lote.resultado(plan, await planificar(plan['pregunta'], plan['session_id'], plazo, plan['incluir']))
+            except Exception as e:
+                logger.error(f"Error en el plan '{plan['solicitado']}' del lote (asgi): {str(e)}")
+                return lote.resultado(plan, error=e)
+
+    cuerpo, codigo = lote.respuesta(await asyncio.gather(*(uno(plan) for plan in planes)))
+    return jsonify(cuerpo), codigo
+
+
+@app.route('/api/sesion/<session_id>/historial', methods=['GET'])
+async def historial_sesion(session_id):
+    if not await permitir_peticion(request.remote_addr, max_requests=60, window=60, cubo='historial'):
+        return jsonify({
+            'error': 'Demasiadas solicitudes. Por favor, espera un momento.'
+        }), 429
+
+    desde = planificacion.leer_cursor(request.args.get('since'))
+    if desde is None:
+        return jsonify({'error': "'since' debe ser un cursor (entero >= 0)"}), 400
+    return jsonify(await asyncio.to_thread(planificacion.historial_desde, session_id, desde)), 200
+
+
+@app.route('/api/health', methods=['GET'])
+async def health_check():
+    return jsonify({'status': 'ok', 'service': 'ViajeIA API', 'modo': 'asgi'}), 200
+
+
+@app.route('/api/estadisticas', methods=['GET'])
+async def estadisticas():
+    """Estadísticas internas de este worker (caché; el pool es el de httpx)"""
+    return jsonify({
+        'cache': cache.estadisticas(),
+        'cache_itinerarios': itinerarios.cache_itinerarios.estadisticas(),
+        'sesiones': await asyncio.to_thread(planificacion.almacen_sesiones.estadisticas),
+        'contexto': contexto.estadisticas(),
+        'coalescencia': coalescencia.vuelos.estadisticas(),
+        'plazos': plazos.estadisticas(),
+        'circuitos': circuitos.estadisticas(),
+        'calentador': calentador.estadisticas(),
+        'salida_estructurada': secciones.estadisticas()
+    }), 200
+
+
+@app.route('/api/metrics', methods=['GET'])
+async def metrics():
+    """Métricas en formato Prometheus (con uvicorn --workers, PROMETHEUS_MULTIPROC_DIR las suma)"""
+    cuerpo, tipo = await asyncio.to_thread(metricas.exportar)
+    if cuerpo is None:
+        return jsonify({'error': 'Métricas no disponibles: instala prometheus-client'}), 503
+    return cuerpo, 200, {'Content-Type': tipo}
+
+
+@app.before_request
+async def empezar_peticion():
+    metricas.empezar_peticion()
+
+
+@app.teardown_request
+async def terminar_peticion(error=None):
+    metricas.terminar_peticion(actualizar=False)
+    # Contar las sesiones puede ser una consulta a SQLite o Redis: fuera del loop
+    if metricas.medidores_vencidos():
+        await asyncio.to_thread(metricas.actualizar_medidores)
+
+
+@app.after_request
+async def set_security_headers(response):
+    return base.set_security_headers(response)
+
+
+@app.before_serving
+async def iniciar_calentador():
+    # Con uvicorn no hay post_fork: cada worker lanza su hilo y el arriendo deja trabajar a uno
+    if calentador.MODO == 'worker':
+        calentador.iniciar()
+
+
+@app.after_serving
+async def cerrar_cliente():
+    await asincrono.cerrar()
+
+
+if __name__ == '__main__':
+    port = int(os.getenv('PORT', 5000))
+    app.run(host='0.0.0.0', port=port)
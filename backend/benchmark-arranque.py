@@ -0,0 +1,133 @@
+"""
+Benchmark del arranque en frío de los puntos de entrada (app.py y la función
+de Vercel api/planificar.py)
+
+Cada repetición es un proceso nuevo que mide: import del módulo de entrada,
+primera petición ligera (GET /api/health en Flask, OPTIONS en Vercel),
+import de viajeia.planificacion si la entrada aún no lo cargó, creación del
+modelo de Gemini (import de google.generativeai, sin red) y primer POST
+/api/planificar con la generación sustituida por un texto fijo. La pregunta
+no menciona destinos (ni activa los patrones de respaldo) y no hay claves de APIs de enriquecimiento,
+así que no sale ninguna petición de red.
+
+Uso: python benchmark-arranque.py [repeticiones]
+"""
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+BACKEND = Path(__file__).parent
+PREGUNTA = '¿Qué equipaje debería llevar siempre?'
+
+_COMUN = """
+import json, sys, time, types
+from pathlib import Path
+sys.path.insert(0, {backend!r})
+medidas = {{}}
+def generar(prompt, **kwargs):
+    return types.SimpleNamespace(text='ALOJAMIENTO:\\n• Hotel')
+def sustituir_modelo():
+    t = time.perf_counter()
+    from viajeia import planificacion
+    medidas['nucleo'] = time.perf_counter() - t
+    t = time.perf_counter()
+    planificacion.modelo()
+    medidas['modelo'] = time.perf_counter() - t
+    planificacion._modelo = types.SimpleNamespace(generate_content=generar)
+"""
+
+_FLASK = _COMUN + """
+t = time.perf_counter()
+import app
+medidas['import'] = time.perf_counter() - t
+cliente = app.app.test_client()
+t = time.perf_counter()
+assert cliente.get('/api/health').status_code == 200
+medidas['ligera'] = time.perf_counter() - t
+sustituir_modelo()
+t = time.perf_counter()
+respuesta = cliente.post('/api/planificar', json={{'pregunta': {pregunta!r}, 'session_id': 'arranque'}})
+assert respuesta.status_code == 200, respuesta.get_data(as_text=True)
+medidas['post'] = time.perf_counter() - t
+print(json.dumps(medidas))
+"""
+
+_VERCEL = _COMUN + """
+import importlib.util, io
+class Conexion:
+    def __init__(self, peticion):
+        self.entrada = io.BytesIO(peticion)
+        self.salida = io.BytesIO()
+    def makefile(self, modo, *args):
+        return self.entrada
+    def sendall(self, datos):
+        self.salida.write(datos)
+def peticion(handler, metodo, cuerpo=b''):
+    conexion = Conexion(
+        f'{{metodo}} /api/planificar HTTP/1.1\\r\\nContent-Type: application/json\\r\\n'
+        f'Content-Length: {{len(cuerpo)}}\\r\\n\\r\\n'.encode() + cuerpo
+    )
+    handler(conexion, ('127.0.0.1', 0), None)
+    return conexion.salida.getvalue().split(b' ', 2)[1]
+t = time.perf_counter()
+spec = importlib.util.spec_from_file_location('planificar', {ruta_vercel!r})
+modulo = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(modulo)
+medidas['import'] = time.perf_counter() - t
+t = time.perf_counter()
+assert peticion(modulo.handler, 'OPTIONS') == b'200'
+medidas['ligera'] = time.perf_counter() - t
+sustituir_modelo()
+cuerpo = json.dumps({{'pregunta': {pregunta!r}, 'session_id': 'arranque'}}).encode()
+t = time.perf_counter()
+estado = peticion(modulo.handler, 'POST', cuerpo)
+assert estado == b'200', estado
+medidas['post'] = time.perf_counter() - t
+print(json.dumps(medidas))
+"""
+
+
+def medir(codigo, entorno):
+    salida = subprocess.run(
+        [sys.executable, '-c', codigo], cwd=BACKEND, env=entorno,
+        capture_output=True, text=True, check=True
+    )
+    return json.loads(salida.stdout.strip().splitlines()[-1])
+
+
+def main():
+    repeticiones = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    temporal = tempfile.mkdtemp(prefix='viajeia-arranque-')
+    entorno = {
+        k: v for k, v in os.environ.items()
+        if k not in ('WEATHERBIT_API_KEY', 'UNSPLASH_API_KEY', 'UNSPLASH_ACCESS_KEY', 'SESIONES_REDIS_URL')
+    }
+    entorno.update({
+        'GEMINI_API_KEY': 'benchmark',
+        'VIAJEIA_CACHE_DB': os.path.join(temporal, 'cache.sqlite3'),
+        'VIAJEIA_LIMITES_DB': os.path.join(temporal, 'limites.sqlite3'),
+        'VIAJEIA_SESIONES_DB': os.path.join(temporal, 'sesiones.sqlite3'),
+        'PYTHONDONTWRITEBYTECODE': '1',
+    })
+    ruta_vercel = BACKEND / 'api' / 'planificar.py'
+    entradas = {
+        'Flask (app.py)': _FLASK.format(backend=str(BACKEND), pregunta=PREGUNTA),
+        'Vercel (api/planificar.py)': _VERCEL.format(
+            backend=str(BACKEND), pregunta=PREGUNTA, ruta_vercel=str(ruta_vercel)
+        ),
+    }
+
+    print(f'Mediana de {repeticiones} procesos nuevos (ms)')
+    print(f"{'entrada':<28}{'import':>10}{'ligera':>10}{'núcleo':>10}{'modelo':>10}{'1er POST':>10}")
+    for nombre, codigo in entradas.items():
+        medidas = [medir(codigo, entorno) for _ in range(repeticiones)]
+        columnas = [statistics.median(m[clave] for m in medidas) * 1000 for clave in ('import', 'ligera', 'nucleo', 'modelo', 'post')]
+        print(f'{nombre:<28}' + ''.join(f'{valor:>10.1f}' for valor in columnas))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+"""
+Benchmark de la detección de destinos: la búsqueda por subcadenas original
+de extraer_destinos frente al autómata de viajeia/destinos.py
+
+Uso: python benchmark-destinos.py [repeticiones]
+"""
+import random
+import string
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from viajeia import destinos  # noqa: E402
+
+# Búsqueda de ciudades conocidas tal como estaba en extraer_destinos (app.py)
+CIUDADES_COMUNES = [
+    'paris', 'parís', 'london', 'londres', 'tokyo', 'tokio', 'new york',
+    'nueva york', 'mexico', 'méxico', 'barcelona', 'madrid', 'roma', 'rome',
+    'bogota', 'bogotá', 'buenos aires', 'lima', 'santiago', 'rio de janeiro',
+    'cancun', 'cancún', 'playa del carmen', 'tulum', 'bali', 'bangkok',
+    'dubai', 'singapore', 'singapur', 'sydney', 'sídney', 'melbourne'
+]
+
+
+def original(pregunta, ciudades=CIUDADES_COMUNES):
+    pregunta_lower = pregunta.lower()
+    return [ciudad.title() for ciudad in ciudades if ciudad in pregunta_lower]
+
+
+def nuevo(pregunta, buscador=None):
+    buscador = buscador or destinos.obtener_buscador()
+    return [texto.lower().title() for texto, _ in buscador.buscar(pregunta)]
+
+
+# Preguntas reales del formulario y del chat (incluye casos con falsos positivos del método original)
+CORPUS = [
+    'Quiero planear un viaje a París desde 2025-12-01 hasta 2025-12-07. Mi presupuesto aproximado es Moderado ($500 - $1,500 USD) y prefiero cultura. ¿Puedes ayudarme a planificar este viaje?',
+    'Quiero planear un viaje a Tokio desde 2026-03-20 hasta 2026-04-02. Mi presupuesto aproximado es Lujo (más de $3,000 USD) y prefiero aventura. ¿Puedes ayudarme a planificar este viaje?',
+    'Quiero planear un viaje a Cancún desde 2026-01-10 hasta 2026-01-14. Mi presupuesto aproximado es Económico (menos de $500 USD) y prefiero relajación. ¿Puedes ayudarme a planificar este viaje?',
+    'Quiero planear un viaje a Buenos Aires desde 2026-02-01 hasta 2026-02-10. Mi presupuesto aproximado es Comfortable ($1,500 - $3,000 USD) y prefiero cultura. ¿Puedes ayudarme a planificar este viaje?',
+    '¿Qué me recomiendas visitar en Roma en tres días?',
+    '¿Cuál es el mejor barrio para alojarse en Barcelona?',
+    'Voy de Madrid a Lisboa en tren, ¿vale la pena?',
+    '¿Cómo es el transporte allí?',
+    '¿Qué comida típica debo probar?',
+    'Me encanta el aroma del café, ¿dónde hay buenas cafeterías?',
+    'What is the climate like in December?',
+    'Quiero ir a Ciudad de México y luego a Playa del Carmen',
+    'Estoy entre Bali y Bangkok para mi luna de miel',
+    '¿Es caro Dubái para una semana?',
+    '¿Necesito visa para Singapur si soy colombiano?',
+    'Planeo un viaje a Santiago de Chile en invierno',
+    'Quiero ver el Carnaval de Río de Janeiro',
+    '¿Qué hago en Sídney si llueve?',
+    'Recomiéndame museos en Nueva York',
+    'Tengo una escala larga en Londres, ¿qué puedo ver?',
+    'Compré una blusa de lima y limón en el mercado',
+    'Sublimación de camisetas en Bogotá',
+    '¿Hay tours a Tulum desde Cancún?',
+    'Viajo con mi familia y dos niños pequeños',
+    '¿Cuánto cuesta un taxi del aeropuerto al centro?',
+    'Melbourne o Sydney para estudiar inglés',
+    'Quiero planear un viaje a Lima desde 2026-05-01 hasta 2026-05-20. Mi presupuesto aproximado es Moderado ($500 - $1,500 USD) y prefiero aventura. ¿Puedes ayudarme a planificar este viaje?',
+    'Romántico fin de semana en una cabaña',
+    '¿Es seguro caminar de noche por el centro?',
+    'Voy a un congreso en Tokyo y tengo dos días libres',
+]
+
+
+def medir(funcion, textos, repeticiones):
+    inicio = time.perf_counter()
+    for _ in range(repeticiones):
+        for texto in textos:
+            funcion(texto)
+    return (time.perf_counter() - inicio) / (repeticiones * len(textos)) * 1e6
+
+
+def nombres_sinteticos(cantidad, semilla=7):
+    azar = random.Random(semilla)
+    nombres = set()
+    while len(nombres) < cantidad:
+        palabras = azar.randint(1, 3)
+        nombres.add(' '.join(
+            ''.join(azar.choices(string.ascii_lowercase, k=azar.randint(4, 9))) for _ in range(palabras)
+        ))
+    return sorted(nombres)
+
+
+def main():
+    repeticiones = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+
+    print('Diferencias en el corpus (original -> nuevo):')
+    for pregunta in CORPUS:
+        antes, despues = original(pregunta), nuevo(pregunta)
+        if antes != despues:
+            print(f'  {pregunta[:60]!r}: {antes} -> {despues}')
+
+    print(f'\nTabla actual ({len(CIUDADES_COMUNES)} nombres), {len(CORPUS)} preguntas:')
+    print(f'  original: {medir(original, CORPUS, repeticiones):8.2f} µs/pregunta')
+    print(f'  autómata: {medir(nuevo, CORPUS, repeticiones):8.2f} µs/pregunta')
+
+    repeticiones_grandes = max(1, repeticiones // 20)
+    for cantidad in (1000, 10000, 50000):
+        nombres = nombres_sinteticos(cantidad)
+        inicio = time.perf_counter()
+        buscador = destinos.BuscadorDestinos({nombre: nombre for nombre in nombres})
+        construccion = time.perf_counter() - inicio
+        ciudades = CIUDADES_COMUNES + nombres
+        print(f'\n{cantidad} nombres más (autómata de {buscador.nodos} nodos, construido en {construccion:.2f} s):')
+        print(f'  original: {medir(lambda t: original(t, ciudades), CORPUS, repeticiones_grandes):8.2f} µs/pregunta')
+        print(f'  autómata: {medir(lambda t: nuevo(t, buscador), CORPUS, repeticiones_grandes):8.2f} µs/pregunta')
+
+
+if __name__ == '__main__':
+    main()
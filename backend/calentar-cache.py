@@ -0,0 +1,42 @@
+"""
+Calentador de la caché como proceso aparte (ver viajeia/calentador.py)
+
+Mantiene frescos clima, fotos y tipo de cambio de los destinos populares en
+la caché escalonada en disco que leen los workers (VIAJEIA_CACHE_DB). Si
+además hay workers con CALENTADOR=worker, el arriendo hace que solo uno de
+todos trabaje.
+
+Uso: python calentar-cache.py [--una]   (--una: una sola ronda, p. ej. desde cron)
+"""
+import argparse
+import logging
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+try:
+    from dotenv import load_dotenv
+    load_dotenv(dotenv_path=Path(__file__).parent / '.env')
+except ImportError:
+    pass
+
+from viajeia import calentador  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Calentador de la caché de destinos populares')
+    parser.add_argument('--una', action='store_true', help='hacer una sola ronda y salir')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+    populares = calentador.destinos_populares()
+    print(f"Destinos: {', '.join(destino.nombre for destino in populares)}")
+    if args.una:
+        print(f'Entradas renovadas: {calentador.ronda()}')
+        return
+    calentador.ejecutar()
+
+
+if __name__ == '__main__':
+    main()
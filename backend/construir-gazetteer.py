@@ -0,0 +1,118 @@
+"""
+Genera viajeia/datos/gazetteer.bin
+
+Fuentes, por prioridad cuando un alias se repite:
+  1. Destinos curados de viajeia/ciudades.py (CIUDADES)
+  2. Ciudades de un volcado de GeoNames (opcional, --geonames citiesNNNN.txt
+     de https://download.geonames.org/export/dump/), por población
+  3. Ciudades de referencia de la base tz (zone.tab del paquete tzdata o del
+     sistema), con los alias en español de ciudades.ALIAS_ZONAS
+
+Uso: python construir-gazetteer.py [--geonames cities15000.txt] [--salida ruta]
+"""
+import argparse
+import sys
+import zoneinfo
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from viajeia import gazetteer  # noqa: E402
+from viajeia.ciudades import ALIAS_ZONAS, MONEDA_POR_PAIS, normalizar  # noqa: E402
+
+# Regiones de zone.tab que no son destinos
+_REGIONES_EXCLUIDAS = ('Antarctica/', 'Etc/')
+# Nombres de zona que también son palabras comunes; esos destinos se alcanzan por sus alias en español
+_ALIAS_AMBIGUOS = {'oral', 'easter', 'canary', 'wake', 'midway'}
+
+
+def ruta_zone_tab():
+    """zone.tab del paquete tzdata si está instalado, si no el de TZPATH"""
+    try:
+        from importlib import resources
+        ruta = resources.files('tzdata').joinpath('zoneinfo', 'zone.tab')
+        if ruta.is_file():
+            return ruta
+    except ModuleNotFoundError:
+        pass
+    for directorio in zoneinfo.TZPATH:
+        ruta = Path(directorio) / 'zone.tab'
+        if ruta.is_file():
+            return ruta
+    raise SystemExit('No se encontró zone.tab: instala tzdata (pip install tzdata)')
+
+
+def coordenada(texto, grados):
+    """Grados decimales de una coordenada ISO 6709 (±DDMM, ±DDMMSS, ±DDDMM o ±DDDMMSS)"""
+    signo = -1 if texto[0] == '-' else 1
+    cifras = texto[1:]
+    valor = int(cifras[:grados]) + int(cifras[grados:grados + 2]) / 60
+    if len(cifras) > grados + 2:
+        valor += int(cifras[grados + 2:]) / 3600
+    return signo * valor
+
+
+def entradas_zone_tab(ruta):
+    entradas = []
+    for linea in ruta.read_text(encoding='utf-8').splitlines():
+        if not linea or linea.startswith('#'):
+            continue
+        pais, coordenadas, zona = linea.split('\t')[:3]
+        partes = zona.split('/')
+        if zona.startswith(_REGIONES_EXCLUIDAS):
+            continue
+        # Zonas de tres niveles (America/Indiana/Vevay...) son subdivisiones, salvo las capitales argentinas
+        if len(partes) > 2 and partes[1] != 'Argentina':
+            continue
+        corte = max(coordenadas.find('+', 1), coordenadas.find('-', 1))
+        latitud, longitud = coordenadas[:corte], coordenadas[corte:]
+        nombre = partes[-1].replace('_', ' ')
+        destino = gazetteer.Destino(
+            gazetteer.id_destino(pais, nombre), nombre, pais, zona, MONEDA_POR_PAIS.get(pais, ''),
+            round(coordenada(latitud, 2), 4), round(coordenada(longitud, 3), 4), False
+        )
+        alias = (nombre,) + ALIAS_ZONAS.get(zona, ())
+        entradas.append((destino, 0, tuple(a for a in alias if normalizar(a) not in _ALIAS_AMBIGUOS)))
+    return entradas
+
+
+def entradas_geonames(ruta):
+    """Ciudades de un volcado citiesNNNN.txt de GeoNames (columnas en el readme del volcado)"""
+    entradas = []
+    with open(ruta, encoding='utf-8') as archivo:
+        for linea in archivo:
+            campos = linea.rstrip('\n').split('\t')
+            if len(campos) < 18 or not campos[17]:
+                continue
+            nombre, ascii_nombre, alternativos = campos[1], campos[2], campos[3]
+            pais, poblacion, zona = campos[8], int(campos[14] or 0), campos[17]
+            alias = [nombre, ascii_nombre]
+            # Los alternativos incluyen códigos IATA y nombres en todos los idiomas; solo los alfabéticos
+            alias += [a for a in alternativos.split(',') if a and not a.isupper() and any(c.isalpha() for c in a)]
+            destino = gazetteer.Destino(
+                gazetteer.id_destino(pais, ascii_nombre or nombre), nombre, pais, zona,
+                MONEDA_POR_PAIS.get(pais, ''), float(campos[4]), float(campos[5]), False
+            )
+            entradas.append((destino, poblacion, tuple(alias)))
+    return entradas
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--geonames', help='volcado citiesNNNN.txt de GeoNames')
+    parser.add_argument('--salida', default=gazetteer.RUTA)
+    args = parser.parse_args()
+
+    entradas = gazetteer.entradas_curadas()
+    if args.geonames:
+        entradas += entradas_geonames(args.geonames)
+    entradas += entradas_zone_tab(ruta_zone_tab())
+
+    gazetteer.escribir(args.salida, entradas)
+    indice = gazetteer.Gazetteer.abrir(args.salida)
+    tamano = Path(args.salida).stat().st_size
+    print(f'{args.salida}: {len(indice)} destinos, {indice.n_alias} alias, {tamano / 1024:.1f} KiB')
+
+
+if __name__ == '__main__':
+    main()
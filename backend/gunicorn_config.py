@@ -1,6 +1,14 @@
 # Configuración de Gunicorn para producción
 import multiprocessing
 import os
+import shutil
+import tempfile
+
+# Métricas de Prometheus sumadas entre workers (viajeia/metricas.py): cada worker
+# escribe las suyas en este directorio. Debe definirse antes de cargar la app
+METRICAS_DIR = os.environ.setdefault(
+    'PROMETHEUS_MULTIPROC_DIR', os.path.join(tempfile.gettempdir(), 'viajeia-metricas')
+)
 
 # Número de workers (recomendado: 2-4 x número de CPUs)
 workers = int(os.getenv('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1))
@@ -26,3 +34,30 @@ preload_app = True
 max_requests = 1000
 max_requests_jitter = 50
 
+
+# Las métricas de una ejecución anterior no se suman a las de esta
+def on_starting(server):
+    shutil.rmtree(METRICAS_DIR, ignore_errors=True)
+    os.makedirs(METRICAS_DIR, exist_ok=True)
+
+
+# Imports pesados e índices de destinos en el maestro, antes de crear los workers
+def when_ready(server):
+    from viajeia import planificacion
+    planificacion.precalentar()
+
+
+# Los pools de conexiones HTTP se crean en cada worker (nunca compartir sockets tras el fork)
+def post_fork(server, worker):
+    from viajeia import http_cliente
+    http_cliente.reiniciar()
+    # Calentador de la caché (CALENTADOR=worker): un hilo por worker, trabaja solo el que tiene el arriendo
+    from viajeia import calentador
+    if calentador.MODO == 'worker':
+        calentador.iniciar()
+
+
+# Los medidores por worker (peticiones en curso, sesiones, caché) de un worker muerto se descartan
+def child_exit(server, worker):
+    from viajeia import metricas
+    metricas.proceso_terminado(worker.pid)
@@ -0,0 +1,26 @@
+"""
+Configuración común de las pruebas (python -m pytest desde backend/)
+
+Las variables se fijan antes de importar los módulos, que leen su
+configuración al importarse: sesiones en una SQLite temporal (el backend por
+defecto), sin caché ni límites en disco y sin APIs externas.
+"""
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+_TEMPORAL = tempfile.mkdtemp(prefix='viajeia-pruebas-')
+
+os.environ.update({
+    'GEMINI_API_KEY': 'prueba',
+    'SESIONES_BACKEND': 'sqlite',
+    'VIAJEIA_SESIONES_DB': str(Path(_TEMPORAL) / 'sesiones.sqlite3'),
+    'VIAJEIA_CACHE_DB': 'off',
+    'VIAJEIA_LIMITES_DB': 'off',
+    'WEATHERBIT_API_KEY': '',
+    'UNSPLASH_API_KEY': '',
+    'UNSPLASH_ACCESS_KEY': '',
+})
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
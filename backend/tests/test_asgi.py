@@ -0,0 +1,68 @@
+"""
+Pruebas del modo ASGI: lo que usa SQLite no bloquea el event loop
+(se saltan sin las dependencias de requirements-asgi.txt)
+"""
+import asyncio
+import time
+
+import pytest
+
+pytest.importorskip('quart')
+pytest.importorskip('httpx')
+
+from viajeia import asincrono, limite  # noqa: E402
+from viajeia.cache import FALTA  # noqa: E402
+
+
+class LimitadorLento(limite.LimitadorMemoria):
+    """Limitador que tarda como un UPSERT esperando el bloqueo de SQLite"""
+
+    def permitir(self, clave, max_requests=10, window=60, costo=1):
+        time.sleep(0.3)
+        return super().permitir(clave, max_requests, window, costo)
+
+
+def test_rate_limit_fuera_del_loop(monkeypatch):
+    import app as base
+    import asgi
+    monkeypatch.setattr(base, 'limitador', LimitadorLento())
+
+    async def escenario():
+        cliente = asgi.app.test_client()
+        inicio = time.monotonic()
+        respuestas = await asyncio.gather(*(cliente.get('/api/sesion/nadie/historial') for _ in range(4)))
+        return [r.status_code for r in respuestas], time.monotonic() - inicio
+
+    codigos, segundos = asyncio.run(escenario())
+    assert codigos == [200] * 4
+    # En el loop serían 4 x 0.3 s seguidos
+    assert segundos < 0.9
+
+
+def en_el_loop():
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
+
+def test_cache_fuera_del_loop(monkeypatch):
+    llamadas = []
+
+    def buscar(clave):
+        llamadas.append(('buscar', en_el_loop()))
+        return FALTA, False
+
+    def guardar(fuente, clave, valor):
+        llamadas.append(('guardar', en_el_loop()))
+
+    monkeypatch.setattr(asincrono.cache, 'buscar', buscar)
+    monkeypatch.setattr(asincrono.cache, 'guardar', guardar)
+
+    async def calcular(ciudad):
+        return {'ciudad': ciudad}
+
+    resultado = asyncio.run(asincrono.obtener_cacheado('clima', ('roma-asgi',), calcular))
+    assert resultado == {'ciudad': 'roma-asgi'}
+    assert llamadas == [('buscar', False), ('guardar', False)]
@@ -0,0 +1,93 @@
+"""
+Pruebas de la espera a una llamada en vuelo (viajeia.coalescencia) con el
+plazo de la petición que espera
+"""
+import asyncio
+import threading
+import time
+
+import pytest
+
+from viajeia import coalescencia, plazos
+
+
+def lider_en_vuelo(vuelos, clave, hasta, resultado=None, error=None):
+    """Hilo líder que termina su llamada cuando se activa `hasta`"""
+    vuelo, lider = vuelos.unirse(clave)
+    assert lider
+
+    def terminar():
+        hasta.wait(5)
+        vuelos.terminar(clave, vuelo, resultado, error)
+
+    hilo = threading.Thread(target=terminar)
+    hilo.start()
+    return hilo
+
+
+def test_la_espera_no_pasa_del_plazo():
+    vuelos = coalescencia.Coalescedor(espera=60)
+    hasta = threading.Event()
+    hilo = lider_en_vuelo(vuelos, 'k', hasta, 'del líder')
+    inicio = time.monotonic()
+    resultado = vuelos.ejecutar('k', lambda: 'propio', plazo_espera=plazos.Plazo(0.2))
+    assert resultado == 'propio'
+    assert time.monotonic() - inicio < 1
+    hasta.set()
+    hilo.join()
+    assert vuelos.estadisticas()['fuentes']['k']['esperas_agotadas'] == 1
+
+
+def test_sin_plazo_espera_al_lider():
+    vuelos = coalescencia.Coalescedor(espera=5)
+    hasta = threading.Event()
+    hilo = lider_en_vuelo(vuelos, 'k', hasta, 'del líder')
+    threading.Timer(0.1, hasta.set).start()
+    assert vuelos.ejecutar('k', lambda: 'propio') == 'del líder'
+    hilo.join()
+
+
+@pytest.mark.parametrize('error', [plazos.PlazoAgotado('Gemini'), Exception('504 Deadline Exceeded')])
+def test_plazo_agotado_del_lider_no_se_propaga(error):
+    vuelos = coalescencia.Coalescedor()
+    vuelo, _ = vuelos.unirse('k')
+    vuelos.terminar('k', vuelo, error=error)
+    assert vuelos.esperar('k', vuelo, plazos.Plazo(10)) is coalescencia.SIN_RESULTADO
+
+
+def test_otros_errores_del_lider_se_propagan():
+    vuelos = coalescencia.Coalescedor()
+    vuelo, _ = vuelos.unirse('k')
+    vuelos.terminar('k', vuelo, error=ValueError('roto'))
+    with pytest.raises(ValueError):
+        vuelos.esperar('k', vuelo, plazos.Plazo(10))
+
+
+def test_async_reintenta_con_su_plazo():
+    vuelos = coalescencia.Coalescedor(espera=60)
+
+    async def lider():
+        await asyncio.sleep(0.05)
+        raise plazos.PlazoAgotado('Gemini')
+
+    async def lento():
+        await asyncio.sleep(5)
+        return 'del líder'
+
+    async def propio():
+        return 'propio'
+
+    async def escenario(funcion_lider, plazo):
+        tarea = asyncio.ensure_future(vuelos.ejecutar_async('k', funcion_lider))
+        await asyncio.sleep(0)
+        inicio = time.monotonic()
+        resultado = await vuelos.ejecutar_async('k', propio, plazo_espera=plazo)
+        tarea.cancel()
+        await asyncio.gather(tarea, return_exceptions=True)
+        return resultado, time.monotonic() - inicio
+
+    # El líder se queda sin plazo: quien espera llama con el suyo
+    assert asyncio.run(escenario(lider, plazos.Plazo(10)))[0] == 'propio'
+    # El líder tarda más de lo que le queda a quien espera
+    resultado, segundos = asyncio.run(escenario(lento, plazos.Plazo(0.2)))
+    assert resultado == 'propio' and segundos < 1
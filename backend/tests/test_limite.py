@@ -0,0 +1,76 @@
+"""
+Pruebas del cubo de tokens (memoria y SQLite) y del límite del lote
+"""
+import pytest
+
+from viajeia import limite, planificacion
+
+
+@pytest.fixture(params=['memoria', 'sqlite'])
+def limitador(request, tmp_path):
+    if request.param == 'memoria':
+        return limite.LimitadorMemoria()
+    return limite.LimitadorSQLite(ruta_db=str(tmp_path / 'limites.sqlite3'))
+
+
+def test_un_token_por_peticion(limitador):
+    assert all(limitador.permitir('ip', 3, 60) for _ in range(3))
+    assert not limitador.permitir('ip', 3, 60)
+    assert limitador.permitir('otra', 3, 60)
+
+
+def test_costo_todo_o_nada(limitador):
+    assert limitador.permitir('ip', 10, 60, costo=4)
+    assert limitador.permitir('ip', 10, 60, costo=4)
+    # Quedan 2: el lote de 3 se rechaza sin gastarlos
+    assert not limitador.permitir('ip', 10, 60, costo=3)
+    assert limitador.permitir('ip', 10, 60, costo=2)
+    assert not limitador.permitir('ip', 10, 60)
+
+
+def test_costo_mayor_que_la_capacidad(limitador):
+    assert not limitador.permitir('ip', 3, 60, costo=4)
+    assert limitador.permitir('ip', 3, 60, costo=3)
+
+
+@pytest.fixture
+def cliente(monkeypatch):
+    """Cliente de prueba de Flask con un limitador propio y sin llamadas a Gemini"""
+    import app as aplicacion
+    monkeypatch.setattr(aplicacion, 'limitador', limite.LimitadorMemoria())
+    monkeypatch.setattr(
+        planificacion, 'generar_compartido', lambda clave, prompt, plazo=None, estructurado=False: 'ALOJAMIENTO:\n• a'
+    )
+    return aplicacion.app.test_client()
+
+
+def lote(*destinos, **extra):
+    return {'destinos': list(destinos), 'include': [], **extra}
+
+
+def test_lote_rechazado_no_gasta_tokens(cliente):
+    import app as aplicacion
+    for _ in range(4):
+        assert aplicacion.permitir_peticion('127.0.0.1')
+    # Quedan 6 tokens: 5 planes pasan, luego otros 5 no y no gastan el último
+    assert cliente.post('/api/planificar/batch', json=lote('Roma', 'París', 'Lisboa', 'Praga', 'Viena')).status_code == 200
+    assert cliente.post('/api/planificar/batch', json=lote('Roma', 'París', 'Lisboa', 'Praga', 'Viena')).status_code == 429
+    assert aplicacion.permitir_peticion('127.0.0.1')
+
+
+@pytest.mark.parametrize('session_id, codigo', [(None, 200), ('', 200), (42, 400)])
+def test_lote_session_id(cliente, session_id, codigo):
+    respuesta = cliente.post('/api/planificar/batch', json=lote('Roma', session_id=session_id))
+    assert respuesta.status_code == codigo
+    if codigo == 200:
+        assert not respuesta.get_json()['resultados'][0]['session_id'].startswith('127.0.0.1')
+
+
+def test_historial_no_gasta_tokens_de_planificacion(cliente):
+    import app as aplicacion
+    for _ in range(20):
+        assert cliente.get('/api/sesion/nadie/historial').status_code == 200
+    # El cubo de planificación sigue lleno y con su capacidad de 10
+    assert aplicacion.permitir_peticion('127.0.0.1', costo=10)
+    assert not aplicacion.permitir_peticion('127.0.0.1')
+    assert cliente.get('/api/sesion/nadie/historial').status_code == 200
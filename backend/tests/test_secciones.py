@@ -0,0 +1,108 @@
+"""
+Pruebas del itinerario con secciones ya separadas (salida estructurada y
+caché de itinerarios)
+"""
+import json
+import threading
+
+import pytest
+
+from viajeia import coalescencia, itinerarios, planificacion, secciones
+from viajeia.cache import CacheEscalonada
+
+SALIDA = {campo: [f'{campo} uno', f'{campo} dos'] for campo in secciones.CAMPOS.values()}
+
+PREGUNTA = (
+    'Quiero planear un viaje a Roma desde 2026-11-02 hasta 2026-11-06. '
+    'Mi presupuesto aproximado es moderado y prefiero cultura. ¿Puedes ayudarme a planificar este viaje?'
+)
+
+
+def test_separadas_como_leer_texto():
+    encontradas = secciones.leer_json(json.dumps(SALIDA))
+    itinerario = secciones.componer(encontradas, '')
+    assert itinerario['secciones'] == secciones.leer_texto(itinerario['texto'])
+
+
+def test_componer_sin_secciones_deja_la_salida():
+    assert secciones.componer({}, 'lo siento') == {'texto': 'lo siento', 'secciones': None}
+
+
+def test_leer_itinerario_de_texto_suelto():
+    texto, separadas = secciones.leer_itinerario('ALOJAMIENTO:\n• hotel')
+    assert texto == 'ALOJAMIENTO:\n• hotel'
+    assert separadas == [{'nombre': 'ALOJAMIENTO', 'contenido': '• hotel', 'items': ['hotel']}]
+
+
+@pytest.fixture
+def cliente(monkeypatch):
+    """Cliente de prueba de Flask con salida estructurada y Gemini simulado"""
+    import app as aplicacion
+    llamadas = []
+
+    def generar(prompt, plazo=None, configuracion=None):
+        llamadas.append(prompt)
+        return json.dumps(SALIDA)
+
+    monkeypatch.setattr(planificacion, 'SALIDA_ESTRUCTURADA', True)
+    monkeypatch.setattr(planificacion, 'generar', generar)
+    monkeypatch.setattr(itinerarios, 'cache_itinerarios', CacheEscalonada(max_entradas=8))
+    cliente = aplicacion.app.test_client()
+    cliente.llamadas = llamadas
+    return cliente
+
+
+def test_acierto_de_cache_no_vuelve_a_partir_el_texto(cliente, monkeypatch):
+    cuerpo = {'pregunta': PREGUNTA, 'include': []}
+    primera = cliente.post('/api/planificar', json=dict(cuerpo, session_id='secciones-1')).get_json()
+    assert primera['cache_itinerario'] is False
+    assert [s['nombre'] for s in primera['secciones']] == list(secciones.SECCIONES)
+
+    def sin_partir(texto):
+        raise AssertionError('leer_texto en un acierto de caché')
+
+    monkeypatch.setattr(secciones, 'leer_texto', sin_partir)
+    segunda = cliente.post('/api/planificar', json=dict(cuerpo, session_id='secciones-2')).get_json()
+    assert segunda['cache_itinerario'] is True
+    assert segunda['secciones'] == primera['secciones']
+    assert segunda['respuesta'] == primera['respuesta']
+    assert len(cliente.llamadas) == 1
+
+
+def eventos_sse(cuerpo):
+    """Lista de (evento, datos) de una respuesta Server-Sent Events"""
+    eventos = []
+    for bloque in cuerpo.strip().split('\n\n'):
+        lineas = dict(linea.split(': ', 1) for linea in bloque.split('\n'))
+        eventos.append((lineas['event'], json.loads(lineas['data'])))
+    return eventos
+
+
+def test_stream_que_espera_a_una_generacion_estructurada(cliente, monkeypatch):
+    # El líder (sin streaming, salida estructurada) publica un itinerario; el stream lo espera
+    dentro = threading.Event()
+    seguir = threading.Event()
+
+    def generar(prompt, plazo=None, configuracion=None):
+        dentro.set()
+        seguir.wait(5)
+        return json.dumps(SALIDA)
+
+    monkeypatch.setattr(planificacion, 'generar', generar)
+    coalescidas = coalescencia.vuelos.estadisticas()['fuentes'].get('itinerario', {}).get('coalescidas', 0)
+    respuestas = {}
+    lider = threading.Thread(target=lambda: respuestas.update(json=cliente.post(
+        '/api/planificar', json={'pregunta': PREGUNTA, 'include': [], 'session_id': 'lider'}
+    ).get_json()))
+    lider.start()
+    assert dentro.wait(5)
+    threading.Timer(0.3, seguir.set).start()
+    stream = cliente.post('/api/planificar/stream', json={'pregunta': PREGUNTA, 'include': [], 'session_id': 'stream'})
+    eventos = eventos_sse(stream.get_data(as_text=True))
+    lider.join()
+
+    assert coalescencia.vuelos.estadisticas()['fuentes']['itinerario']['coalescidas'] == coalescidas + 1
+    nombres = [evento for evento, _ in eventos]
+    assert 'error' not in nombres and nombres[-1] == 'fin'
+    assert [datos['texto'] for evento, datos in eventos if evento == 'delta'] == [respuestas['json']['respuesta']]
+    assert [datos for evento, datos in eventos if evento == 'section'] == respuestas['json']['secciones']
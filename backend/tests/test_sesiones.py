@@ -0,0 +1,293 @@
+"""
+Pruebas de los almacenes de sesiones (memoria, SQLite y Redis con un cliente
+en memoria) y del session_id que reciben los endpoints
+"""
+import time
+
+import pytest
+
+from viajeia import limite, planificacion, sesiones
+
+
+class RedisFalso:
+    """Cliente en memoria con los comandos de Redis que usa AlmacenRedis"""
+
+    def __init__(self):
+        self.datos = {}
+        self.expira = {}
+
+    def _vigente(self, clave):
+        if clave in self.expira and self.expira[clave] <= time.time():
+            self.datos.pop(clave, None)
+            self.expira.pop(clave, None)
+        return self.datos.get(clave)
+
+    def _bytes(self, valor):
+        return valor if isinstance(valor, bytes) else str(valor).encode('utf-8')
+
+    def pipeline(self, transaction=True):
+        return _Pipeline(self)
+
+    def get(self, clave):
+        valor = self._vigente(clave)
+        return None if isinstance(valor, list) else valor
+
+    def set(self, clave, valor, ex=None):
+        self.datos[clave] = self._bytes(valor)
+        self.expira.pop(clave, None)
+        if ex:
+            self.expire(clave, ex)
+        return True
+
+    def incr(self, clave):
+        valor = int(self._vigente(clave) or 0) + 1
+        self.datos[clave] = self._bytes(valor)
+        return valor
+
+    def expire(self, clave, segundos):
+        if self._vigente(clave) is None:
+            return False
+        self.expira[clave] = time.time() + segundos
+        return True
+
+    def ttl(self, clave):
+        if self._vigente(clave) is None:
+            return -2
+        if clave not in self.expira:
+            return -1
+        return int(self.expira[clave] - time.time())
+
+    def rpush(self, clave, valor):
+        lista = self._vigente(clave)
+        if lista is None:
+            lista = self.datos[clave] = []
+        lista.append(self._bytes(valor))
+        return len(lista)
+
+    def ltrim(self, clave, inicio, fin):
+        lista = self._vigente(clave) or []
+        fin = len(lista) if fin == -1 else fin + 1
+        self.datos[clave] = lista[inicio:fin] if inicio >= 0 else lista[max(len(lista) + inicio, 0):fin]
+        return True
+
+    def lrange(self, clave, inicio, fin):
+        lista = self._vigente(clave) or []
+        return list(lista[inicio:] if fin == -1 else lista[inicio:fin + 1])
+
+    def delete(self, *claves):
+        borradas = 0
+        for clave in claves:
+            borradas += self.datos.pop(clave, None) is not None
+            self.expira.pop(clave, None)
+        return borradas
+
+
+class _Pipeline:
+    """Acumula los comandos y los ejecuta en orden (sin concurrencia, basta como transacción)"""
+
+    def __init__(self, cliente):
+        self._cliente = cliente
+        self._comandos = []
+
+    def __getattr__(self, nombre):
+        def encolar(*args, **kwargs):
+            self._comandos.append((getattr(self._cliente, nombre), args, kwargs))
+            return self
+        return encolar
+
+    def execute(self):
+        return [funcion(*args, **kwargs) for funcion, args, kwargs in self._comandos]
+
+
+@pytest.fixture(params=['memoria', 'sqlite', 'redis'])
+def almacen(request, tmp_path):
+    if request.param == 'memoria':
+        return sesiones.AlmacenMemoria(max_turnos=3)
+    if request.param == 'sqlite':
+        return sesiones.AlmacenSQLite(ruta_db=str(tmp_path / 'sesiones.sqlite3'), max_turnos=3)
+    return sesiones.AlmacenRedis(max_turnos=3, cliente=RedisFalso())
+
+
+def test_sesion_nueva_vacia(almacen):
+    assert almacen.cargar('nadie') == ([], None)
+    assert almacen.turnos_desde('nadie') == (0, [])
+    assert almacen.cargar_resumen('nadie') is None
+
+
+def test_agregar_y_cargar(almacen):
+    assert almacen.agregar_turno('s', 'hola', 'respuesta', destino='Roma') == 1
+    assert almacen.agregar_turno('s', '¿y el metro?', 'otra') == 2
+    historial, destino = almacen.cargar('s')
+    assert historial == [('hola', 'respuesta'), ('¿y el metro?', 'otra')]
+    # Un turno sin destino no borra el de la sesión
+    assert destino == 'Roma'
+
+
+def test_ventana_de_turnos_y_cursor(almacen):
+    for i in range(1, 6):
+        assert almacen.agregar_turno('s', f'p{i}', f'r{i}') == i
+    historial, _ = almacen.cargar('s')
+    assert [pregunta for pregunta, _ in historial] == ['p3', 'p4', 'p5']
+    assert almacen.turnos_desde('s', 0) == (5, [(3, 'p3', 'r3'), (4, 'p4', 'r4'), (5, 'p5', 'r5')])
+    assert almacen.turnos_desde('s', 4) == (5, [(5, 'p5', 'r5')])
+    assert almacen.turnos_desde('s', 5) == (5, [])
+
+
+def test_respuesta_compacta_y_texto_completo(almacen):
+    larga = 'x' * (sesiones.LARGO_RESUMEN + 50)
+    almacen.agregar_turno('s', 'p', larga)
+    historial, _ = almacen.cargar('s')
+    assert historial[0][1] == larga[:sesiones.LARGO_RESUMEN]
+    esperado = larga if sesiones.TEXTO_COMPLETO else larga[:sesiones.LARGO_RESUMEN]
+    assert almacen.turnos_completos('s') == [('p', esperado)]
+
+
+def test_resumen_y_borrar(almacen):
+    # Sin sesión el resumen no se guarda
+    almacen.guardar_resumen('s', {'temas': ['a']})
+    assert almacen.cargar_resumen('s') is None
+    almacen.agregar_turno('s', 'p', 'r')
+    almacen.guardar_resumen('s', {'temas': ['a']})
+    assert almacen.cargar_resumen('s') == {'temas': ['a']}
+    almacen.borrar('s')
+    assert almacen.cargar('s') == ([], None)
+    assert almacen.cargar_resumen('s') is None
+
+
+def test_sesiones_caducan(almacen):
+    almacen.ttl = 1
+    almacen.agregar_turno('s', 'p', 'r')
+    time.sleep(1.1)
+    assert almacen.cargar('s') == ([], None)
+    # Empieza de cero
+    assert almacen.agregar_turno('s', 'p', 'r') == 1
+
+
+def test_memoria_desaloja_las_menos_usadas():
+    almacen = sesiones.AlmacenMemoria(max_turnos=3, max_sesiones=2)
+    almacen.agregar_turno('a', 'p', 'r')
+    almacen.agregar_turno('b', 'p', 'r')
+    almacen.cargar('a')
+    almacen.agregar_turno('c', 'p', 'r')
+    assert almacen.cargar('b') == ([], None)
+    assert almacen.cargar('a')[0] == [('p', 'r')]
+    assert almacen.estadisticas()['desalojos'] == 1
+
+
+def test_sqlite_desaloja_las_menos_usadas(tmp_path):
+    almacen = sesiones.AlmacenSQLite(ruta_db=str(tmp_path / 'topes.sqlite3'), max_sesiones=2, purga_cada=1)
+    almacen.agregar_turno('a', 'p', 'r')
+    time.sleep(0.01)
+    almacen.agregar_turno('b', 'p', 'r')
+    time.sleep(0.01)
+    almacen.agregar_turno('c', 'p', 'r')
+    assert almacen.cargar('a') == ([], None)
+    assert almacen.cargar('c')[0] == [('p', 'r')]
+    datos = almacen.estadisticas()
+    assert datos['sesiones'] == 2 and datos['desalojos'] == 1
+
+
+def test_sqlite_tope_de_bytes(tmp_path):
+    almacen = sesiones.AlmacenSQLite(ruta_db=str(tmp_path / 'bytes.sqlite3'), max_bytes=150, purga_cada=1)
+    for session_id in ('a', 'b', 'c'):
+        almacen.agregar_turno(session_id, 'p' * 10, 'r' * 50)
+        time.sleep(0.01)
+    datos = almacen.estadisticas()
+    assert datos['bytes'] <= 150
+    assert almacen.cargar('c')[0] and almacen.cargar('a') == ([], None)
+
+
+def bytes_recorriendo_la_base(almacen):
+    conexion = almacen._conexion()
+    return conexion.execute(
+        'SELECT COALESCE(SUM(LENGTH(CAST(resumen AS BLOB))), 0) FROM sesiones'
+    ).fetchone()[0] + conexion.execute(
+        f'SELECT COALESCE(SUM({sesiones._BYTES_TURNO_SQL}), 0) FROM turnos'
+    ).fetchone()[0]
+
+
+def test_sqlite_lleva_los_bytes_en_cada_escritura(tmp_path):
+    almacen = sesiones.AlmacenSQLite(ruta_db=str(tmp_path / 'cuentas.sqlite3'), max_turnos=2)
+    for i in range(5):
+        almacen.agregar_turno('a', f'pregunta {i} ñ', 'respuesta ' * (i * 40))
+    almacen.agregar_turno('b', 'p', 'r')
+    almacen.guardar_resumen('a', {'temas': ['playa', 'museos']})
+    almacen.guardar_resumen('a', {'temas': ['playa']})
+    datos = almacen.estadisticas()
+    assert datos['sesiones'] == 2
+    assert datos['bytes'] == bytes_recorriendo_la_base(almacen)
+    almacen.borrar('a')
+    assert almacen.estadisticas()['bytes'] == bytes_recorriendo_la_base(almacen) > 0
+
+
+def test_sqlite_base_anterior_a_los_topes(tmp_path):
+    import sqlite3
+    ruta = str(tmp_path / 'vieja.sqlite3')
+    conexion = sqlite3.connect(ruta)
+    conexion.execute(
+        'CREATE TABLE sesiones (session_id TEXT PRIMARY KEY, destino TEXT, ultimo INTEGER NOT NULL, '
+        'expira REAL NOT NULL, resumen TEXT)'
+    )
+    conexion.execute(
+        'CREATE TABLE turnos (session_id TEXT NOT NULL, seq INTEGER NOT NULL, pregunta TEXT NOT NULL, '
+        'respuesta TEXT NOT NULL, completo BLOB, PRIMARY KEY (session_id, seq)) WITHOUT ROWID'
+    )
+    conexion.execute("INSERT INTO sesiones VALUES ('a', NULL, 1, ?, '{}')", (time.time() + 60,))
+    conexion.execute("INSERT INTO turnos VALUES ('a', 1, 'hola', 'adiós', NULL)")
+    conexion.commit()
+    conexion.close()
+    almacen = sesiones.AlmacenSQLite(ruta_db=ruta)
+    assert almacen.estadisticas()['sesiones'] == 1
+    assert almacen.estadisticas()['bytes'] == bytes_recorriendo_la_base(almacen) == 2 + 4 + 6
+
+
+def test_leer_session_id():
+    assert planificacion.leer_session_id('abc') == ('abc', None)
+
+
+@pytest.mark.parametrize('valor', [None, '', '   '])
+def test_leer_session_id_vacio_genera_uno(valor):
+    session_id, error = planificacion.leer_session_id(valor)
+    assert error is None and len(session_id) == 32
+    assert planificacion.leer_session_id(valor)[0] != session_id
+
+
+@pytest.mark.parametrize('valor', [123, 0, False, ['a'], {'id': 'a'}, 'x' * 500])
+def test_leer_session_id_invalido(valor):
+    session_id, error = planificacion.leer_session_id(valor)
+    assert session_id is None and error
+
+
+@pytest.fixture
+def cliente(monkeypatch):
+    """Cliente de prueba de Flask con un limitador propio y sin llamadas a Gemini"""
+    import app as aplicacion
+    monkeypatch.setattr(aplicacion, 'limitador', limite.LimitadorMemoria())
+    monkeypatch.setattr(
+        planificacion, 'generar_compartido', lambda clave, prompt, plazo=None, estructurado=False: 'ALOJAMIENTO:\n• a'
+    )
+    return aplicacion.app.test_client()
+
+
+@pytest.mark.parametrize('cuerpo', [
+    {'pregunta': 'Quiero ir a Roma', 'session_id': None, 'include': []},
+    {'pregunta': 'Quiero ir a Roma', 'session_id': '', 'include': []},
+    {'pregunta': 'Quiero ir a Roma', 'include': []},
+])
+def test_planificar_sin_session_id(cliente, cuerpo):
+    # Con SQLite (el backend por defecto) un session_id null fallaba al guardar el turno
+    assert isinstance(planificacion.almacen_sesiones, sesiones.AlmacenSQLite)
+    respuesta = cliente.post('/api/planificar', json=cuerpo)
+    assert respuesta.status_code == 200
+    datos = respuesta.get_json()
+    # Sesión nueva con un id aleatorio, nunca la IP del cliente
+    assert datos['session_id'] != '127.0.0.1' and len(datos['session_id']) == 32
+    assert datos['cursor'] == 1
+    otra = cliente.post('/api/planificar', json=cuerpo).get_json()
+    assert otra['session_id'] != datos['session_id'] and otra['cursor'] == 1
+
+
+def test_planificar_session_id_no_texto(cliente):
+    respuesta = cliente.post('/api/planificar', json={'pregunta': 'Quiero ir a Roma', 'session_id': 42})
+    assert respuesta.status_code == 400
+    assert 'session_id' in respuesta.get_json()['error']
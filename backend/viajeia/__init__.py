@@ -0,0 +1,4 @@
+"""
+Núcleo compartido de ViajeIA: utilidades usadas tanto por el backend Flask
+(backend/app.py) como por la función serverless de Vercel (api/planificar.py)
+"""
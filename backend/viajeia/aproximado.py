@@ -0,0 +1,198 @@
+"""
+Resolución aproximada de destinos mal escritos ("Barselona", "Buenos Aries")
+
+Se usa después de la búsqueda exacta, solo con nombres que el gazetteer no
+reconoce. Índice de borrados simétricos (estilo SymSpell) sobre los alias
+normalizados: cada alias se indexa por las variantes de su prefijo con hasta
+MAX_DISTANCIA caracteres borrados, y una consulta genera las mismas variantes
+de su prefijo, así que los candidatos salen de unas pocas búsquedas en un
+diccionario y solo esos se comparan con distancia de edición. Una consulta
+tarda bastante menos de un milisegundo aunque el gazetteer tenga miles de
+nombres.
+
+El índice se construye en la primera consulta, no al importar.
+"""
+import logging
+import os
+import threading
+from collections import namedtuple
+
+from viajeia import destinos
+from viajeia.ciudades import normalizar
+from viajeia.gazetteer import gazetteer
+
+logger = logging.getLogger(__name__)
+
+MAX_DISTANCIA = 2
+# Solo se indexan los borrados de los primeros caracteres (acota la memoria con alias largos)
+LARGO_PREFIJO = 7
+# Por debajo de esta confianza la corrección no se aplica, solo se informa
+UMBRAL = float(os.getenv('DESTINO_UMBRAL_CONFIANZA', '0.8'))
+
+Sugerencia = namedtuple('Sugerencia', 'destino alias distancia confianza')
+
+
+def distancia(a, b, maximo=MAX_DISTANCIA):
+    """Distancia de Damerau-Levenshtein (transposiciones adyacentes); maximo + 1 si la supera"""
+    if abs(len(a) - len(b)) > maximo:
+        return maximo + 1
+    anterior2 = None
+    anterior = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        actual = [i] + [0] * len(b)
+        minimo_fila = i
+        for j in range(1, len(b) + 1):
+            coste = 0 if a[i - 1] == b[j - 1] else 1
+            valor = min(anterior[j] + 1, actual[j - 1] + 1, anterior[j - 1] + coste)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                valor = min(valor, anterior2[j - 2] + 1)
+            actual[j] = valor
+            minimo_fila = min(minimo_fila, valor)
+        if minimo_fila > maximo:
+            return maximo + 1
+        anterior2, anterior = anterior, actual
+    return anterior[-1]
+
+
+def borrados(palabra, maximo=MAX_DISTANCIA):
+    """La palabra y todas sus variantes con hasta `maximo` caracteres borrados"""
+    variantes = {palabra}
+    frontera = {palabra}
+    for _ in range(maximo):
+        siguiente = set()
+        for variante in frontera:
+            if len(variante) <= 1:
+                continue
+            for i in range(len(variante)):
+                siguiente.add(variante[:i] + variante[i + 1:])
+        siguiente -= variantes
+        variantes |= siguiente
+        frontera = siguiente
+    return variantes
+
+
+def max_distancia(texto):
+    """Nombres cortos admiten menos errores: "lima" a distancia 2 es casi cualquier cosa"""
+    return 1 if len(texto) <= 5 else MAX_DISTANCIA
+
+
+class IndiceAproximado:
+    """Borrados simétricos sobre alias -> valor"""
+
+    def __init__(self, patrones):
+        self._alias = []
+        self._valores = []
+        self._borrados = {}
+        for alias, valor in patrones:
+            posicion = len(self._alias)
+            self._alias.append(alias)
+            self._valores.append(valor)
+            for variante in borrados(alias[:LARGO_PREFIJO]):
+                self._borrados.setdefault(variante, []).append(posicion)
+
+    def __len__(self):
+        return len(self._borrados)
+
+    def buscar(self, texto):
+        """
+        Candidatos más cercanos a un texto ya normalizado
+        Retorna (distancia, [(alias, valor)]) o None si no hay ninguno a distancia admitida
+        """
+        maximo = max_distancia(texto)
+        vistos = set()
+        mejor = maximo + 1
+        candidatos = []
+        for variante in borrados(texto[:LARGO_PREFIJO], maximo):
+            for posicion in self._borrados.get(variante, ()):
+                if posicion in vistos:
+                    continue
+                vistos.add(posicion)
+                alias = self._alias[posicion]
+                d = distancia(texto, alias, min(maximo, mejor))
+                if d < mejor:
+                    mejor = d
+                    candidatos = [(alias, self._valores[posicion])]
+                elif d == mejor:
+                    candidatos.append((alias, self._valores[posicion]))
+        if mejor > maximo:
+            return None
+        return mejor, candidatos
+
+
+def confianza(texto, alias, distancia_edicion, destinos_empatados):
+    """
+    0..1: proporción de caracteres correctos, a la mitad si varios destinos
+    distintos quedan a la misma distancia (no hay forma de elegir)
+    """
+    valor = 1 - distancia_edicion / max(len(texto), len(alias))
+    if destinos_empatados > 1:
+        valor /= 2
+    return valor
+
+
+_indice = None
+_indice_lock = threading.Lock()
+
+
+def _obtener_indice():
+    global _indice
+    if _indice is None:
+        with _indice_lock:
+            if _indice is None:
+                _indice = IndiceAproximado(gazetteer.alias())
+    return _indice
+
+
+def sugerir(nombre):
+    """
+    Destino más parecido a un nombre que no está en el gazetteer
+    Retorna una Sugerencia (con confianza 0..1) o None si nada se parece lo suficiente.
+    Con varias palabras prueba el nombre completo y luego sin las últimas ("Barselona Espana")
+    """
+    palabras = normalizar(nombre or '').split()
+    indice = _obtener_indice()
+    for largo in range(len(palabras), 0, -1):
+        texto = ' '.join(palabras[:largo])
+        if len(texto) < 4:
+            break
+        encontrado = indice.buscar(texto)
+        if not encontrado:
+            continue
+        distancia_edicion, candidatos = encontrado
+        alias, posicion = candidatos[0]
+        empatados = len({valor for _, valor in candidatos})
+        return Sugerencia(
+            gazetteer.destino(posicion), alias, distancia_edicion,
+            confianza(texto, alias, distancia_edicion, empatados)
+        )
+    return None
+
+
+def corregir(encontrados):
+    """
+    Aplica la resolución aproximada al destino principal de extraer_destinos()
+    si el gazetteer no lo reconoce. Retorna (destinos, correccion): con confianza
+    alta el nombre se sustituye por el canónico; con confianza baja solo se
+    informa (correccion['aplicada'] es False) y el destino queda como estaba
+    """
+    if not encontrados:
+        return encontrados, None
+    if destinos.resolver(encontrados[0]):
+        return encontrados, None
+    sugerencia = sugerir(encontrados[0])
+    if not sugerencia:
+        return encontrados, None
+
+    aplicada = sugerencia.confianza >= UMBRAL
+    correccion = {
+        'escrito': encontrados[0],
+        'destino': sugerencia.destino.nombre,
+        'destino_id': sugerencia.destino.id,
+        'confianza': round(sugerencia.confianza, 2),
+        'aplicada': aplicada
+    }
+    if aplicada:
+        logger.info(f"Destino corregido: {encontrados[0]} -> {sugerencia.destino.nombre} ({correccion['confianza']})")
+        return [sugerencia.destino.nombre] + encontrados[1:], correccion
+    logger.info(f"Destino dudoso: {encontrados[0]} ~ {sugerencia.destino.nombre} ({correccion['confianza']}), sin corregir")
+    return encontrados, correccion
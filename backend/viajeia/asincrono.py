@@ -0,0 +1,189 @@
+"""
+Enriquecimiento para el modo asíncrono (ASGI, ver asgi.py)
+
+Las mismas consultas que el modo WSGI pero con un cliente httpx.AsyncClient
+por event loop: las peticiones a Weatherbit, Unsplash y exchangerate-api no
+ocupan un hilo mientras esperan. Se usan las mismas claves de la caché
+escalonada que cacheado(), así que ambos modos comparten las entradas en
+disco, y los refrescos stale se lanzan como tareas del loop en vez de en el
+pool de hilos. Las lecturas y escrituras de la caché pueden tocar su SQLite
+(con espera por bloqueo), así que van a un hilo con asyncio.to_thread y no
+frenan el loop. Requiere las dependencias de requirements-asgi.txt.
+"""
+import asyncio
+import logging
+
+import httpx
+
+from viajeia import circuitos, coalescencia, divisas, fotos
+from viajeia.cache import FALTA, es_fallo, cache, clave_cache
+from viajeia.http_cliente import BACKOFF, POOL_ESPERA, POOL_HOSTS, POOL_TAMANO, REINTENTOS, TIMEOUT
+
+logger = logging.getLogger(__name__)
+
+_REINTENTAR = (429, 500, 502, 503, 504)
+
+_cliente = None
+_cliente_loop = None
+# Referencias a las tareas de refresco para que el recolector no las cancele
+_tareas = set()
+_refrescando = set()
+
+
+def obtener_cliente():
+    """
+    Retorna el cliente HTTP asíncrono del event loop actual
+    Se crea de forma perezosa: cada worker de uvicorn tiene su propio loop
+    """
+    global _cliente, _cliente_loop
+    loop = asyncio.get_running_loop()
+    if _cliente is None or _cliente_loop is not loop:
+        _cliente = httpx.AsyncClient(
+            timeout=httpx.Timeout(TIMEOUT, pool=POOL_ESPERA),
+            limits=httpx.Limits(
+                max_connections=POOL_TAMANO * POOL_HOSTS,
+                max_keepalive_connections=POOL_TAMANO * POOL_HOSTS,
+            ),
+        )
+        _cliente_loop = loop
+    return _cliente
+
+
+async def cerrar():
+    """Cierra el cliente del loop actual (al apagar el servidor)"""
+    global _cliente, _cliente_loop
+    if _cliente is not None:
+        await _cliente.aclose()
+    _cliente = _cliente_loop = None
+
+
+async def get(url, timeout=TIMEOUT, **kwargs):
+    """
+    GET con los mismos reintentos que http_cliente (backoff exponencial ante 429 y 5xx)
+    y el mismo cortacircuitos por servicio
+    """
+    circuito = circuitos.por_url(url)
+    if circuito is None:
+        return await _get(url, timeout, **kwargs)
+    circuito.permitir()
+    try:
+        response = await _get(url, timeout, **kwargs)
+    except Exception as e:
+        circuito.fallo(e)
+        raise
+    return circuito.respuesta(response)
+
+
+async def _get(url, timeout, **kwargs):
+    cliente = obtener_cliente()
+    intento = 0
+    while True:
+        try:
+            response = await cliente.get(url, timeout=timeout, **kwargs)
+        except httpx.TransportError:
+            if intento >= REINTENTOS:
+                raise
+        else:
+            if response.status_code not in _REINTENTAR or intento >= REINTENTOS:
+                return response
+        await asyncio.sleep(BACKOFF * (2 ** intento))
+        intento += 1
+
+
+def _lanzar(corrutina):
+    tarea = asyncio.create_task(corrutina)
+    _tareas.add(tarea)
+    tarea.add_done_callback(_tareas.discard)
+    return tarea
+
+
+async def obtener_cacheado(fuente, args, funcion):
+    """
+    Versión asíncrona de cacheado(): retorna el valor cacheado bajo la misma
+    clave que usa el modo WSGI o lo calcula con `await funcion(*args)`
+    """
+    clave = clave_cache(fuente, args, {})
+    valor, vencida = await asyncio.to_thread(cache.buscar, clave)
+    if valor is FALTA:
+        # Misma clave en vuelo en este loop: se espera esa llamada en vez de repetirla
+        return await coalescencia.vuelos.ejecutar_async(clave, _calcular, fuente, clave, funcion, args)
+    if vencida and clave not in _refrescando:
+        _refrescando.add(clave)
+        _lanzar(_refrescar(fuente, clave, funcion, args))
+    return valor
+
+
+async def _calcular(fuente, clave, funcion, args):
+    valor = await funcion(*args)
+    await asyncio.to_thread(cache.guardar, fuente, clave, valor)
+    return valor
+
+
+async def _refrescar(fuente, clave, funcion, args):
+    try:
+        valor = await funcion(*args)
+        # Un fallo durante el refresco no pisa el último valor bueno
+        if not es_fallo(valor):
+            await asyncio.to_thread(cache.guardar, fuente, clave, valor)
+    except Exception as e:
+        logger.error(f"Error refrescando caché '{clave}': {str(e)}")
+    finally:
+        _refrescando.discard(clave)
+
+
+# --- Fotos ---------------------------------------------------------------
+
+async def _descargar_pool(destino):
+    peticion = fotos.peticion_busqueda(destino)
+    if not peticion:
+        return []
+    try:
+        headers, params = peticion
+        response = await get(fotos.URL_BUSQUEDA, headers=headers, params=params)
+        return fotos.procesar_busqueda(response, destino)
+    except circuitos.CircuitoAbierto:
+        raise
+    except Exception as e:
+        logger.error(f"Error obteniendo fotos de Unsplash: {str(e)}")
+    return []
+
+
+async def seleccionar_fotos(destino, cantidad=3):
+    """Equivalente asíncrono de fotos.seleccionar"""
+    clave = fotos.clave_pool(destino)
+    pool = await obtener_cacheado('fotos', (clave,), _descargar_pool)
+    return fotos.rotar(clave, pool, destino, cantidad)
+
+
+# --- Tipo de cambio ------------------------------------------------------
+
+async def _descargar_tasas():
+    try:
+        return divisas.procesar_tasas(await get(divisas.URL_TASAS))
+    except circuitos.CircuitoAbierto:
+        raise
+    except Exception as e:
+        logger.error(f"Error descargando tipos de cambio: {str(e)}")
+    return None
+
+
+async def _cargar_tasas():
+    return divisas.publicar(await obtener_cacheado('tipo_cambio', (), _descargar_tasas))
+
+
+async def tipo_cambio(base='USD', destino='EUR'):
+    """Equivalente asíncrono de divisas.tipo_cambio (publica la tabla para ambos modos)"""
+    tabla, vieja = divisas.tabla_vigente()
+    if tabla is None:
+        tabla = await _cargar_tasas()
+    elif vieja and 'tabla_tasas' not in _refrescando:
+        _refrescando.add('tabla_tasas')
+        _lanzar(_refrescar_tabla())
+    return divisas.formatear(tabla, base, destino)
+
+
+async def _refrescar_tabla():
+    try:
+        await _cargar_tasas()
+    finally:
+        _refrescando.discard('tabla_tasas')
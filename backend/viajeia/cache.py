@@ -0,0 +1,323 @@
+"""
+Caché escalonada para las consultas de enriquecimiento
+
+Un LRU en memoria delante de una tabla SQLite en disco (compartida por los
+workers de la misma máquina), con TTL por fuente. Las entradas vencidas se
+siguen sirviendo durante una ventana "stale" mientras se refrescan en segundo
+plano, y los fallos (None o lista vacía) se guardan un rato corto para no
+volver a consultar en cada petición un destino sin datos. Un fallo de caché
+pasa por viajeia.coalescencia: si la misma clave ya se está calculando, la
+petición espera ese resultado en vez de repetir la llamada.
+"""
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from pathlib import Path
+
+from viajeia import coalescencia
+from viajeia.enriquecimiento import obtener_executor
+
+logger = logging.getLogger(__name__)
+
+
+def _ttl(fuente, fresco, stale, negativo):
+    """TTL de una fuente en segundos, configurable con CACHE_TTL_<FUENTE>"""
+    prefijo = f'CACHE_TTL_{fuente.upper()}'
+    return (
+        float(os.getenv(prefijo, fresco)),
+        float(os.getenv(f'{prefijo}_STALE', stale)),
+        float(os.getenv(f'{prefijo}_NEGATIVO', negativo)),
+    )
+
+
+# fuente: (segundos fresco, segundos extra sirviendo stale, segundos para fallos)
+TTL_FUENTES = {
+    'clima': _ttl('clima', 10 * 60, 60 * 60, 60),
+    'fotos': _ttl('fotos', 3 * 24 * 3600, 7 * 24 * 3600, 30 * 60),
+    'tipo_cambio': _ttl('tipo_cambio', 12 * 3600, 24 * 3600, 5 * 60),
+}
+TTL_POR_DEFECTO = (10 * 60, 60 * 60, 60)
+
+
+def registrar_fuente(fuente, fresco, stale, negativo):
+    """Registra los TTL de una fuente nueva (respetando CACHE_TTL_<FUENTE>)"""
+    TTL_FUENTES[fuente] = _ttl(fuente, fresco, stale, negativo)
+
+MAX_ENTRADAS = int(os.getenv('CACHE_MAX_ENTRADAS', '2048'))
+# Cada cuántas escrituras se borran del disco las entradas ya caducadas
+PURGA_CADA = 256
+RUTA_DB = os.getenv('VIAJEIA_CACHE_DB', str(Path(tempfile.gettempdir()) / 'viajeia_cache.sqlite3'))
+
+# Marca de "sin entrada" que retorna buscar() (None es un valor cacheable)
+FALTA = object()
+
+
+def es_fallo(valor):
+    """Los fallos (None, lista, diccionario o texto vacío) se guardan con el TTL negativo"""
+    return valor is None or valor == [] or valor == {} or (isinstance(valor, str) and not valor.strip())
+
+
+class CacheEscalonada:
+    """LRU en memoria + SQLite en disco con stale-while-revalidate"""
+
+    def __init__(self, ruta_db=RUTA_DB, max_entradas=MAX_ENTRADAS):
+        self.ruta_db = ruta_db
+        self.max_entradas = max_entradas
+        self._memoria = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._refrescando = set()
+        self._escrituras = 0
+        self._arriendos = None
+        if coalescencia.ENTRE_WORKERS and ruta_db and ruta_db != 'off':
+            self._arriendos = coalescencia.Arriendos(ruta_db)
+        self._contadores = {
+            'aciertos_memoria': 0,
+            'aciertos_disco': 0,
+            'aciertos_stale': 0,
+            'fallos': 0,
+            'desalojos': 0,
+            'refrescos': 0,
+            'negativos': 0,
+        }
+
+    # --- Tier en disco -------------------------------------------------
+
+    def _conexion(self):
+        """Conexión SQLite de este hilo y proceso (None si el disco está desactivado)"""
+        if not self.ruta_db or self.ruta_db == 'off':
+            return None
+        conexion = getattr(self._local, 'conexion', None)
+        if conexion is not None and self._local.pid == os.getpid():
+            return conexion
+        try:
+            conexion = sqlite3.connect(self.ruta_db, timeout=1, isolation_level=None, check_same_thread=False)
+            conexion.execute('PRAGMA journal_mode=WAL')
+            conexion.execute('PRAGMA synchronous=NORMAL')
+            conexion.execute(
+                'CREATE TABLE IF NOT EXISTS cache ('
+                'clave TEXT PRIMARY KEY, valor TEXT NOT NULL, expira REAL NOT NULL, stale_hasta REAL NOT NULL)'
+            )
+        except sqlite3.Error as e:
+            logger.warning(f"Caché en disco desactivada ({self.ruta_db}): {str(e)}")
+            self.ruta_db = None
+            return None
+        self._local.conexion = conexion
+        self._local.pid = os.getpid()
+        return conexion
+
+    def _leer_disco(self, clave):
+        conexion = self._conexion()
+        if conexion is None:
+            return None
+        try:
+            fila = conexion.execute(
+                'SELECT valor, expira, stale_hasta FROM cache WHERE clave = ?', (clave,)
+            ).fetchone()
+        except sqlite3.Error as e:
+            logger.warning(f"Error leyendo caché en disco: {str(e)}")
+            return None
+        if fila is None:
+            return None
+        return json.loads(fila[0]), fila[1], fila[2]
+
+    def _escribir_disco(self, clave, valor, expira, stale_hasta):
+        conexion = self._conexion()
+        if conexion is None:
+            return
+        with self._lock:
+            self._escrituras += 1
+            purgar = self._escrituras % PURGA_CADA == 0
+        try:
+            conexion.execute(
+                'INSERT OR REPLACE INTO cache (clave, valor, expira, stale_hasta) VALUES (?, ?, ?, ?)',
+                (clave, json.dumps(valor, ensure_ascii=False), expira, stale_hasta),
+            )
+            if purgar:
+                conexion.execute('DELETE FROM cache WHERE stale_hasta < ?', (time.time(),))
+        except (sqlite3.Error, TypeError, ValueError) as e:
+            logger.warning(f"Error escribiendo caché en disco: {str(e)}")
+
+    # --- Tier en memoria -----------------------------------------------
+
+    def _guardar_memoria(self, clave, entrada):
+        with self._lock:
+            self._memoria[clave] = entrada
+            self._memoria.move_to_end(clave)
+            while len(self._memoria) > self.max_entradas:
+                self._memoria.popitem(last=False)
+                self._contadores['desalojos'] += 1
+
+    def _contar(self, contador):
+        with self._lock:
+            self._contadores[contador] += 1
+
+    # --- API -----------------------------------------------------------
+
+    def guardar(self, fuente, clave, valor, retener=0):
+        """
+        Guarda un valor con el TTL de su fuente (TTL negativo si es un fallo)
+        Con `retener` un valor bueno se sigue sirviendo (stale) al menos esos segundos
+        """
+        fresco, stale, negativo = TTL_FUENTES.get(fuente, TTL_POR_DEFECTO)
+        ahora = time.time()
+        if es_fallo(valor):
+            expira = stale_hasta = ahora + negativo
+            self._contar('negativos')
+        else:
+            expira = ahora + fresco
+            stale_hasta = max(expira + stale, ahora + retener)
+        self._guardar_memoria(clave, (valor, expira, stale_hasta))
+        self._escribir_disco(clave, valor, expira, stale_hasta)
+
+    def buscar(self, clave):
+        """
+        Busca una clave en memoria y luego en disco
+        Retorna (valor, vencida) o (FALTA, False) si no hay entrada utilizable
+        """
+        ahora = time.time()
+        with self._lock:
+            entrada = self._memoria.get(clave)
+            if entrada is not None:
+                self._memoria.move_to_end(clave)
+        origen = 'aciertos_memoria'
+        if entrada is None or entrada[1] <= ahora:
+            # Sin entrada fresca en memoria: otro worker o el calentador pueden haber guardado una más nueva
+            en_disco = self._leer_disco(clave)
+            if en_disco is not None and (entrada is None or en_disco[1] > entrada[1]):
+                entrada = en_disco
+                origen = 'aciertos_disco'
+                if entrada[2] > ahora:
+                    self._guardar_memoria(clave, entrada)
+        if entrada is None or entrada[2] <= ahora:
+            self._contar('fallos')
+            return FALTA, False
+        valor, expira, _ = entrada
+        if expira > ahora:
+            self._contar(origen)
+            return valor, False
+        self._contar('aciertos_stale')
+        return valor, True
+
+    def vigencia(self, clave):
+        """(expira, stale_hasta) de una clave, mirando primero el disco compartido; None si no hay entrada"""
+        entrada = self._leer_disco(clave)
+        if entrada is None:
+            with self._lock:
+                entrada = self._memoria.get(clave)
+        return entrada[1:] if entrada is not None else None
+
+    def leer(self, clave, por_defecto=None):
+        """Retorna el valor de una clave (fresco o stale) o por_defecto si no hay entrada"""
+        valor, _ = self.buscar(clave)
+        return por_defecto if valor is FALTA else valor
+
+    def obtener(self, fuente, clave, funcion, *args, plazo_espera=None, **kwargs):
+        """
+        Retorna el valor cacheado o lo calcula con funcion(*args, **kwargs)
+        Si la entrada está vencida pero dentro de la ventana stale, la sirve y
+        lanza el refresco en segundo plano. plazo_espera (viajeia.plazos) recorta
+        la espera a otra petición o a otro worker que ya la está calculando
+        """
+        valor, vencida = self.buscar(clave)
+        if valor is FALTA:
+            return coalescencia.vuelos.ejecutar(
+                clave, self._calcular, fuente, clave, funcion, args, kwargs, plazo_espera, plazo_espera=plazo_espera
+            )
+        if vencida:
+            self._refrescar(fuente, clave, funcion, args, kwargs)
+        return valor
+
+    def _calcular(self, fuente, clave, funcion, args, kwargs, plazo_espera=None):
+        """Llamada real tras un fallo de caché (una por clave y proceso; y por máquina con arriendos)"""
+        arrendada = False
+        if self._arriendos is not None:
+            arrendada = self._arriendos.tomar(clave)
+            if not arrendada:
+                valor = self._esperar_otro_worker(clave, plazo_espera)
+                if valor is not FALTA:
+                    coalescencia.vuelos.contar(clave, 'entre_workers')
+                    return valor
+        try:
+            valor = funcion(*args, **kwargs)
+            self.guardar(fuente, clave, valor)
+            return valor
+        finally:
+            if arrendada:
+                self._arriendos.soltar(clave)
+
+    def _esperar_otro_worker(self, clave, plazo_espera=None):
+        """Valor que guarda el worker con el arriendo, o FALTA si lo suelta sin guardar, vence o se acaba el plazo"""
+        duracion = self._arriendos.duracion
+        limite = time.time() + (duracion if plazo_espera is None else plazo_espera.espera(duracion))
+        while time.time() < limite:
+            time.sleep(coalescencia.SONDEO)
+            # El dueño guarda antes de soltar: si ya lo soltó, esta lectura ve su valor
+            libre = not self._arriendos.vigente(clave)
+            entrada = self._leer_disco(clave)
+            if entrada is not None and entrada[2] > time.time():
+                self._guardar_memoria(clave, entrada)
+                return entrada[0]
+            if libre:
+                break
+        return FALTA
+
+    def _refrescar(self, fuente, clave, funcion, args, kwargs):
+        with self._lock:
+            if clave in self._refrescando:
+                return
+            self._refrescando.add(clave)
+
+        def tarea():
+            try:
+                valor = funcion(*args, **kwargs)
+                # Un fallo durante el refresco no pisa el último valor bueno
+                if not es_fallo(valor):
+                    self.guardar(fuente, clave, valor)
+                self._contar('refrescos')
+            except Exception as e:
+                logger.error(f"Error refrescando caché '{clave}': {str(e)}")
+            finally:
+                with self._lock:
+                    self._refrescando.discard(clave)
+
+        obtener_executor().submit(tarea)
+
+    def estadisticas(self):
+        """Contadores de aciertos, fallos y desalojos de este worker"""
+        with self._lock:
+            datos = dict(self._contadores)
+            datos['entradas_memoria'] = len(self._memoria)
+        aciertos = datos['aciertos_memoria'] + datos['aciertos_disco'] + datos['aciertos_stale']
+        total = aciertos + datos['fallos']
+        datos['tasa_aciertos'] = round(aciertos / total, 4) if total else 0.0
+        datos['max_entradas'] = self.max_entradas
+        datos['disco'] = self.ruta_db or None
+        return datos
+
+
+cache = CacheEscalonada()
+
+
+def clave_cache(fuente, args, kwargs):
+    """Clave con la que cacheado() guarda una llamada (la misma para el modo síncrono y el asíncrono)"""
+    partes = [str(a).strip().lower() for a in args]
+    partes += [f'{k}={str(v).strip().lower()}' for k, v in sorted(kwargs.items())]
+    return f"{fuente}:{'|'.join(partes)}"
+
+
+def cacheado(fuente):
+    """Decorador que cachea una función de enriquecimiento bajo la fuente dada"""
+    def decorador(funcion):
+        @wraps(funcion)
+        def envoltura(*args, **kwargs):
+            return cache.obtener(fuente, clave_cache(fuente, args, kwargs), funcion, *args, **kwargs)
+        envoltura.sin_cache = funcion
+        return envoltura
+    return decorador
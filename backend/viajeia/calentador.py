@@ -0,0 +1,215 @@
+"""
+Calentador de la caché para los destinos más pedidos
+
+La primera petición del día a cada destino pagaba la latencia de Weatherbit y
+Unsplash con la caché fría. El calentador recorre cada INTERVALO segundos los
+destinos populares (los primeros CALENTADOR_TOP destinos curados de
+viajeia/ciudades.py, o la lista CALENTADOR_DESTINOS) y renueva en la caché
+escalonada las entradas de clima, fotos y tipo de cambio que no seguirán
+frescas en la siguiente pasada, de la más urgente a la menos.
+
+Las entradas que guarda se siguen sirviendo (stale) al menos RETENCION
+segundos, así que una petición a esos destinos siempre encuentra un valor y
+nunca espera a una consulta externa; la caché la refresca en segundo plano.
+
+Cada fuente tiene su cuota para el calentador (CALENTADOR_CUOTA_*, llamadas
+por ventana) en el cubo de tokens compartido de viajeia/limite.py, por debajo
+de la del plan gratuito para dejar margen a las peticiones. El tipo de cambio
+ya es una sola descarga para todas las monedas. Weatherbit solo admite lotes
+de ciudades con IDs propios y en planes de pago, así que el clima se pide por
+destino y la cuota marca el ritmo. La diferencia horaria se calcula en
+proceso y no necesita calentarse.
+
+Se ejecuta en un solo proceso de la máquina: con CALENTADOR=worker, cada
+worker de gunicorn lanza un hilo y solo trabaja el que tiene el arriendo
+'calentador' en la SQLite de la caché; o como proceso aparte con
+calentar-cache.py.
+"""
+import logging
+import os
+import threading
+import time
+from collections import namedtuple
+
+from viajeia import circuitos, coalescencia, destinos, divisas, fotos, planificacion
+from viajeia.cache import cache, clave_cache, es_fallo
+from viajeia.ciudades import CIUDADES
+from viajeia.limite import limitador
+
+logger = logging.getLogger(__name__)
+
+# off o worker (un hilo por worker; solo trabaja el que tiene el arriendo)
+MODO = os.getenv('CALENTADOR', 'off').lower()
+TOP = int(os.getenv('CALENTADOR_TOP', '10'))
+DESTINOS = os.getenv('CALENTADOR_DESTINOS', '')
+INTERVALO = float(os.getenv('CALENTADOR_INTERVALO', '300'))
+RETENCION = float(os.getenv('CALENTADOR_RETENCION', str(24 * 3600)))
+
+# Llamadas que el calentador puede gastar por ventana (el resto de la cuota queda para las peticiones)
+CUOTAS = {
+    'clima': (int(os.getenv('CALENTADOR_CUOTA_WEATHERBIT', '25')), 24 * 3600),
+    'fotos': (int(os.getenv('CALENTADOR_CUOTA_UNSPLASH', '10')), 3600),
+    'tipo_cambio': (int(os.getenv('CALENTADOR_CUOTA_EXCHANGERATE', '24')), 24 * 3600),
+}
+
+ARRIENDO = 'calentador'
+
+Tarea = namedtuple('Tarea', 'fuente clave funcion args')
+
+_lock = threading.Lock()
+_hilo = None
+_contadores = {'rondas': 0, 'renovadas': {}, 'sin_cuota': {}, 'errores': 0}
+_estado = {'lider': False, 'ultima_ronda': None}
+
+
+def destinos_populares():
+    """Destinos del gazetteer que se mantienen calientes, en orden de prioridad"""
+    nombres = [n.strip() for n in DESTINOS.split(',') if n.strip()] or list(CIUDADES)[:TOP]
+    resultado = []
+    for nombre in nombres:
+        destino = destinos.resolver(nombre)
+        if destino is None:
+            logger.warning(f"Calentador: '{nombre}' no está en el gazetteer, se ignora")
+        elif destino not in resultado:
+            resultado.append(destino)
+    return resultado
+
+
+def tareas(populares):
+    """Consultas a mantener, con la misma clave de caché que usan las peticiones"""
+    lista = []
+    for destino in populares:
+        if planificacion.WEATHERBIT_API_KEY:
+            clave = planificacion.clave_clima(destino.nombre)
+            lista.append(Tarea('clima', clave_cache('clima', (clave,), {}), planificacion.clima_destino.sin_cache, (clave,)))
+        if planificacion.UNSPLASH_ACCESS_KEY or planificacion.UNSPLASH_API_KEY:
+            clave = fotos.clave_pool(destino.nombre)
+            lista.append(Tarea('fotos', clave_cache('fotos', (clave,), {}), fotos.descargar_pool.sin_cache, (clave,)))
+    if populares:
+        lista.append(Tarea('tipo_cambio', clave_cache('tipo_cambio', (), {}), divisas.descargar_tasas.sin_cache, ()))
+    return lista
+
+
+def _sumar(contador, fuente):
+    with _lock:
+        _contadores[contador][fuente] = _contadores[contador].get(fuente, 0) + 1
+
+
+def ronda(lista=None):
+    """
+    Una pasada: renueva, de la más urgente a la menos y dentro de la cuota de
+    cada fuente, las entradas que no seguirán frescas en la siguiente
+    Retorna el número de entradas renovadas
+    """
+    ahora = time.time()
+    pendientes = []
+    for tarea in tareas(destinos_populares()) if lista is None else lista:
+        vigencia = cache.vigencia(tarea.clave)
+        if vigencia and vigencia[0] - ahora > INTERVALO:
+            continue
+        # Primero las que faltan y luego las que antes dejarían de poder servirse
+        pendientes.append((vigencia[1] if vigencia else 0, tarea))
+    pendientes.sort(key=lambda p: p[0])
+
+    renovadas = 0
+    agotadas = set()
+    for _, tarea in pendientes:
+        if tarea.fuente in agotadas:
+            continue
+        maximo, ventana = CUOTAS[tarea.fuente]
+        if not limitador.permitir(f'calentador:{tarea.fuente}', maximo, ventana):
+            agotadas.add(tarea.fuente)
+            _sumar('sin_cuota', tarea.fuente)
+            logger.info(f"Calentador: cuota de '{tarea.fuente}' agotada ({maximo} cada {ventana:.0f}s), sigue en la próxima ronda")
+            continue
+        try:
+            valor = tarea.funcion(*tarea.args)
+        except circuitos.CircuitoAbierto as e:
+            agotadas.add(tarea.fuente)
+            logger.warning(f"Calentador: {str(e)}")
+            continue
+        except Exception as e:
+            with _lock:
+                _contadores['errores'] += 1
+            logger.error(f"Calentador: error renovando '{tarea.clave}': {str(e)}")
+            continue
+        # Un fallo no pisa el último valor bueno
+        if es_fallo(valor):
+            continue
+        cache.guardar(tarea.fuente, tarea.clave, valor, retener=RETENCION)
+        if tarea.fuente == 'tipo_cambio':
+            divisas.publicar(valor)
+        renovadas += 1
+        _sumar('renovadas', tarea.fuente)
+
+    with _lock:
+        _contadores['rondas'] += 1
+        _estado['ultima_ronda'] = ahora
+    if renovadas:
+        logger.info(f"Calentador: {renovadas} entradas renovadas de {len(pendientes)} pendientes")
+    return renovadas
+
+
+def _avisar_cuotas(populares):
+    """Avisa si la cuota no alcanza para pasar por todos los destinos dentro de RETENCION"""
+    for fuente, (maximo, ventana) in CUOTAS.items():
+        if fuente == 'tipo_cambio':
+            continue
+        por_retencion = maximo * RETENCION / ventana
+        if por_retencion < len(populares):
+            logger.warning(
+                f"Calentador: la cuota de '{fuente}' ({maximo} cada {ventana:.0f}s) no alcanza para "
+                f"{len(populares)} destinos en {RETENCION:.0f}s; algunos pueden enfriarse"
+            )
+
+
+def ejecutar(rondas=None):
+    """
+    Bucle del calentador: una ronda cada INTERVALO segundos mientras este
+    proceso tenga el arriendo (sin caché en disco, siempre)
+    """
+    arriendos = None
+    if cache.ruta_db and cache.ruta_db != 'off':
+        # Si el proceso con el arriendo muere, otro lo toma al vencer
+        arriendos = coalescencia.Arriendos(cache.ruta_db, duracion=INTERVALO * 3)
+    _avisar_cuotas(destinos_populares())
+    hechas = 0
+    while rondas is None or hechas < rondas:
+        lider = arriendos is None or arriendos.renovar(ARRIENDO) or arriendos.tomar(ARRIENDO)
+        if lider != _estado['lider']:
+            logger.info(f"Calentador: {'activo' if lider else 'en espera'} en el proceso {os.getpid()}")
+            _estado['lider'] = lider
+        if lider:
+            try:
+                ronda()
+            except Exception as e:
+                logger.error(f"Calentador: error en la ronda: {str(e)}")
+        hechas += 1
+        if rondas is None or hechas < rondas:
+            time.sleep(INTERVALO)
+
+
+def iniciar():
+    """Lanza el calentador en un hilo de este proceso (se llama en post_fork de cada worker)"""
+    global _hilo
+    with _lock:
+        if _hilo is not None and _hilo.is_alive():
+            return
+        _hilo = threading.Thread(target=ejecutar, name='calentador', daemon=True)
+        _hilo.start()
+
+
+def estadisticas():
+    populares = destinos_populares()
+    with _lock:
+        return {
+            'modo': MODO,
+            'activo': _estado['lider'],
+            'destinos': [destino.nombre for destino in populares],
+            'intervalo': INTERVALO,
+            'rondas': _contadores['rondas'],
+            'renovadas': dict(_contadores['renovadas']),
+            'sin_cuota': dict(_contadores['sin_cuota']),
+            'errores': _contadores['errores'],
+            'ultima_ronda': _estado['ultima_ronda']
+        }
@@ -0,0 +1,126 @@
+"""
+Cortacircuitos por servicio externo (Weatherbit, Unsplash, exchangerate-api y Gemini)
+
+Tras FALLOS fallos seguidos (error de red, timeout, 429 o 5xx, ya con los
+reintentos de http_cliente) el circuito se abre y durante PAUSA segundos las
+llamadas a ese servicio fallan al instante con CircuitoAbierto, sin gastar
+plazo ni conexiones. Pasada la pausa se deja pasar una sola llamada de
+prueba: si sale bien el circuito se cierra; si falla, vuelve a abrirse.
+
+El estado es de cada worker. Un CircuitoAbierto no se guarda en la caché como
+fallo, así que el destino vuelve a consultarse en cuanto el servicio se recupera.
+Los fallos y los rechazos se cuentan por servicio y tipo en viajeia/metricas.py.
+"""
+import logging
+import os
+import threading
+import time
+from urllib.parse import urlsplit
+
+from viajeia import metricas
+
+logger = logging.getLogger(__name__)
+
+FALLOS = int(os.getenv('CIRCUITO_FALLOS', '5'))
+PAUSA = float(os.getenv('CIRCUITO_PAUSA', '30'))
+
+CERRADO = 'cerrado'
+ABIERTO = 'abierto'
+SEMIABIERTO = 'semiabierto'
+
+
+class CircuitoAbierto(Exception):
+    """El servicio está marcado como caído; se falla sin llamarlo"""
+
+
+class Cortacircuitos:
+    """Estado de un servicio: cerrado (normal), abierto (falla rápido) o semiabierto (una llamada de prueba)"""
+
+    def __init__(self, servicio, fallos=FALLOS, pausa=PAUSA):
+        self.servicio = servicio
+        self.fallos = fallos
+        self.pausa = pausa
+        self._lock = threading.Lock()
+        self._estado = CERRADO
+        self._seguidos = 0
+        self._abierto_en = 0.0
+        self._contadores = {'llamadas': 0, 'fallos': 0, 'rechazadas': 0, 'aperturas': 0}
+
+    def permitir(self):
+        """Deja pasar la llamada o lanza CircuitoAbierto"""
+        with self._lock:
+            self._contadores['llamadas'] += 1
+            if self._estado == CERRADO:
+                return
+            # Una llamada de prueba por pausa (aunque la anterior no llegara a informar)
+            if time.monotonic() - self._abierto_en >= self.pausa:
+                self._estado = SEMIABIERTO
+                self._abierto_en = time.monotonic()
+                logger.info(f"Circuito de {self.servicio} semiabierto: llamada de prueba")
+                return
+            self._contadores['rechazadas'] += 1
+        metricas.fallo_externo(self.servicio, 'circuito_abierto')
+        raise CircuitoAbierto(f'{self.servicio}: circuito abierto, servicio no disponible')
+
+    def exito(self):
+        with self._lock:
+            if self._estado != CERRADO:
+                logger.info(f"Circuito de {self.servicio} cerrado: el servicio respondió")
+            self._estado = CERRADO
+            self._seguidos = 0
+
+    def fallo(self, error=None, tipo=None):
+        """Registra un fallo del servicio (error: la excepción, para distinguir los timeouts)"""
+        metricas.fallo_externo(self.servicio, tipo or metricas.tipo_fallo(error))
+        with self._lock:
+            self._contadores['fallos'] += 1
+            self._seguidos += 1
+            if self._estado == SEMIABIERTO or (self._estado == CERRADO and self._seguidos >= self.fallos):
+                self._estado = ABIERTO
+                self._abierto_en = time.monotonic()
+                self._contadores['aperturas'] += 1
+                logger.warning(f"Circuito de {self.servicio} abierto tras {self._seguidos} fallos seguidos ({self.pausa:.0f}s)")
+
+    def respuesta(self, response):
+        """Registra una respuesta HTTP: 429 y 5xx cuentan como fallo del servicio"""
+        if response.status_code == 429 or response.status_code >= 500:
+            self.fallo(tipo='http')
+        else:
+            self.exito()
+        return response
+
+    def llamar(self, funcion, *args, **kwargs):
+        """funcion(*args, **kwargs) a través del circuito: cualquier excepción cuenta como fallo"""
+        self.permitir()
+        try:
+            resultado = funcion(*args, **kwargs)
+        except Exception as e:
+            self.fallo(e)
+            raise
+        self.exito()
+        return resultado
+
+    def estadisticas(self):
+        with self._lock:
+            return dict(self._contadores, estado=self._estado, fallos_seguidos=self._seguidos)
+
+
+weatherbit = Cortacircuitos('weatherbit')
+unsplash = Cortacircuitos('unsplash')
+exchangerate = Cortacircuitos('exchangerate')
+gemini = Cortacircuitos('gemini')
+
+_POR_HOST = {
+    'api.weatherbit.io': weatherbit,
+    'api.unsplash.com': unsplash,
+    'api.exchangerate-api.com': exchangerate,
+}
+
+
+def por_url(url):
+    """Cortacircuitos del servicio de una URL (None si no es un servicio conocido)"""
+    return _POR_HOST.get(urlsplit(url).hostname)
+
+
+def estadisticas():
+    return {c.servicio: c.estadisticas() for c in (weatherbit, unsplash, exchangerate, gemini)}
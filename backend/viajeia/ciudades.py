@@ -0,0 +1,137 @@
+"""
+Datos fuente del gazetteer de destinos
+
+Aquí solo hay datos editables a mano; el índice que se usa en ejecución es
+viajeia/datos/gazetteer.bin, que genera construir-gazetteer.py a partir de
+estas tablas, del zone.tab de la base tz y, opcionalmente, de un volcado de
+GeoNames (ver viajeia/gazetteer.py).
+"""
+import unicodedata
+
+# Destinos curados: se reconocen aunque el usuario los escriba en minúsculas
+# nombre canónico: (código de país ISO 3166, zona horaria IANA, latitud, longitud, alias)
+CIUDADES = {
+    'Paris': ('FR', 'Europe/Paris', 48.8566, 2.3522, ('paris', 'parís')),
+    'London': ('GB', 'Europe/London', 51.5074, -0.1278, ('london', 'londres')),
+    'Tokyo': ('JP', 'Asia/Tokyo', 35.6762, 139.6503, ('tokyo', 'tokio')),
+    'New York': ('US', 'America/New_York', 40.7128, -74.0060, ('new york', 'nueva york')),
+    'Mexico City': ('MX', 'America/Mexico_City', 19.4326, -99.1332, ('mexico', 'méxico', 'ciudad de mexico', 'ciudad de méxico')),
+    'Barcelona': ('ES', 'Europe/Madrid', 41.3874, 2.1686, ('barcelona',)),
+    'Madrid': ('ES', 'Europe/Madrid', 40.4168, -3.7038, ('madrid',)),
+    'Rome': ('IT', 'Europe/Rome', 41.9028, 12.4964, ('roma', 'rome')),
+    'Bogota': ('CO', 'America/Bogota', 4.7110, -74.0721, ('bogota', 'bogotá')),
+    'Buenos Aires': ('AR', 'America/Argentina/Buenos_Aires', -34.6037, -58.3816, ('buenos aires',)),
+    'Lima': ('PE', 'America/Lima', -12.0464, -77.0428, ('lima',)),
+    'Santiago': ('CL', 'America/Santiago', -33.4489, -70.6693, ('santiago', 'santiago de chile')),
+    'Rio de Janeiro': ('BR', 'America/Sao_Paulo', -22.9068, -43.1729, ('rio de janeiro', 'río de janeiro')),
+    'Cancun': ('MX', 'America/Cancun', 21.1619, -86.8515, ('cancun', 'cancún')),
+    'Playa del Carmen': ('MX', 'America/Cancun', 20.6296, -87.0739, ('playa del carmen',)),
+    'Tulum': ('MX', 'America/Cancun', 20.2114, -87.4654, ('tulum',)),
+    'Bali': ('ID', 'Asia/Makassar', -8.6705, 115.2126, ('bali',)),
+    'Bangkok': ('TH', 'Asia/Bangkok', 13.7563, 100.5018, ('bangkok',)),
+    'Dubai': ('AE', 'Asia/Dubai', 25.2048, 55.2708, ('dubai', 'dubái')),
+    'Singapore': ('SG', 'Asia/Singapore', 1.3521, 103.8198, ('singapore', 'singapur')),
+    'Sydney': ('AU', 'Australia/Sydney', -33.8688, 151.2093, ('sydney', 'sídney')),
+    'Melbourne': ('AU', 'Australia/Melbourne', -37.8136, 144.9631, ('melbourne',)),
+}
+
+# Nombres en español de ciudades que vienen del zone.tab (zona IANA -> alias)
+ALIAS_ZONAS = {
+    'Africa/Addis_Ababa': ('adís abeba',),
+    'Africa/Algiers': ('argel',),
+    'Africa/Cairo': ('el cairo',),
+    'Africa/Johannesburg': ('johannesburgo',),
+    'Africa/Khartoum': ('jartum',),
+    'Africa/Tunis': ('túnez',),
+    'America/Havana': ('la habana',),
+    'America/Los_Angeles': ('los ángeles',),
+    'America/Sao_Paulo': ('são paulo',),
+    'Asia/Baghdad': ('bagdad',),
+    'Asia/Baku': ('bakú',),
+    'Asia/Damascus': ('damasco',),
+    'Asia/Ho_Chi_Minh': ('saigón',),
+    'Asia/Jakarta': ('yakarta',),
+    'Asia/Jerusalem': ('jerusalén',),
+    'Asia/Kathmandu': ('katmandú',),
+    'Asia/Kolkata': ('calcuta',),
+    'Asia/Macau': ('macao',),
+    'Asia/Qatar': ('doha',),
+    'Asia/Riyadh': ('riad',),
+    'Asia/Seoul': ('seúl',),
+    'Asia/Shanghai': ('shanghái',),
+    'Asia/Taipei': ('taipéi',),
+    'Asia/Tbilisi': ('tiflis',),
+    'Asia/Tehran': ('teherán',),
+    'Asia/Yerevan': ('ereván',),
+    'Atlantic/Azores': ('azores',),
+    'Atlantic/Canary': ('islas canarias', 'canarias'),
+    'Atlantic/Reykjavik': ('reikiavik',),
+    'Europe/Amsterdam': ('ámsterdam',),
+    'Europe/Athens': ('atenas',),
+    'Europe/Belgrade': ('belgrado',),
+    'Europe/Berlin': ('berlín',),
+    'Europe/Brussels': ('bruselas',),
+    'Europe/Bucharest': ('bucarest',),
+    'Europe/Copenhagen': ('copenhague',),
+    'Europe/Dublin': ('dublín',),
+    'Europe/Istanbul': ('estambul',),
+    'Europe/Kyiv': ('kiev',),
+    'Europe/Lisbon': ('lisboa',),
+    'Europe/Luxembourg': ('luxemburgo',),
+    'Europe/Monaco': ('mónaco',),
+    'Europe/Moscow': ('moscú',),
+    'Europe/Prague': ('praga',),
+    'Europe/Stockholm': ('estocolmo',),
+    'Europe/Vatican': ('vaticano', 'ciudad del vaticano'),
+    'Europe/Vienna': ('viena',),
+    'Europe/Warsaw': ('varsovia',),
+    'Europe/Zurich': ('zúrich',),
+    'Pacific/Easter': ('isla de pascua',),
+    'Pacific/Galapagos': ('galápagos', 'islas galápagos'),
+}
+
+# Moneda local por país (ISO 4217)
+MONEDA_POR_PAIS = {
+    'AD': 'EUR', 'AE': 'AED', 'AF': 'AFN', 'AG': 'XCD', 'AI': 'XCD', 'AL': 'ALL', 'AM': 'AMD',
+    'AO': 'AOA', 'AR': 'ARS', 'AS': 'USD', 'AT': 'EUR', 'AU': 'AUD', 'AW': 'AWG', 'AX': 'EUR',
+    'AZ': 'AZN', 'BA': 'BAM', 'BB': 'BBD', 'BD': 'BDT', 'BE': 'EUR', 'BF': 'XOF', 'BG': 'EUR',
+    'BH': 'BHD', 'BI': 'BIF', 'BJ': 'XOF', 'BL': 'EUR', 'BM': 'BMD', 'BN': 'BND', 'BO': 'BOB',
+    'BQ': 'USD', 'BR': 'BRL', 'BS': 'BSD', 'BT': 'BTN', 'BW': 'BWP', 'BY': 'BYN', 'BZ': 'BZD',
+    'CA': 'CAD', 'CC': 'AUD', 'CD': 'CDF', 'CF': 'XAF', 'CG': 'XAF', 'CH': 'CHF', 'CI': 'XOF',
+    'CK': 'NZD', 'CL': 'CLP', 'CM': 'XAF', 'CN': 'CNY', 'CO': 'COP', 'CR': 'CRC', 'CU': 'CUP',
+    'CV': 'CVE', 'CW': 'XCG', 'CX': 'AUD', 'CY': 'EUR', 'CZ': 'CZK', 'DE': 'EUR', 'DJ': 'DJF',
+    'DK': 'DKK', 'DM': 'XCD', 'DO': 'DOP', 'DZ': 'DZD', 'EC': 'USD', 'EE': 'EUR', 'EG': 'EGP',
+    'EH': 'MAD', 'ER': 'ERN', 'ES': 'EUR', 'ET': 'ETB', 'FI': 'EUR', 'FJ': 'FJD', 'FK': 'FKP',
+    'FM': 'USD', 'FO': 'DKK', 'FR': 'EUR', 'GA': 'XAF', 'GB': 'GBP', 'GD': 'XCD', 'GE': 'GEL',
+    'GF': 'EUR', 'GG': 'GBP', 'GH': 'GHS', 'GI': 'GIP', 'GL': 'DKK', 'GM': 'GMD', 'GN': 'GNF',
+    'GP': 'EUR', 'GQ': 'XAF', 'GR': 'EUR', 'GS': 'GBP', 'GT': 'GTQ', 'GU': 'USD', 'GW': 'XOF',
+    'GY': 'GYD', 'HK': 'HKD', 'HN': 'HNL', 'HR': 'EUR', 'HT': 'HTG', 'HU': 'HUF', 'ID': 'IDR',
+    'IE': 'EUR', 'IL': 'ILS', 'IM': 'GBP', 'IN': 'INR', 'IO': 'USD', 'IQ': 'IQD', 'IR': 'IRR',
+    'IS': 'ISK', 'IT': 'EUR', 'JE': 'GBP', 'JM': 'JMD', 'JO': 'JOD', 'JP': 'JPY', 'KE': 'KES',
+    'KG': 'KGS', 'KH': 'KHR', 'KI': 'AUD', 'KM': 'KMF', 'KN': 'XCD', 'KP': 'KPW', 'KR': 'KRW',
+    'KW': 'KWD', 'KY': 'KYD', 'KZ': 'KZT', 'LA': 'LAK', 'LB': 'LBP', 'LC': 'XCD', 'LI': 'CHF',
+    'LK': 'LKR', 'LR': 'LRD', 'LS': 'LSL', 'LT': 'EUR', 'LU': 'EUR', 'LV': 'EUR', 'LY': 'LYD',
+    'MA': 'MAD', 'MC': 'EUR', 'MD': 'MDL', 'ME': 'EUR', 'MF': 'EUR', 'MG': 'MGA', 'MH': 'USD',
+    'MK': 'MKD', 'ML': 'XOF', 'MM': 'MMK', 'MN': 'MNT', 'MO': 'MOP', 'MP': 'USD', 'MQ': 'EUR',
+    'MR': 'MRU', 'MS': 'XCD', 'MT': 'EUR', 'MU': 'MUR', 'MV': 'MVR', 'MW': 'MWK', 'MX': 'MXN',
+    'MY': 'MYR', 'MZ': 'MZN', 'NA': 'NAD', 'NC': 'XPF', 'NE': 'XOF', 'NF': 'AUD', 'NG': 'NGN',
+    'NI': 'NIO', 'NL': 'EUR', 'NO': 'NOK', 'NP': 'NPR', 'NR': 'AUD', 'NU': 'NZD', 'NZ': 'NZD',
+    'OM': 'OMR', 'PA': 'PAB', 'PE': 'PEN', 'PF': 'XPF', 'PG': 'PGK', 'PH': 'PHP', 'PK': 'PKR',
+    'PL': 'PLN', 'PM': 'EUR', 'PN': 'NZD', 'PR': 'USD', 'PS': 'ILS', 'PT': 'EUR', 'PW': 'USD',
+    'PY': 'PYG', 'QA': 'QAR', 'RE': 'EUR', 'RO': 'RON', 'RS': 'RSD', 'RU': 'RUB', 'RW': 'RWF',
+    'SA': 'SAR', 'SB': 'SBD', 'SC': 'SCR', 'SD': 'SDG', 'SE': 'SEK', 'SG': 'SGD', 'SH': 'SHP',
+    'SI': 'EUR', 'SJ': 'NOK', 'SK': 'EUR', 'SL': 'SLE', 'SM': 'EUR', 'SN': 'XOF', 'SO': 'SOS',
+    'SR': 'SRD', 'SS': 'SSP', 'ST': 'STN', 'SV': 'USD', 'SX': 'XCG', 'SY': 'SYP', 'SZ': 'SZL',
+    'TC': 'USD', 'TD': 'XAF', 'TF': 'EUR', 'TG': 'XOF', 'TH': 'THB', 'TJ': 'TJS', 'TK': 'NZD',
+    'TL': 'USD', 'TM': 'TMT', 'TN': 'TND', 'TO': 'TOP', 'TR': 'TRY', 'TT': 'TTD', 'TV': 'AUD',
+    'TW': 'TWD', 'TZ': 'TZS', 'UA': 'UAH', 'UG': 'UGX', 'UM': 'USD', 'US': 'USD', 'UY': 'UYU',
+    'UZ': 'UZS', 'VA': 'EUR', 'VC': 'XCD', 'VE': 'VES', 'VG': 'USD', 'VI': 'USD', 'VN': 'VND',
+    'VU': 'VUV', 'WF': 'XPF', 'WS': 'WST', 'YE': 'YER', 'YT': 'EUR', 'ZA': 'ZAR', 'ZM': 'ZMW',
+    'ZW': 'ZWG',
+}
+
+
+def normalizar(texto):
+    """Minúsculas sin acentos ni espacios sobrantes"""
+    texto = unicodedata.normalize('NFKD', texto.strip().lower())
+    return ' '.join(''.join(c for c in texto if not unicodedata.combining(c)).split())
@@ -0,0 +1,285 @@
+"""
+Coalescencia de llamadas idénticas en vuelo (single-flight)
+
+Cuando muchos usuarios preguntan a la vez por el mismo destino, cada petición
+haría las mismas llamadas a Weatherbit, Unsplash y exchangerate-api, y a
+menudo la misma generación de Gemini. Con la misma clave (destino canónico y
+parámetros de la llamada, la misma que usa la caché) solo la primera petición
+hace la llamada; las demás del proceso esperan y reciben su resultado o su
+excepción. Si la primera se cancela (el cliente cerró el stream), se queda
+sin plazo (viajeia.plazos) o tarda más de ESPERA segundos, las que esperaban
+hacen la llamada por su cuenta. Quien espera con un plazo (las generaciones
+de Gemini) no espera más de lo que le queda: al agotarlo hace la llamada con
+su propio plazo, que falla enseguida con PlazoAgotado si ya no alcanza.
+
+Entre workers (COALESCENCIA_ENTRE_WORKERS=true) se usa un arriendo en la
+SQLite de la caché escalonada: el worker que lo toma hace la llamada y los
+demás esperan a que el resultado aparezca en el disco de la caché, como mucho
+ARRIENDO segundos.
+"""
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from viajeia import plazos
+
+logger = logging.getLogger(__name__)
+
+# Segundos que una petición espera la llamada de otra antes de hacerla ella
+ESPERA = float(os.getenv('COALESCENCIA_ESPERA', '60'))
+ENTRE_WORKERS = os.getenv('COALESCENCIA_ENTRE_WORKERS', 'false').lower() == 'true'
+# Duración del arriendo entre workers y cada cuánto se mira si el resultado ya está en disco
+ARRIENDO = float(os.getenv('COALESCENCIA_ARRIENDO', '15'))
+SONDEO = 0.05
+
+# Marca de "sin resultado compartido" que retorna esperar()
+SIN_RESULTADO = object()
+
+
+class Cancelada(Exception):
+    """La llamada en vuelo se abandonó sin resultado; quien esperaba debe llamar por su cuenta"""
+
+
+def fuente(clave):
+    """Fuente de una clave para las métricas ('clima:es-madrid' -> 'clima')"""
+    return clave.split(':', 1)[0]
+
+
+class _Vuelo:
+    __slots__ = ('hecho', 'resultado', 'error')
+
+    def __init__(self):
+        self.hecho = threading.Event()
+        self.resultado = None
+        self.error = None
+
+
+class Coalescedor:
+    """Llamadas en vuelo por clave, para hilos (ejecutar) y para el event loop (ejecutar_async)"""
+
+    def __init__(self, espera=ESPERA):
+        self.espera = espera
+        self._vuelos = {}
+        self._futuros = {}
+        self._lock = threading.Lock()
+        self._contadores = {}
+
+    def _sumar(self, clave, contador):
+        datos = self._contadores.get(fuente(clave))
+        if datos is None:
+            datos = self._contadores[fuente(clave)] = {
+                'llamadas': 0, 'ejecutadas': 0, 'coalescidas': 0, 'entre_workers': 0, 'esperas_agotadas': 0
+            }
+        datos[contador] += 1
+
+    def contar(self, clave, contador):
+        with self._lock:
+            self._sumar(clave, contador)
+
+    # --- Hilos -----------------------------------------------------------
+
+    def unirse(self, clave):
+        """
+        Retorna (vuelo, lider): el líder hace la llamada y la cierra con terminar();
+        los demás recogen su resultado con esperar()
+        """
+        with self._lock:
+            self._sumar(clave, 'llamadas')
+            vuelo = self._vuelos.get(clave)
+            if vuelo is not None:
+                return vuelo, False
+            vuelo = self._vuelos[clave] = _Vuelo()
+            self._sumar(clave, 'ejecutadas')
+            return vuelo, True
+
+    def terminar(self, clave, vuelo, resultado=None, error=None):
+        """Publica el resultado (o la excepción) del líder y libera la clave"""
+        with self._lock:
+            if self._vuelos.get(clave) is vuelo:
+                del self._vuelos[clave]
+        vuelo.resultado = resultado
+        vuelo.error = error
+        vuelo.hecho.set()
+
+    def _espera(self, plazo):
+        """Segundos que puede esperar al líder quien tiene `plazo` (None: sin plazo)"""
+        return self.espera if plazo is None else plazo.espera(self.espera)
+
+    def esperar(self, clave, vuelo, plazo=None):
+        """
+        Resultado de la llamada del líder; relanza su excepción
+        Retorna SIN_RESULTADO si se canceló, si se le agotó su plazo o si no
+        terminó en `espera` segundos (o en lo que queda de `plazo`)
+        """
+        espera = self._espera(plazo)
+        if not vuelo.hecho.wait(espera):
+            self.contar(clave, 'esperas_agotadas')
+            logger.warning(f"Coalescencia: '{clave}' sigue en vuelo tras {espera:.0f}s, llamada propia")
+            return SIN_RESULTADO
+        # El plazo agotado era el del líder: quien espera lo intenta con el suyo
+        if isinstance(vuelo.error, Cancelada) or plazos.agotado(vuelo.error):
+            return SIN_RESULTADO
+        if vuelo.error is not None:
+            raise vuelo.error
+        self.contar(clave, 'coalescidas')
+        return vuelo.resultado
+
+    def ejecutar(self, clave, funcion, *args, plazo_espera=None, **kwargs):
+        """
+        funcion(*args, **kwargs), o el resultado de la misma llamada si ya está en vuelo
+        plazo_espera (no se pasa a funcion) es el plazo de la petición que espera
+        """
+        vuelo, lider = self.unirse(clave)
+        if not lider:
+            resultado = self.esperar(clave, vuelo, plazo_espera)
+            if resultado is not SIN_RESULTADO:
+                return resultado
+            return funcion(*args, **kwargs)
+        try:
+            resultado = funcion(*args, **kwargs)
+        except Exception as e:
+            self.terminar(clave, vuelo, error=e)
+            raise
+        except BaseException:
+            self.terminar(clave, vuelo, error=Cancelada(clave))
+            raise
+        self.terminar(clave, vuelo, resultado)
+        return resultado
+
+    # --- Event loop ------------------------------------------------------
+
+    async def ejecutar_async(self, clave, funcion, *args, plazo_espera=None):
+        """Versión para corrutinas: `await funcion(*args)` una sola vez por clave y event loop"""
+        loop = asyncio.get_running_loop()
+        indice = (id(loop), clave)
+        futuro = self._futuros.get(indice)
+        if futuro is not None:
+            self.contar(clave, 'llamadas')
+            try:
+                resultado = await asyncio.wait_for(asyncio.shield(futuro), self._espera(plazo_espera))
+            except asyncio.TimeoutError:
+                self.contar(clave, 'esperas_agotadas')
+                return await funcion(*args)
+            except Exception as e:
+                if not plazos.agotado(e):
+                    raise
+                return await funcion(*args)
+            except asyncio.CancelledError:
+                if not futuro.cancelled():
+                    raise
+                return await funcion(*args)
+            self.contar(clave, 'coalescidas')
+            return resultado
+
+        futuro = self._futuros[indice] = loop.create_future()
+        self.contar(clave, 'llamadas')
+        self.contar(clave, 'ejecutadas')
+        try:
+            resultado = await funcion(*args)
+        except asyncio.CancelledError:
+            futuro.cancel()
+            raise
+        except Exception as e:
+            futuro.set_exception(e)
+            # Marca la excepción como recogida aunque nadie estuviera esperando
+            futuro.exception()
+            raise
+        else:
+            futuro.set_result(resultado)
+            return resultado
+        finally:
+            if self._futuros.get(indice) is futuro:
+                del self._futuros[indice]
+
+    def estadisticas(self):
+        """
+        Llamadas por fuente: ejecutadas (líder en el proceso), coalescidas (servidas
+        con el resultado de otra petición del proceso) y entre_workers (servidas
+        con el de otro worker; el líder no llegó a llamar)
+        """
+        with self._lock:
+            fuentes = {nombre: dict(datos) for nombre, datos in self._contadores.items()}
+            en_vuelo = len(self._vuelos) + len(self._futuros)
+        return {
+            'fuentes': fuentes,
+            'coalescidas': sum(d['coalescidas'] + d['entre_workers'] for d in fuentes.values()),
+            'en_vuelo': en_vuelo,
+            'entre_workers': ENTRE_WORKERS
+        }
+
+
+class Arriendos:
+    """
+    Arriendos de claves en una tabla SQLite compartida por los workers
+    tomar() es un único UPSERT que solo gana si no hay arriendo vigente
+    """
+
+    def __init__(self, ruta_db, duracion=ARRIENDO):
+        self.ruta_db = ruta_db
+        self.duracion = duracion
+        self._local = threading.local()
+
+    def _conexion(self):
+        conexion = getattr(self._local, 'conexion', None)
+        if conexion is not None and self._local.pid == os.getpid():
+            return conexion
+        conexion = sqlite3.connect(self.ruta_db, timeout=1, isolation_level=None, check_same_thread=False)
+        conexion.execute('PRAGMA journal_mode=WAL')
+        conexion.execute(
+            'CREATE TABLE IF NOT EXISTS arriendos (clave TEXT PRIMARY KEY, dueno TEXT NOT NULL, expira REAL NOT NULL)'
+        )
+        self._local.conexion = conexion
+        self._local.pid = os.getpid()
+        return conexion
+
+    def _dueno(self):
+        return f'{os.getpid()}:{threading.get_ident()}'
+
+    def tomar(self, clave):
+        """True si este hilo obtiene el arriendo (o si SQLite falla: mejor llamar que bloquear)"""
+        ahora = time.time()
+        try:
+            cursor = self._conexion().execute(
+                'INSERT INTO arriendos (clave, dueno, expira) VALUES (?, ?, ?) '
+                'ON CONFLICT(clave) DO UPDATE SET dueno = excluded.dueno, expira = excluded.expira '
+                'WHERE arriendos.expira <= ?',
+                (clave, self._dueno(), ahora + self.duracion, ahora),
+            )
+            return cursor.rowcount == 1
+        except sqlite3.Error as e:
+            logger.warning(f"Arriendo de '{clave}' no disponible: {str(e)}")
+            return True
+
+    def renovar(self, clave):
+        """Alarga el arriendo si este hilo sigue siendo su dueño"""
+        try:
+            cursor = self._conexion().execute(
+                'UPDATE arriendos SET expira = ? WHERE clave = ? AND dueno = ?',
+                (time.time() + self.duracion, clave, self._dueno()),
+            )
+            return cursor.rowcount == 1
+        except sqlite3.Error as e:
+            logger.warning(f"Error renovando el arriendo de '{clave}': {str(e)}")
+            return False
+
+    def vigente(self, clave):
+        try:
+            fila = self._conexion().execute(
+                'SELECT 1 FROM arriendos WHERE clave = ? AND expira > ?', (clave, time.time())
+            ).fetchone()
+            return fila is not None
+        except sqlite3.Error:
+            return False
+
+    def soltar(self, clave):
+        try:
+            self._conexion().execute('DELETE FROM arriendos WHERE clave = ? AND dueno = ?', (clave, self._dueno()))
+        except sqlite3.Error as e:
+            logger.warning(f"Error soltando el arriendo de '{clave}': {str(e)}")
+
+
+# Registro del proceso: lo comparten la caché, los puntos de entrada y el modo ASGI
+vuelos = Coalescedor()
@@ -0,0 +1,295 @@
+"""
+Contexto de las preguntas de seguimiento con presupuesto de tokens
+
+El prompt de seguimiento no arrastra las últimas respuestas cortadas a mano:
+lleva un resumen acumulado de la sesión y, literalmente, solo los turnos que
+ese resumen aún no incluye, todo dentro de MAX_TOKENS. Así el tamaño del
+prompt no crece con la longitud de la conversación.
+
+El resumen se actualiza después de cada turno en un hilo aparte (fuera de la
+petición) y se guarda en el almacén de sesiones, así que lo comparten los
+workers. Es extractivo: de cada turno se queda con la pregunta y las primeras
+frases (o la primera línea de cada sección del itinerario) de la respuesta;
+cuando no cabe en RESUMEN_TOKENS, los turnos más antiguos pierden la respuesta
+y luego desaparecen, salvo el primero (la petición del viaje). Si el hilo aún
+no llegó al último turno, el constructor lo incluye literal; nunca se pierde
+un turno ni se repite.
+
+Los tokens se estiman con CARACTERES_POR_TOKEN (el tokenizador de Gemini da
+unos 4 caracteres por token en español), sin llamadas a la API.
+"""
+import logging
+import os
+import re
+import string
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+from viajeia import secciones
+from viajeia.sesiones import LARGO_RESUMEN
+
+logger = logging.getLogger(__name__)
+
+CARACTERES_POR_TOKEN = 4
+# Tope del bloque de contexto (resumen + turnos sin resumir) de un seguimiento
+MAX_TOKENS = int(os.getenv('CONTEXTO_MAX_TOKENS', '350'))
+# Tope del resumen acumulado dentro de ese bloque
+RESUMEN_TOKENS = int(os.getenv('CONTEXTO_RESUMEN_TOKENS', '200'))
+# Tope de cada parte de un turno: pregunta y respuesta al resumirlo, y respuesta literal
+PREGUNTA_TOKENS = 30
+PETICION_TOKENS = 60  # la primera pregunta: destino, fechas, presupuesto e intereses
+RESPUESTA_TOKENS = 40
+# Menos que el resumen de LARGO_RESUMEN caracteres que guarda el historial, para cortarlo en una frase
+RECIENTE_TOKENS = 45
+
+_FIN_FRASE = re.compile(r'(?<=[.!?…])\s+')
+
+_CABECERA = '\n\nCONTEXTO DE LA CONVERSACIÓN ANTERIOR:\n'
+_CABECERA_RESUMEN = '\nResumen:\n'
+_CABECERA_RECIENTES = '\nÚltimas interacciones:'
+
+
+def estimar_tokens(texto):
+    return (len(texto) + CARACTERES_POR_TOKEN - 1) // CARACTERES_POR_TOKEN
+
+
+class Plantilla:
+    """
+    Plantilla de str.format analizada una sola vez al importar
+    Rellenarla es unir los trozos, y los tokens del texto fijo ya están contados
+    """
+
+    def __init__(self, texto):
+        self._trozos = [(literal, campo) for literal, campo, _, _ in string.Formatter().parse(texto)]
+        self.campos = tuple(campo for _, campo in self._trozos if campo)
+        self.tokens_fijos = estimar_tokens(''.join(literal for literal, _ in self._trozos))
+
+    def rellenar(self, **valores):
+        return ''.join(literal + (valores[campo] if campo else '') for literal, campo in self._trozos)
+
+
+def recortar(texto, max_tokens):
+    """Texto dentro de max_tokens, cortado al final de una frase o, si no hay, de una palabra"""
+    texto = ' '.join(texto.replace('**', '').split())
+    limite = max_tokens * CARACTERES_POR_TOKEN
+    if len(texto) <= limite:
+        return texto
+    corte = texto[:limite]
+    fin = max(corte.rfind(signo) for signo in '.!?…')
+    if fin >= limite // 2:
+        return corte[:fin + 1]
+    espacio = corte.rfind(' ', 0, limite - 1)
+    return (corte[:espacio] if espacio > 0 else corte[:limite - 1]).rstrip(' ,;:') + '…'
+
+
+def ideas(respuesta):
+    """
+    Frases clave de una respuesta: en un itinerario, la primera línea de cada
+    sección; en una respuesta libre, sus frases
+    """
+    lineas = [linea.strip() for linea in respuesta.splitlines() if linea.strip()]
+    claves = []
+    seccion = None
+    for linea in lineas:
+        titulo = secciones.titulo(linea)
+        if titulo:
+            seccion, resto = titulo
+            if resto:
+                claves.append(f'{seccion.capitalize()}: {resto}')
+                seccion = None
+        elif seccion:
+            claves.append(f"{seccion.capitalize()}: {linea.lstrip('•-* ')}")
+            seccion = None
+    if claves:
+        return claves
+    return [frase for frase in _FIN_FRASE.split(' '.join(lineas)) if frase]
+
+
+def condensar(respuesta, max_tokens):
+    """Primeras frases clave de una respuesta que caben en max_tokens"""
+    partes = []
+    usados = 0
+    for idea in ideas(respuesta):
+        idea = recortar(idea, max_tokens)
+        tokens = estimar_tokens(idea) + 1
+        if partes and usados + tokens > max_tokens:
+            break
+        partes.append(idea)
+        usados += tokens
+    return recortar(' '.join(partes), max_tokens)
+
+
+def huella(pregunta, respuesta):
+    """Identifica un turno igual con el historial compacto (cargar) y con el completo (turnos_completos)"""
+    return zlib.crc32(f'{pregunta}\0{respuesta[:LARGO_RESUMEN]}'.encode('utf-8'))
+
+
+def pendientes(turnos, resumen):
+    """Turnos del historial posteriores al último que entró en el resumen"""
+    if not resumen:
+        return list(turnos)
+    for i in range(len(turnos) - 1, -1, -1):
+        if huella(*turnos[i]) == resumen['huella']:
+            return list(turnos[i + 1:])
+    # El último turno resumido ya salió de la ventana: todos los de la ventana son posteriores
+    return list(turnos)
+
+
+def _linea(turno):
+    pregunta, respuesta = turno
+    return f'- {pregunta} → {respuesta}' if respuesta else f'- {pregunta}'
+
+
+def texto_resumen(resumen):
+    return '\n'.join(_linea(turno) for turno in resumen['turnos']) if resumen else ''
+
+
+def plegar(resumen, turnos, max_tokens=RESUMEN_TOKENS):
+    """
+    Resumen con los turnos nuevos añadidos y recortado a max_tokens
+    Retorna un diccionario JSON: turnos [[pregunta, respuesta condensada]],
+    huella del último turno incluido y total de turnos resumidos
+    """
+    resumen = dict(resumen) if resumen else {'turnos': [], 'huella': None, 'total': 0}
+    condensados = [list(t) for t in resumen['turnos']]
+    for pregunta, respuesta in turnos:
+        tope = PETICION_TOKENS if not condensados else PREGUNTA_TOKENS
+        condensados.append([recortar(pregunta, tope), condensar(respuesta, RESPUESTA_TOKENS)])
+
+    def tokens():
+        return sum(estimar_tokens(_linea(t)) + 1 for t in condensados)
+
+    # El primer turno (la petición del viaje) se conserva; los siguientes pierden primero la respuesta
+    posicion = 1
+    while tokens() > max_tokens and posicion < len(condensados) - 1:
+        condensados[posicion][1] = ''
+        posicion += 1
+    while tokens() > max_tokens and len(condensados) > 2:
+        del condensados[1]
+    if tokens() > max_tokens and condensados:
+        condensados[0][1] = ''
+
+    if turnos:
+        resumen['huella'] = huella(*turnos[-1])
+        resumen['total'] += len(turnos)
+    resumen['turnos'] = condensados
+    return resumen
+
+
+def construir(historial, resumen, max_tokens=MAX_TOKENS):
+    """
+    Bloque de contexto de un seguimiento dentro de max_tokens
+    Retorna (texto, uso) con los tokens y turnos que entraron
+    """
+    resumido = texto_resumen(resumen)
+    if estimar_tokens(resumido) > RESUMEN_TOKENS:
+        resumido = recortar(resumido, RESUMEN_TOKENS)
+    disponible = max_tokens - estimar_tokens(_CABECERA + _CABECERA_RESUMEN + _CABECERA_RECIENTES + resumido)
+
+    # Turnos que el resumen aún no tiene, del más reciente al más antiguo mientras quepan
+    recientes = []
+    sin_resumir = pendientes(historial, resumen)
+    for pregunta, respuesta in reversed(sin_resumir):
+        bloque = f'\nPregunta: {recortar(pregunta, PREGUNTA_TOKENS)}\nRespuesta: {recortar(respuesta, RECIENTE_TOKENS)}\n'
+        tokens = estimar_tokens(bloque)
+        if tokens > disponible:
+            break
+        recientes.insert(0, bloque)
+        disponible -= tokens
+    if len(recientes) < len(sin_resumir):
+        logger.info(f"Contexto: {len(sin_resumir) - len(recientes)} turnos sin resumir no caben en {max_tokens} tokens")
+
+    texto = ''
+    if resumido or recientes:
+        texto = _CABECERA
+        if resumido:
+            texto += f'{_CABECERA_RESUMEN}{resumido}\n'
+        if recientes:
+            texto += _CABECERA_RECIENTES + ''.join(recientes)
+    uso = {
+        'tokens_contexto': estimar_tokens(texto),
+        'turnos_resumidos': resumen['total'] if resumen else 0,
+        'turnos_literales': len(recientes)
+    }
+    return texto, uso
+
+
+# Actualización del resumen fuera de la petición: un hilo por proceso y, como
+# mucho, una actualización en cola por sesión (lee los turnos al ejecutarse)
+_executor = None
+_executor_pid = None
+_lock = threading.Lock()
+_en_cola = set()
+_actualizados = 0
+_errores = 0
+
+
+def _obtener_executor():
+    global _executor, _executor_pid
+    pid = os.getpid()
+    if _executor is None or _executor_pid != pid:
+        with _lock:
+            if _executor is None or _executor_pid != pid:
+                _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='resumen')
+                _executor_pid = pid
+                _en_cola.clear()
+    return _executor
+
+
+def actualizar_resumen(almacen, session_id):
+    """Pliega en el resumen de la sesión los turnos que aún no tiene"""
+    global _actualizados, _errores
+    with _lock:
+        _en_cola.discard(session_id)
+    try:
+        turnos = almacen.turnos_completos(session_id)
+        resumen = almacen.cargar_resumen(session_id)
+        nuevos = pendientes(turnos, resumen)
+        if not nuevos:
+            return
+        almacen.guardar_resumen(session_id, plegar(resumen, nuevos))
+        with _lock:
+            _actualizados += 1
+    except Exception as e:
+        with _lock:
+            _errores += 1
+        logger.error(f"Error actualizando el resumen de la sesión {session_id}: {str(e)}")
+
+
+def programar_resumen(almacen, session_id):
+    """Encola la actualización del resumen tras guardar un turno (no espera)"""
+    executor = _obtener_executor()
+    with _lock:
+        if session_id in _en_cola:
+            return
+        _en_cola.add(session_id)
+    executor.submit(actualizar_resumen, almacen, session_id)
+
+
+# Tamaño de los prompts construidos, por tipo de pregunta
+_prompts = {}
+
+
+def registrar(tipo, tokens):
+    with _lock:
+        datos = _prompts.setdefault(tipo, {'prompts': 0, 'tokens': 0, 'tokens_max': 0})
+        datos['prompts'] += 1
+        datos['tokens'] += tokens
+        datos['tokens_max'] = max(datos['tokens_max'], tokens)
+
+
+def estadisticas():
+    with _lock:
+        prompts = {
+            tipo: dict(datos, tokens_medios=round(datos['tokens'] / datos['prompts'], 1))
+            for tipo, datos in _prompts.items()
+        }
+        return {
+            'max_tokens': MAX_TOKENS,
+            'resumen_tokens': RESUMEN_TOKENS,
+            'prompts': prompts,
+            'resumenes_actualizados': _actualizados,
+            'resumenes_en_cola': len(_en_cola),
+            'errores': _errores
+        }
@@ -0,0 +1,210 @@
+"""
+Detección de destinos conocidos en el texto de una pregunta
+
+Autómata Aho-Corasick construido una sola vez, en la primera búsqueda, con
+los alias del gazetteer (viajeia.gazetteer), normalizados (minúsculas y sin
+acentos). La pregunta se recorre una sola vez, así que el coste no depende de
+cuántos nombres haya en el índice. Solo cuentan las coincidencias con límite de
+palabra en ambos lados ("lima" no aparece en "climate" ni "roma" en "aroma")
+y, si dos se solapan, gana la más larga ("ciudad de mexico" frente a "mexico").
+Los destinos que no son de la lista curada solo cuentan si el usuario los
+escribió con mayúscula, para que "oslo" o "la paz" en minúsculas no disparen
+nada por accidente.
+"""
+import threading
+import unicodedata
+from functools import lru_cache
+
+from viajeia.ciudades import normalizar
+from viajeia.gazetteer import gazetteer
+
+
+def _plegar(caracter):
+    """Un carácter en minúscula y sin acentos (puede quedar vacío o ser más de uno)"""
+    texto = unicodedata.normalize('NFKD', caracter.lower())
+    return ''.join(c for c in texto if not unicodedata.combining(c))
+
+
+# Tabla de str.translate para Latin-1 y Latin extendido: cada carácter con diacríticos
+# se pliega a uno solo, así el texto plegado conserva las posiciones del original
+_TABLA = ''.join(
+    _p if len(_p := _plegar(chr(codigo))) == 1 and codigo >= 0xC0 else chr(codigo)
+    for codigo in range(0x250)
+)
+
+
+def plegar(texto):
+    """
+    Texto plegado y, para cada carácter plegado, su posición en el original
+    (None si son las mismas). Así una coincidencia sobre el texto plegado se
+    traduce al texto del usuario
+    """
+    plegado = texto.lower().translate(_TABLA)
+    if len(plegado) == len(texto):
+        return plegado, None
+    # Caso raro: algún carácter se pliega a cero o varios caracteres
+    partes = []
+    origen = []
+    for i, caracter in enumerate(texto):
+        for c in _plegar(caracter):
+            partes.append(c)
+            origen.append(i)
+    return ''.join(partes), origen
+
+
+def _es_palabra(caracter):
+    return caracter.isalnum()
+
+
+class BuscadorDestinos:
+    """
+    Autómata Aho-Corasick sobre alias normalizados -> valor
+    Los valores en `con_mayuscula` solo cuentan si el texto original empieza en mayúscula
+    """
+
+    def __init__(self, patrones, con_mayuscula=frozenset()):
+        self.con_mayuscula = con_mayuscula
+        # Nodo = índice; transiciones, enlace de fallo y salida (alias que terminan aquí)
+        self._hijos = [{}]
+        self._fallo = [0]
+        self._salida = [()]
+        for alias, valor in patrones.items():
+            self._agregar(normalizar(alias), valor)
+        self._enlazar()
+
+    def _agregar(self, alias, valor):
+        nodo = 0
+        for caracter in alias:
+            siguiente = self._hijos[nodo].get(caracter)
+            if siguiente is None:
+                siguiente = len(self._hijos)
+                self._hijos[nodo][caracter] = siguiente
+                self._hijos.append({})
+                self._fallo.append(0)
+                self._salida.append(())
+            nodo = siguiente
+        self._salida[nodo] = ((len(alias), valor),)
+
+    def _enlazar(self):
+        # Recorrido en anchura: el fallo de un nodo es el sufijo propio más largo que también está en el trie
+        cola = list(self._hijos[0].values())
+        for nodo in cola:
+            for caracter, hijo in self._hijos[nodo].items():
+                fallo = self._fallo[nodo]
+                while fallo and caracter not in self._hijos[fallo]:
+                    fallo = self._fallo[fallo]
+                self._fallo[hijo] = self._hijos[fallo].get(caracter, 0)
+                self._salida[hijo] = self._salida[hijo] + self._salida[self._fallo[hijo]]
+                cola.append(hijo)
+
+    @property
+    def nodos(self):
+        return len(self._hijos)
+
+    def coincidencias(self, texto):
+        """
+        Coincidencias con límite de palabra sobre un texto ya plegado
+        Retorna una lista de (inicio, fin, valor), con solapes
+        """
+        hijos, fallo, salida = self._hijos, self._fallo, self._salida
+        largo = len(texto)
+        encontradas = []
+        nodo = 0
+        for i, caracter in enumerate(texto):
+            siguiente = hijos[nodo].get(caracter)
+            while siguiente is None and nodo:
+                nodo = fallo[nodo]
+                siguiente = hijos[nodo].get(caracter)
+            nodo = siguiente or 0
+            if not salida[nodo]:
+                continue
+            fin = i + 1
+            if fin < largo and _es_palabra(texto[fin]):
+                continue
+            for longitud, valor in salida[nodo]:
+                inicio = fin - longitud
+                if inicio == 0 or not _es_palabra(texto[inicio - 1]):
+                    encontradas.append((inicio, fin, valor))
+        return encontradas
+
+    @staticmethod
+    def sin_solapes(encontradas):
+        """Primero la que empieza antes y, a igual inicio, la más larga; en orden de aparición"""
+        encontradas.sort(key=lambda c: (c[0], -c[1]))
+        resultado = []
+        limite = 0
+        for inicio, fin, valor in encontradas:
+            if inicio >= limite:
+                resultado.append((inicio, fin, valor))
+                limite = fin
+        return resultado
+
+    def buscar(self, texto, mayusculas=True):
+        """
+        Destinos mencionados en un texto libre, en orden de aparición y sin repetir
+        Retorna una lista de (texto tal como lo escribió el usuario, valor)
+        Con mayusculas=False no se aplica la regla de `con_mayuscula`
+        """
+        plegado, origen = plegar(texto)
+        encontradas = []
+        for inicio, fin, valor in self.coincidencias(plegado):
+            if origen is not None:
+                inicio, fin = origen[inicio], origen[fin - 1] + 1
+            if mayusculas and valor in self.con_mayuscula and not texto[inicio].isupper():
+                continue
+            encontradas.append((inicio, fin, valor))
+        vistos = set()
+        destinos = []
+        for inicio, fin, valor in self.sin_solapes(encontradas):
+            if valor in vistos:
+                continue
+            vistos.add(valor)
+            destinos.append((texto[inicio:fin], valor))
+        return destinos
+
+
+def _crear_buscador():
+    """Autómata con los alias del gazetteer; el valor es la posición del destino en el índice"""
+    patrones = {}
+    no_curados = set()
+    for alias, indice in gazetteer.alias():
+        patrones[alias] = indice
+        if not gazetteer.curado(indice):
+            no_curados.add(indice)
+    return BuscadorDestinos(patrones, frozenset(no_curados))
+
+
+_buscador = None
+_buscador_lock = threading.Lock()
+
+
+def obtener_buscador():
+    """Autómata del proceso, construido en la primera búsqueda (no al importar)"""
+    global _buscador
+    if _buscador is None:
+        with _buscador_lock:
+            if _buscador is None:
+                _buscador = _crear_buscador()
+    return _buscador
+
+
+def encontrar(texto):
+    """Destinos conocidos en el texto: lista de (texto original, Destino)"""
+    return [(original, gazetteer.destino(indice)) for original, indice in obtener_buscador().buscar(texto)]
+
+
+@lru_cache(maxsize=4096)
+def resolver(nombre):
+    """
+    Destino canónico (viajeia.gazetteer.Destino) de un nombre o texto que lo contenga
+    Retorna None si no está en el gazetteer
+    """
+    if not nombre:
+        return None
+    indice = gazetteer.buscar_alias(nombre)
+    if indice is None:
+        encontrados = obtener_buscador().buscar(nombre, mayusculas=False)
+        if not encontrados:
+            return None
+        indice = encontrados[0][1]
+    return gazetteer.destino(indice)
@@ -0,0 +1,153 @@
+"""
+Tabla local de tipos de cambio
+
+Se descarga la tabla completa de exchangerate-api una vez (pasando por la
+caché escalonada, así que los workers comparten la descarga) y se guarda como
+un array compacto de tasas respecto a USD indexado por código de moneda.
+Cualquier par base/destino se resuelve con tasas cruzadas sin llamadas de red.
+Cada refresco construye una tabla nueva y la sustituye con una sola asignación.
+"""
+import logging
+import os
+import threading
+import time
+from array import array
+
+from viajeia import circuitos, http_cliente
+from viajeia.cache import cacheado
+from viajeia.enriquecimiento import obtener_executor
+
+logger = logging.getLogger(__name__)
+
+URL_TASAS = 'https://api.exchangerate-api.com/v4/latest/USD'
+# Cada cuánto se revisa la caché en busca de una tabla más nueva (la descarga real sigue el TTL de 'tipo_cambio')
+REFRESCO = float(os.getenv('DIVISAS_REFRESCO', '3600'))
+
+
+class TablaTasas:
+    """Tasas respecto a USD en un array de doubles indexado por código de moneda"""
+
+    __slots__ = ('indice', 'tasas', 'fecha', 'cargada_en')
+
+    def __init__(self, rates, fecha=''):
+        codigos = sorted(rates)
+        self.indice = {codigo: i for i, codigo in enumerate(codigos)}
+        self.tasas = array('d', (float(rates[codigo]) for codigo in codigos))
+        self.fecha = fecha
+        self.cargada_en = time.time()
+
+    def tasa(self, base, destino):
+        """Unidades de destino por 1 unidad de base, o None si falta alguna moneda"""
+        i = self.indice.get(base)
+        j = self.indice.get(destino)
+        if i is None or j is None or not self.tasas[i]:
+            return None
+        return self.tasas[j] / self.tasas[i]
+
+    def convertir(self, monto, base, destino):
+        """Convierte un monto entre dos monedas cualesquiera"""
+        tasa = self.tasa(base, destino)
+        return None if tasa is None else monto * tasa
+
+
+def procesar_tasas(response):
+    """Interpreta la respuesta de exchangerate-api (requests o httpx)"""
+    if response.status_code == 200:
+        data = response.json()
+        if data.get('rates'):
+            return {'rates': data['rates'], 'fecha': data.get('date', '')}
+    logger.warning(f"exchangerate-api error: {response.status_code}")
+    return None
+
+
+@cacheado('tipo_cambio')
+def descargar_tasas():
+    """
+    Descarga la tabla completa de tasas (base USD)
+    Retorna {'rates': {...}, 'fecha': 'YYYY-MM-DD'} o None si hay error
+    """
+    try:
+        return procesar_tasas(http_cliente.get(URL_TASAS, timeout=5))
+    except circuitos.CircuitoAbierto:
+        # No se cachea como fallo: se vuelve a consultar cuando el servicio se recupere
+        raise
+    except Exception as e:
+        logger.error(f"Error descargando tipos de cambio: {str(e)}")
+    return None
+
+
+_tabla = None
+_lock = threading.Lock()
+_refrescando = False
+
+
+def publicar(datos):
+    """Construye una tabla nueva con los datos descargados y la publica con una asignación atómica"""
+    global _tabla
+    if datos:
+        _tabla = TablaTasas(datos['rates'], datos.get('fecha', ''))
+    return _tabla
+
+
+def tabla_vigente():
+    """Tabla publicada (o None) y si ya toca buscar una más nueva"""
+    tabla = _tabla
+    return tabla, tabla is None or time.time() - tabla.cargada_en > REFRESCO
+
+
+def _cargar():
+    return publicar(descargar_tasas())
+
+
+def _refrescar_en_segundo_plano():
+    global _refrescando
+
+    def tarea():
+        global _refrescando
+        try:
+            _cargar()
+        finally:
+            _refrescando = False
+
+    with _lock:
+        if _refrescando:
+            return
+        _refrescando = True
+    obtener_executor().submit(tarea)
+
+
+def obtener_tabla():
+    """
+    Retorna la tabla vigente
+    Solo la primera llamada del proceso espera a la descarga; después, si la
+    tabla envejece, se sigue usando mientras se refresca en segundo plano
+    """
+    tabla = _tabla
+    if tabla is None:
+        return _cargar()
+    if time.time() - tabla.cargada_en > REFRESCO:
+        _refrescar_en_segundo_plano()
+    return tabla
+
+
+def tipo_cambio(base='USD', destino='EUR'):
+    """
+    Tipo de cambio entre dos monedas a partir de la tabla local
+    Retorna el diccionario que espera el frontend o None si no hay datos
+    """
+    return formatear(obtener_tabla(), base, destino)
+
+
+def formatear(tabla, base, destino):
+    """Diccionario de tipo de cambio que espera el frontend a partir de una tabla"""
+    if tabla is None:
+        return None
+    tasa = tabla.tasa(base.upper(), destino.upper())
+    if tasa is None:
+        return None
+    return {
+        'base': base.upper(),
+        'target': destino.upper(),
+        'rate': round(tasa, 4),
+        'fecha': tabla.fecha
+    }
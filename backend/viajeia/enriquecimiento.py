@@ -0,0 +1,87 @@
+"""
+Etapa de enriquecimiento del destino
+
+Lanza en paralelo las consultas de clima, fotos, tipo de cambio y diferencia
+horaria para que la petición solo espere a la más lenta, mientras el hilo de
+la petición sigue con la generación de Gemini. Ninguna espera pasa del plazo
+de la petición (viajeia.plazos). Cada consulta se mide como una etapa con su
+nombre (viajeia.metricas), hasta que termina y no solo lo que se la esperó.
+"""
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FuturoPendiente
+
+from viajeia import metricas, plazos
+from viajeia.circuitos import CircuitoAbierto
+
+logger = logging.getLogger(__name__)
+
+# Hilos por proceso para las consultas externas (4 por petición como máximo)
+MAX_HILOS = int(os.getenv('ENRIQUECIMIENTO_HILOS', '16'))
+
+_executor = None
+_executor_pid = None
+_lock = threading.Lock()
+
+
+def obtener_executor():
+    """
+    Retorna el pool de hilos del proceso actual
+    Se crea de forma perezosa para que cada worker de gunicorn tenga el suyo
+    (con preload_app = True el módulo se importa antes del fork)
+    """
+    global _executor, _executor_pid
+    pid = os.getpid()
+    if _executor is None or _executor_pid != pid:
+        with _lock:
+            if _executor is None or _executor_pid != pid:
+                _executor = ThreadPoolExecutor(max_workers=MAX_HILOS, thread_name_prefix='enriquecimiento')
+                _executor_pid = pid
+    return _executor
+
+
+class Enriquecimiento:
+    """
+    Conjunto de consultas de enriquecimiento en curso para una petición
+    Cada consulta se lanza con un nombre y su resultado se recoge por ese nombre
+    """
+
+    def __init__(self):
+        self._futuros = {}
+
+    def lanzar(self, nombre, funcion, *args, **kwargs):
+        """Lanza una consulta en segundo plano y la registra con el nombre dado"""
+        self._futuros[nombre] = obtener_executor().submit(metricas.medir, nombre, funcion, *args, **kwargs)
+        return self
+
+    def lanzada(self, nombre):
+        """Indica si se lanzó una consulta con ese nombre"""
+        return nombre in self._futuros
+
+    def terminada(self, nombre):
+        """Indica si la consulta ya terminó (su resultado está disponible sin esperar)"""
+        futuro = self._futuros.get(nombre)
+        return futuro is not None and futuro.done()
+
+    def resultado(self, nombre, por_defecto=None, espera=None):
+        """
+        Espera el resultado de una consulta, como mucho `espera` segundos
+        Retorna por_defecto si la consulta no se lanzó, terminó con una excepción
+        o no terminó a tiempo (sigue en segundo plano y su resultado queda en la caché)
+        """
+        futuro = self._futuros.get(nombre)
+        if futuro is None:
+            return por_defecto
+        try:
+            return futuro.result(timeout=espera)
+        except FuturoPendiente:
+            plazos.omitida(nombre)
+            return por_defecto
+        except CircuitoAbierto as e:
+            logger.warning(f"Consulta de enriquecimiento '{nombre}' omitida: {str(e)}")
+            return por_defecto
+        except Exception as e:
+            logger.error(f"Error en la consulta de enriquecimiento '{nombre}': {str(e)}")
+            return por_defecto
@@ -0,0 +1,149 @@
+"""
+Pool de fotos de Unsplash por destino
+
+Una sola búsqueda trae una página grande (UNSPLASH_POOL fotos) que se guarda
+de forma compacta en la caché escalonada (fuente 'fotos', TTL de días). Cada
+petición recibe un subconjunto rotatorio del pool sin llamar a Unsplash, lo
+que cuida la cuota de 50 peticiones/hora del modo demo. Cuando el pool
+envejece se refresca en segundo plano (stale-while-revalidate de la caché).
+"""
+import itertools
+import logging
+import os
+import threading
+
+from viajeia import circuitos, destinos, http_cliente
+from viajeia.cache import cacheado
+
+logger = logging.getLogger(__name__)
+
+URL_BUSQUEDA = 'https://api.unsplash.com/search/photos'
+TAMANO_POOL = int(os.getenv('UNSPLASH_POOL', '30'))
+
+# Parámetros con los que Unsplash genera la URL 'regular', 'small' y 'thumb' a partir de 'raw'
+_TAMANOS = {
+    'url': '&cs=tinysrgb&fit=max&fm=jpg&q=80&w=1080',
+    'url_small': '&cs=tinysrgb&fit=max&fm=jpg&q=80&w=400',
+    'url_thumb': '&cs=tinysrgb&fit=max&fm=jpg&q=80&w=200',
+}
+
+_rotacion = {}
+_rotacion_lock = threading.Lock()
+
+
+def _api_key():
+    return os.getenv('UNSPLASH_ACCESS_KEY') or os.getenv('UNSPLASH_API_KEY')
+
+
+def peticion_busqueda(destino):
+    """Cabeceras y parámetros de la búsqueda del pool (None si no hay API key)"""
+    api_key = _api_key()
+    if not api_key:
+        return None
+    headers = {'Authorization': f'Client-ID {api_key}'}
+    params = {
+        'query': destino,
+        'per_page': TAMANO_POOL,
+        'orientation': 'landscape',
+        'order_by': 'popularity'
+    }
+    return headers, params
+
+
+def procesar_busqueda(response, destino):
+    """
+    Interpreta la respuesta de Unsplash (requests o httpx)
+    Retorna una lista compacta [raw, autor, autor_url, descripcion] por foto
+    """
+    if response.status_code == 200:
+        resultados = response.json().get('results') or []
+        pool = [
+            [
+                foto['urls']['raw'],
+                foto['user']['name'],
+                foto['user']['links']['html'],
+                foto.get('description', '') or foto.get('alt_description', '') or '',
+            ]
+            for foto in resultados
+        ]
+        if pool:
+            logger.info(f"Unsplash: pool de {len(pool)} fotos para '{destino}'")
+        else:
+            logger.warning(f"Unsplash: No se encontraron resultados para '{destino}'")
+        return pool
+    elif response.status_code == 401:
+        logger.error("Unsplash API error 401: API Key inválida o no autorizada")
+    elif response.status_code == 403:
+        logger.error("Unsplash API error 403: Acceso denegado - verifica tu API key")
+    else:
+        logger.warning(f"Unsplash API error: {response.status_code} - {response.text[:200]}")
+    return []
+
+
+@cacheado('fotos')
+def descargar_pool(destino):
+    """
+    Busca una página grande de fotos del destino en Unsplash
+    Retorna una lista compacta [raw, autor, autor_url, descripcion] por foto
+    (lista vacía si no hay resultados o hay error; se cachea como fallo)
+    """
+    peticion = peticion_busqueda(destino)
+    if not peticion:
+        return []
+
+    try:
+        headers, params = peticion
+        response = http_cliente.get(URL_BUSQUEDA, headers=headers, params=params, timeout=5)
+        return procesar_busqueda(response, destino)
+    except circuitos.CircuitoAbierto:
+        # No se cachea como fallo: se vuelve a consultar cuando el servicio se recupere
+        raise
+    except Exception as e:
+        logger.error(f"Error obteniendo fotos de Unsplash: {str(e)}")
+
+    return []
+
+
+def _expandir(foto, destino):
+    raw, autor, autor_url, descripcion = foto
+    datos = {clave: raw + sufijo for clave, sufijo in _TAMANOS.items()}
+    datos['autor'] = autor
+    datos['autor_url'] = autor_url
+    datos['descripcion'] = descripcion or f'Foto de {destino}'
+    return datos
+
+
+def clave_pool(destino):
+    """
+    Nombre con el que se busca y guarda el pool: el canónico del gazetteer hace
+    que "Paris" y "París" lo compartan
+    """
+    encontrado = destinos.resolver(destino)
+    return encontrado.nombre if encontrado else destino.strip()
+
+
+def rotar(clave, pool, destino, cantidad=3):
+    """Subconjunto rotatorio de `cantidad` fotos del pool, ya expandidas"""
+    if not pool:
+        return []
+    if len(pool) <= cantidad:
+        return [_expandir(foto, destino) for foto in pool]
+
+    with _rotacion_lock:
+        contador = _rotacion.get(clave)
+        if contador is None:
+            if len(_rotacion) >= 4096:
+                _rotacion.clear()
+            contador = _rotacion[clave] = itertools.count()
+        inicio = next(contador) * cantidad
+    return [_expandir(pool[(inicio + i) % len(pool)], destino) for i in range(cantidad)]
+
+
+def seleccionar(destino, cantidad=3):
+    """
+    Retorna `cantidad` fotos del pool del destino, rotando en cada llamada
+    Cada foto lleva las claves que usa el frontend (url, url_small, url_thumb,
+    autor, autor_url, descripcion)
+    """
+    clave = clave_pool(destino)
+    return rotar(clave, descargar_pool(clave), destino, cantidad)
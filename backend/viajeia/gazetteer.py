@@ -0,0 +1,213 @@
+"""
+Índice local de destinos (gazetteer)
+
+Cada destino tiene un ID canónico ('fr-paris'), nombre, país, zona horaria
+IANA, moneda y coordenadas; los alias normalizados (minúsculas y sin acentos)
+apuntan a un único destino. Extracción, zona horaria, moneda y clima se
+resuelven todos a ese ID, sin llamadas de red.
+
+El índice vive en viajeia/datos/gazetteer.bin (lo genera construir-gazetteer.py)
+y se abre con mmap: el arranque no parsea nada y las páginas se cargan del
+disco solo cuando se consultan, así que el coste en memoria no crece con el
+número de ciudades. Formato (little-endian):
+
+    cabecera   <4sHxxIII   b'VJGZ', versión, n_destinos, n_alias, tamaño de cadenas
+    destinos   <ffIHIHIH2s3sBI por destino, ordenados por ID:
+               lat, lon, (offset, largo) de ID, nombre y zona, país, moneda,
+               flags (1 = curado) y población
+    alias      <IHI por alias, ordenados por los bytes del alias:
+               (offset, largo) del alias e índice del destino
+    cadenas    UTF-8 concatenado
+"""
+import logging
+import mmap
+import os
+import struct
+from collections import namedtuple
+from pathlib import Path
+
+from viajeia.ciudades import CIUDADES, MONEDA_POR_PAIS, normalizar
+
+logger = logging.getLogger(__name__)
+
+RUTA = os.getenv('VIAJEIA_GAZETTEER', str(Path(__file__).parent / 'datos' / 'gazetteer.bin'))
+
+MAGIA = b'VJGZ'
+VERSION = 1
+_CABECERA = struct.Struct('<4sHxxIII')
+_DESTINO = struct.Struct('<ffIHIHIH2s3sBI')
+_ALIAS = struct.Struct('<IHI')
+
+CURADO = 1
+
+Destino = namedtuple('Destino', 'id nombre pais zona moneda lat lon curado')
+
+
+def slug(texto):
+    """Texto normalizado con guiones: 'Mexico City' -> 'mexico-city'"""
+    return '-'.join(''.join(c if c.isalnum() else ' ' for c in normalizar(texto)).split())
+
+
+def id_destino(pais, nombre):
+    return f'{pais.lower()}-{slug(nombre)}'
+
+
+def entradas_curadas():
+    """Destinos de ciudades.CIUDADES como (destino, poblacion, alias) para serializar()"""
+    entradas = []
+    for nombre, (pais, zona, lat, lon, alias) in CIUDADES.items():
+        destino = Destino(id_destino(pais, nombre), nombre, pais, zona,
+                          MONEDA_POR_PAIS.get(pais, ''), lat, lon, True)
+        entradas.append((destino, 0, alias + (nombre,)))
+    return entradas
+
+
+def serializar(entradas):
+    """
+    Índice binario a partir de una lista de (Destino, poblacion, alias)
+    Si un alias se repite gana el destino curado y, entre iguales, el más poblado
+    """
+    por_id = {}
+    for destino, poblacion, alias in entradas:
+        if destino.id in por_id:
+            # Mismo destino desde dos fuentes: se queda el primero y se suman sus alias
+            anterior, poblacion_anterior, alias_anterior = por_id[destino.id]
+            por_id[destino.id] = (anterior, max(poblacion, poblacion_anterior), alias_anterior + tuple(alias))
+        else:
+            por_id[destino.id] = (destino, poblacion, tuple(alias))
+
+    ordenados = sorted(por_id.values(), key=lambda e: e[0].id)
+    indice = {destino.id: i for i, (destino, _, _) in enumerate(ordenados)}
+
+    mejor = {}
+    for destino, poblacion, alias in ordenados:
+        prioridad = (destino.curado, poblacion)
+        for a in alias:
+            clave = normalizar(a).encode()
+            if not clave:
+                continue
+            actual = mejor.get(clave)
+            if actual is None or prioridad > actual[0]:
+                mejor[clave] = (prioridad, indice[destino.id])
+
+    cadenas = bytearray()
+    posiciones = {}
+
+    def cadena(texto):
+        datos = texto.encode() if isinstance(texto, str) else texto
+        if datos not in posiciones:
+            posiciones[datos] = len(cadenas)
+            cadenas.extend(datos)
+        return posiciones[datos], len(datos)
+
+    registros = bytearray()
+    for destino, poblacion, _ in ordenados:
+        registros += _DESTINO.pack(
+            destino.lat, destino.lon, *cadena(destino.id), *cadena(destino.nombre), *cadena(destino.zona),
+            destino.pais.encode(), destino.moneda.encode().ljust(3), CURADO if destino.curado else 0, poblacion
+        )
+    for clave in sorted(mejor):
+        registros += _ALIAS.pack(*cadena(clave), mejor[clave][1])
+
+    cabecera = _CABECERA.pack(MAGIA, VERSION, len(ordenados), len(mejor), len(cadenas))
+    return bytes(cabecera + registros + cadenas)
+
+
+def escribir(ruta, entradas):
+    """Escribe el índice de forma atómica (los procesos que lo tienen mapeado siguen con el anterior)"""
+    ruta = Path(ruta)
+    ruta.parent.mkdir(parents=True, exist_ok=True)
+    temporal = ruta.with_suffix('.tmp')
+    temporal.write_bytes(serializar(entradas))
+    os.replace(temporal, ruta)
+
+
+class Gazetteer:
+    """Lectura del índice binario (mmap o bytes) con búsqueda binaria por alias e ID"""
+
+    def __init__(self, datos):
+        self._datos = datos
+        magia, version, self.n_destinos, self.n_alias, _ = _CABECERA.unpack_from(datos, 0)
+        if magia != MAGIA or version != VERSION:
+            raise ValueError(f'Gazetteer con formato desconocido ({magia!r}, versión {version})')
+        self._inicio_destinos = _CABECERA.size
+        self._inicio_alias = self._inicio_destinos + self.n_destinos * _DESTINO.size
+        self._inicio_cadenas = self._inicio_alias + self.n_alias * _ALIAS.size
+
+    @classmethod
+    def abrir(cls, ruta):
+        with open(ruta, 'rb') as archivo:
+            return cls(mmap.mmap(archivo.fileno(), 0, access=mmap.ACCESS_READ))
+
+    def __len__(self):
+        return self.n_destinos
+
+    def _bytes(self, offset, largo):
+        inicio = self._inicio_cadenas + offset
+        return self._datos[inicio:inicio + largo]
+
+    def destino(self, indice):
+        """Destino en la posición `indice` del índice"""
+        (lat, lon, id_off, id_len, nombre_off, nombre_len, zona_off, zona_len,
+         pais, moneda, flags, _poblacion) = _DESTINO.unpack_from(self._datos, self._inicio_destinos + indice * _DESTINO.size)
+        return Destino(
+            self._bytes(id_off, id_len).decode(), self._bytes(nombre_off, nombre_len).decode(),
+            pais.decode(), self._bytes(zona_off, zona_len).decode(), moneda.decode().strip(),
+            round(lat, 4), round(lon, 4), bool(flags & CURADO)
+        )
+
+    def _alias(self, posicion):
+        offset, largo, indice = _ALIAS.unpack_from(self._datos, self._inicio_alias + posicion * _ALIAS.size)
+        return self._bytes(offset, largo), indice
+
+    def buscar_alias(self, nombre):
+        """Índice del destino con ese alias exacto (tras normalizar) o None"""
+        clave = normalizar(nombre).encode()
+        bajo, alto = 0, self.n_alias
+        while bajo < alto:
+            medio = (bajo + alto) // 2
+            alias, indice = self._alias(medio)
+            if alias < clave:
+                bajo = medio + 1
+            elif alias > clave:
+                alto = medio
+            else:
+                return indice
+        return None
+
+    def por_id(self, id_buscado):
+        """Destino con ese ID canónico o None"""
+        bajo, alto = 0, self.n_destinos
+        while bajo < alto:
+            medio = (bajo + alto) // 2
+            destino = self.destino(medio)
+            if destino.id < id_buscado:
+                bajo = medio + 1
+            elif destino.id > id_buscado:
+                alto = medio
+            else:
+                return destino
+        return None
+
+    def alias(self):
+        """Todos los (alias normalizado, índice del destino), en orden"""
+        for posicion in range(self.n_alias):
+            alias, indice = self._alias(posicion)
+            yield alias.decode(), indice
+
+    def curado(self, indice):
+        """Si el destino es de la lista curada (sin leer el registro completo)"""
+        flags = self._datos[self._inicio_destinos + (indice + 1) * _DESTINO.size - 5]
+        return bool(flags & CURADO)
+
+
+def cargar(ruta=RUTA):
+    """Índice empaquetado; si no está se construye en memoria solo con los destinos curados"""
+    try:
+        return Gazetteer.abrir(ruta)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Gazetteer no disponible en {ruta}, usando solo destinos curados: {str(e)}")
+        return Gazetteer(serializar(entradas_curadas()))
+
+
+gazetteer = cargar()
@@ -0,0 +1,196 @@
+"""
+Cliente HTTP compartido para las APIs externas (Weatherbit, Unsplash y
+exchangerate-api)
+
+Mantiene una sesión de requests por proceso con pools keep-alive por host,
+tamaño acotado y reintentos con backoff ante 429 y 5xx. La sesión se crea
+después del fork (ver post_fork en gunicorn_config.py) para que los workers
+nunca compartan sockets.
+
+requests (~0,1 s de import) se importa al crear la sesión, en la primera
+petición, y no al importar el módulo: así un arranque en frío que solo
+atiende un health check o un preflight no lo paga.
+"""
+import os
+import threading
+import time
+
+from viajeia import circuitos
+
+# Número de hosts distintos con pool propio
+POOL_HOSTS = int(os.getenv('HTTP_POOL_HOSTS', '8'))
+# Conexiones keep-alive máximas por host
+POOL_TAMANO = int(os.getenv('HTTP_POOL_TAMANO', '10'))
+# Segundos máximos esperando una conexión libre del pool
+POOL_ESPERA = float(os.getenv('HTTP_POOL_ESPERA', '2'))
+REINTENTOS = int(os.getenv('HTTP_REINTENTOS', '2'))
+BACKOFF = float(os.getenv('HTTP_BACKOFF', '0.3'))
+TIMEOUT = 5
+
+_sesion = None
+_sesion_pid = None
+_lock = threading.Lock()
+
+_estadisticas = {}
+_estadisticas_lock = threading.Lock()
+
+
+def _registrar(host, espera=None, conexion_nueva=False):
+    with _estadisticas_lock:
+        stats = _estadisticas.get(host)
+        if stats is None:
+            stats = _estadisticas[host] = {
+                'peticiones': 0,
+                'conexiones_nuevas': 0,
+                'espera_total': 0.0,
+                'espera_max': 0.0,
+            }
+        if conexion_nueva:
+            stats['conexiones_nuevas'] += 1
+        if espera is not None:
+            stats['peticiones'] += 1
+            stats['espera_total'] += espera
+            if espera > stats['espera_max']:
+                stats['espera_max'] = espera
+
+
+_adaptador_medido = None
+
+
+def _clase_adaptador():
+    """
+    HTTPAdapter cuyos pools registran estadísticas por host
+    Las clases heredan de requests/urllib3, así que se definen al crear la primera sesión
+    """
+    global _adaptador_medido
+    if _adaptador_medido is not None:
+        return _adaptador_medido
+
+    from requests.adapters import HTTPAdapter
+    from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+    class _MedicionPool:
+        """Mide cuánto se espera por una conexión y cuántas se abren de cero"""
+
+        def _get_conn(self, timeout=None):
+            # requests no pasa pool_timeout: con pool_block=True se esperaría sin límite
+            if timeout is None:
+                timeout = POOL_ESPERA
+            inicio = time.perf_counter()
+            conn = super()._get_conn(timeout=timeout)
+            _registrar(self.host, espera=time.perf_counter() - inicio)
+            return conn
+
+        def _new_conn(self):
+            _registrar(self.host, conexion_nueva=True)
+            return super()._new_conn()
+
+    class _PoolHTTP(_MedicionPool, HTTPConnectionPool):
+        pass
+
+    class _PoolHTTPS(_MedicionPool, HTTPSConnectionPool):
+        pass
+
+    class _AdaptadorMedido(HTTPAdapter):
+        def init_poolmanager(self, *args, **kwargs):
+            super().init_poolmanager(*args, **kwargs)
+            self.poolmanager.pool_classes_by_scheme = {'http': _PoolHTTP, 'https': _PoolHTTPS}
+
+    _adaptador_medido = _AdaptadorMedido
+    return _adaptador_medido
+
+
+def _crear_sesion():
+    import requests
+    from urllib3.util.retry import Retry
+
+    reintentos = Retry(
+        total=REINTENTOS,
+        backoff_factor=BACKOFF,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset(['GET']),
+        # Un Retry-After de cuota agotada puede ser de una hora: no bloquear la petición
+        respect_retry_after_header=False,
+        # Tras agotar reintentos se devuelve la última respuesta para que el llamador la registre
+        raise_on_status=False,
+    )
+    adaptador = _clase_adaptador()(
+        pool_connections=POOL_HOSTS,
+        pool_maxsize=POOL_TAMANO,
+        pool_block=True,
+        max_retries=reintentos,
+    )
+    sesion = requests.Session()
+    sesion.mount('https://', adaptador)
+    sesion.mount('http://', adaptador)
+    return sesion
+
+
+def obtener_sesion():
+    """Retorna la sesión HTTP del proceso actual, creándola si hace falta"""
+    global _sesion, _sesion_pid
+    pid = os.getpid()
+    if _sesion is None or _sesion_pid != pid:
+        with _lock:
+            if _sesion is None or _sesion_pid != pid:
+                _sesion = _crear_sesion()
+                _sesion_pid = pid
+                with _estadisticas_lock:
+                    _estadisticas.clear()
+    return _sesion
+
+
+def reiniciar():
+    """
+    Descarta la sesión heredada del proceso padre
+    Se llama en cada worker justo después del fork
+    """
+    global _sesion, _sesion_pid
+    with _lock:
+        _sesion = None
+        _sesion_pid = None
+    with _estadisticas_lock:
+        _estadisticas.clear()
+
+
+def get(url, timeout=TIMEOUT, **kwargs):
+    """
+    GET a través del pool compartido (mismos argumentos que requests.get)
+    Las APIs conocidas pasan por su cortacircuitos (viajeia.circuitos)
+    """
+    circuito = circuitos.por_url(url)
+    if circuito is None:
+        return obtener_sesion().get(url, timeout=timeout, **kwargs)
+    circuito.permitir()
+    try:
+        response = obtener_sesion().get(url, timeout=timeout, **kwargs)
+    except Exception as e:
+        circuito.fallo(e)
+        raise
+    return circuito.respuesta(response)
+
+
+def estadisticas():
+    """
+    Estadísticas de los pools por host en este worker
+    Retorna peticiones, conexiones nuevas, tasa de reutilización y tiempos de espera
+    """
+    with _estadisticas_lock:
+        copia = {host: dict(stats) for host, stats in _estadisticas.items()}
+    resultado = {}
+    for host, stats in copia.items():
+        peticiones = stats['peticiones']
+        reutilizadas = max(peticiones - stats['conexiones_nuevas'], 0)
+        resultado[host] = {
+            'peticiones': peticiones,
+            'conexiones_nuevas': stats['conexiones_nuevas'],
+            'tasa_reutilizacion': round(reutilizadas / peticiones, 4) if peticiones else 0.0,
+            'espera_media_ms': round(stats['espera_total'] / peticiones * 1000, 3) if peticiones else 0.0,
+            'espera_max_ms': round(stats['espera_max'] * 1000, 3),
+        }
+    return {
+        'pid': os.getpid(),
+        'pool_tamano': POOL_TAMANO,
+        'pool_hosts': POOL_HOSTS,
+        'hosts': resultado,
+    }
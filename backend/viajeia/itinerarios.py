@@ -0,0 +1,127 @@
+"""
+Caché de itinerarios de primera pregunta
+
+El formulario del frontend (handleFormSubmit) genera la primera pregunta con
+una plantilla fija, así que muchos usuarios piden prácticamente el mismo
+itinerario. La respuesta de cinco secciones se guarda con una clave canónica:
+destino, tramo de duración del viaje, tramo de presupuesto y preferencia.
+Las preguntas libres (que no siguen la plantilla) no se cachean. Cada
+entrada es un secciones.itinerario(): el texto y sus secciones ya separadas.
+"""
+import os
+import re
+from datetime import date
+
+from viajeia import ciudades, destinos, secciones
+from viajeia.cache import CacheEscalonada, registrar_fuente
+
+# Sin ventana stale: un itinerario vencido se regenera en la petición, no en segundo plano
+registrar_fuente('itinerario', 6 * 3600, 0, 0)
+MAX_ITINERARIOS = int(os.getenv('ITINERARIOS_MAX_ENTRADAS', '512'))
+ACTIVADA = os.getenv('ITINERARIOS_CACHE', 'true').lower() == 'true'
+
+cache_itinerarios = CacheEscalonada(max_entradas=MAX_ITINERARIOS)
+
+# Plantilla de handleFormSubmit en frontend/src/App.jsx (sobre el texto normalizado)
+_PLANTILLA = re.compile(
+    r'quiero planear un viaje a (?P<destino>.+?) '
+    r'desde (?P<inicio>\d{4}-\d{2}-\d{2}) hasta (?P<fin>\d{4}-\d{2}-\d{2})\. '
+    r'mi presupuesto aproximado es (?P<presupuesto>.+?) y prefiero (?P<preferencia>[a-z ]+)\.'
+    r'(?: ¿puedes ayudarme a planificar este viaje\?)?'
+)
+
+_PRESUPUESTOS = (
+    ('economico', 'economico'),
+    ('moderado', 'moderado'),
+    ('comfortable', 'comodo'),
+    ('comodo', 'comodo'),
+    ('lujo', 'lujo'),
+)
+
+
+def _tramo_dias(inicio, fin):
+    dias = (date.fromisoformat(fin) - date.fromisoformat(inicio)).days + 1
+    if dias < 1:
+        return None
+    if dias <= 3:
+        return '1-3'
+    if dias <= 7:
+        return '4-7'
+    if dias <= 14:
+        return '8-14'
+    return '15+'
+
+
+def _tramo_presupuesto(texto):
+    for palabra, tramo in _PRESUPUESTOS:
+        if palabra in texto:
+            return tramo
+    return None
+
+
+def pregunta_formulario(destino, fecha_inicio=None, fecha_fin=None, presupuesto=None, preferencia=None):
+    """
+    Primera pregunta de un destino con la plantilla de handleFormSubmit (con
+    todos los datos, la que reconoce esta caché); sin algún dato se omite esa parte
+    """
+    pregunta = f'Quiero planear un viaje a {destino}'
+    if fecha_inicio and fecha_fin:
+        pregunta += f' desde {fecha_inicio} hasta {fecha_fin}'
+    pregunta += '.'
+    if presupuesto:
+        pregunta += f' Mi presupuesto aproximado es {presupuesto}'
+        pregunta += f' y prefiero {preferencia}.' if preferencia else '.'
+    elif preferencia:
+        pregunta += f' Prefiero {preferencia}.'
+    return pregunta + ' ¿Puedes ayudarme a planificar este viaje?'
+
+
+def clave_itinerario(pregunta, destino=None):
+    """
+    Clave canónica de la pregunta si sigue la plantilla del formulario
+    Retorna None si la pregunta es libre o no se puede normalizar
+    """
+    if not ACTIVADA:
+        return None
+    coincidencia = _PLANTILLA.fullmatch(ciudades.normalizar(pregunta))
+    if not coincidencia:
+        return None
+    try:
+        tramo_dias = _tramo_dias(coincidencia.group('inicio'), coincidencia.group('fin'))
+    except ValueError:
+        return None
+    tramo_presupuesto = _tramo_presupuesto(coincidencia.group('presupuesto'))
+    if not tramo_dias or not tramo_presupuesto:
+        return None
+    nombre = destino or coincidencia.group('destino')
+    encontrado = destinos.resolver(nombre)
+    destino_canonico = encontrado.id if encontrado else ciudades.normalizar(nombre)
+    preferencia = coincidencia.group('preferencia').strip()
+    return f'itinerario:{destino_canonico}|{tramo_dias}|{tramo_presupuesto}|{preferencia}'
+
+
+def buscar(clave):
+    """Itinerario guardado para la clave (ver secciones.leer_itinerario) o None"""
+    if not clave:
+        return None
+    return cache_itinerarios.leer(clave)
+
+
+def generar(clave, funcion, prompt, plazo=None):
+    """
+    Itinerario de la clave generado con funcion(prompt, plazo) y guardado; si
+    otra petición ya lo está generando se espera su texto, como mucho hasta
+    el plazo (viajeia.coalescencia)
+    """
+    return cache_itinerarios.obtener('itinerario', clave, _generar, funcion, prompt, plazo, plazo_espera=plazo)
+
+
+def _generar(funcion, prompt, plazo):
+    """Itinerario generado con sus secciones separadas, tal como se guarda"""
+    return secciones.itinerario(*secciones.leer_itinerario(funcion(prompt, plazo)))
+
+
+def guardar(clave, respuesta, separadas=None):
+    """Guarda el itinerario generado con sus secciones (las respuestas vacías no se guardan)"""
+    if clave and respuesta and respuesta.strip():
+        cache_itinerarios.guardar('itinerario', clave, secciones.itinerario(respuesta, separadas))
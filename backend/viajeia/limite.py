@@ -0,0 +1,164 @@
+"""
+Rate limiting por IP compartido entre workers
+
+Cubo de tokens por clave: capacidad max_requests y recarga de max_requests
+tokens cada `window` segundos. Cada comprobación es O(1) y el estado por clave
+es fijo (tokens y último instante). Por defecto el estado vive en una tabla
+SQLite en WAL que comparten todos los workers de gunicorn de la máquina, así
+que el límite de 10/min es por IP y no por IP y worker; la comprobación es una
+única sentencia UPSERT ... RETURNING, atómica entre procesos.
+
+Una petición puede costar varios tokens (un lote de planes gasta uno por
+plan): se consumen todos o ninguno, así que un lote rechazado no gasta cubo.
+
+Una clave que lleva `window` segundos sin peticiones tiene el cubo lleno, que
+es lo mismo que no tener fila, así que la purga periódica de claves ociosas
+no cambia ninguna decisión.
+"""
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+RUTA_DB = os.getenv('VIAJEIA_LIMITES_DB', str(Path(tempfile.gettempdir()) / 'viajeia_limites.sqlite3'))
+# Cada cuántas comprobaciones se borran las claves ociosas
+PURGA_CADA = 1024
+
+
+class LimitadorMemoria:
+    """Cubos de tokens en un diccionario del proceso (sin SQLite o como respaldo)"""
+
+    nombre = 'memoria'
+
+    def __init__(self):
+        # clave -> [tokens, actualizado, ventana]; la lista se modifica en su sitio
+        self._cubos = {}
+        self._lock = threading.Lock()
+        self._comprobaciones = 0
+
+    def permitir(self, clave, max_requests=10, window=60, costo=1):
+        ahora = time.monotonic()
+        with self._lock:
+            self._comprobaciones += 1
+            if self._comprobaciones % PURGA_CADA == 0:
+                self._purgar(ahora)
+            cubo = self._cubos.get(clave)
+            if cubo is None:
+                cubo = self._cubos[clave] = [max_requests, ahora, window]
+            tokens = min(max_requests, cubo[0] + (ahora - cubo[1]) * max_requests / window)
+            cubo[1] = ahora
+            cubo[2] = window
+            if tokens >= costo:
+                cubo[0] = tokens - costo
+                return True
+            cubo[0] = tokens
+            return False
+
+    def _purgar(self, ahora):
+        ociosas = [clave for clave, cubo in self._cubos.items() if ahora - cubo[1] >= cubo[2]]
+        for clave in ociosas:
+            del self._cubos[clave]
+
+    def estadisticas(self):
+        with self._lock:
+            return {'backend': self.nombre, 'claves': len(self._cubos)}
+
+
+class LimitadorSQLite:
+    """Cubos de tokens en SQLite (WAL) compartidos por los workers de la máquina"""
+
+    nombre = 'sqlite'
+
+    # Recarga el cubo, consume ?5 tokens si los hay todos y retorna si la petición pasa
+    _CONSUMIR = (
+        'INSERT INTO limites (clave, tokens, actualizado, ventana, permitido) '
+        'VALUES (?1, ?2 - ?5 * (?2 >= ?5), ?3, ?4, ?2 >= ?5) '
+        'ON CONFLICT(clave) DO UPDATE SET '
+        'permitido = MIN(?2, tokens + (?3 - actualizado) * ?2 / ?4) >= ?5, '
+        'tokens = MIN(?2, tokens + (?3 - actualizado) * ?2 / ?4) '
+        '- ?5 * (MIN(?2, tokens + (?3 - actualizado) * ?2 / ?4) >= ?5), '
+        'actualizado = ?3, ventana = ?4 '
+        'RETURNING permitido'
+    )
+
+    def __init__(self, ruta_db=RUTA_DB):
+        self.ruta_db = ruta_db
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._comprobaciones = 0
+        self._conexion()
+
+    def _conexion(self):
+        """Conexión SQLite de este hilo y proceso"""
+        conexion = getattr(self._local, 'conexion', None)
+        if conexion is not None and self._local.pid == os.getpid():
+            return conexion
+        conexion = sqlite3.connect(self.ruta_db, timeout=1, isolation_level=None, check_same_thread=False)
+        conexion.execute('PRAGMA journal_mode=WAL')
+        conexion.execute('PRAGMA synchronous=NORMAL')
+        conexion.execute(
+            'CREATE TABLE IF NOT EXISTS limites ('
+            'clave TEXT PRIMARY KEY, tokens REAL NOT NULL, actualizado REAL NOT NULL, '
+            'ventana REAL NOT NULL, permitido INTEGER NOT NULL) WITHOUT ROWID'
+        )
+        self._local.conexion = conexion
+        self._local.pid = os.getpid()
+        return conexion
+
+    def permitir(self, clave, max_requests=10, window=60, costo=1):
+        conexion = self._conexion()
+        # Reloj de pared: time.monotonic() no es comparable entre procesos
+        ahora = time.time()
+        with self._lock:
+            self._comprobaciones += 1
+            purgar = self._comprobaciones % PURGA_CADA == 0
+        if purgar:
+            conexion.execute('DELETE FROM limites WHERE ?1 - actualizado >= ventana', (ahora,))
+        fila = conexion.execute(
+            self._CONSUMIR, (clave, float(max_requests), ahora, float(window), float(costo))
+        ).fetchone()
+        return bool(fila[0])
+
+    def estadisticas(self):
+        claves = self._conexion().execute('SELECT COUNT(*) FROM limites').fetchone()[0]
+        return {'backend': self.nombre, 'claves': claves, 'disco': self.ruta_db}
+
+
+class LimitadorSeguro:
+    """Envuelve el limitador SQLite: si la base falla en una comprobación, decide con uno en memoria"""
+
+    def __init__(self, principal, respaldo):
+        self.principal = principal
+        self.respaldo = respaldo
+        self.nombre = principal.nombre
+
+    def permitir(self, clave, max_requests=10, window=60, costo=1):
+        try:
+            return self.principal.permitir(clave, max_requests, window, costo)
+        except sqlite3.Error as e:
+            logger.warning(f"Rate limit en SQLite no disponible, usando memoria: {str(e)}")
+            return self.respaldo.permitir(clave, max_requests, window, costo)
+
+    def estadisticas(self):
+        try:
+            return self.principal.estadisticas()
+        except sqlite3.Error:
+            return self.respaldo.estadisticas()
+
+
+def crear_limitador():
+    """Limitador compartido en SQLite, o en memoria si RATE_LIMIT_BACKEND=memoria o no hay disco"""
+    if os.getenv('RATE_LIMIT_BACKEND', 'sqlite').lower() == 'sqlite' and RUTA_DB != 'off':
+        try:
+            return LimitadorSeguro(LimitadorSQLite(), LimitadorMemoria())
+        except sqlite3.Error as e:
+            logger.warning(f"Rate limit en SQLite desactivado ({RUTA_DB}): {str(e)}")
+    return LimitadorMemoria()
+
+
+limitador = crear_limitador()
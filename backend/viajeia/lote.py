@@ -0,0 +1,159 @@
+"""
+Planificación por lotes: comparar varios destinos con los mismos datos del viaje
+
+POST /api/planificar/batch recibe varios destinos (o preguntas libres), los
+datos comunes del formulario (fechas, presupuesto y preferencia) y un include
+común, y planifica cada uno como primera pregunta en su propia sesión nueva.
+Los planes corren a la vez, como mucho CONCURRENCIA por lote, y cada uno lanza
+su enriquecimiento en paralelo, así que el lote tarda lo que el plan más lento
+y no la suma.
+Comparten un solo Plazo (viajeia/plazos.py): el plan que no cabe falla solo.
+
+La respuesta trae una entrada por plan en el orden pedido: ok True y el mismo
+cuerpo que /api/planificar, u ok False con el error y su código. El lote solo
+responde con código de error si fallan todos los planes.
+"""
+import logging
+import os
+import secrets
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from viajeia import itinerarios, planificacion, plazos
+from viajeia.ciudades import normalizar
+
+logger = logging.getLogger(__name__)
+
+MAX_PLANES = int(os.getenv('LOTE_MAX_PLANES', '5'))
+# Planes de un mismo lote en curso a la vez
+CONCURRENCIA = int(os.getenv('LOTE_CONCURRENCIA', '3'))
+# Hilos por proceso para los planes de todos los lotes (aparte de los de enriquecimiento)
+MAX_HILOS = int(os.getenv('LOTE_HILOS', '8'))
+
+# Datos comunes del formulario que acepta el lote
+CAMPOS_COMUNES = ('fecha_inicio', 'fecha_fin', 'presupuesto', 'preferencia')
+
+_executor = None
+_executor_pid = None
+_lock = threading.Lock()
+
+
+def obtener_executor():
+    """Pool de hilos de los lotes del proceso actual (uno por worker, creado tras el fork)"""
+    global _executor, _executor_pid
+    pid = os.getpid()
+    if _executor is None or _executor_pid != pid:
+        with _lock:
+            if _executor is None or _executor_pid != pid:
+                _executor = ThreadPoolExecutor(max_workers=MAX_HILOS, thread_name_prefix='lote')
+                _executor_pid = pid
+    return _executor
+
+
+def leer(datos, session_id):
+    """
+    Valida el cuerpo de un lote
+    Retorna (planes, None), con un diccionario solicitado/pregunta/session_id/incluir
+    por plan, o (None, mensaje de error)
+    """
+    destinos = datos.get('destinos')
+    preguntas = datos.get('preguntas')
+    if bool(destinos) == bool(preguntas):
+        return None, "Indica una lista de 'destinos' o de 'preguntas'"
+    entradas = destinos or preguntas
+    if not isinstance(entradas, list):
+        return None, "'destinos' y 'preguntas' deben ser listas"
+    if len(entradas) > MAX_PLANES:
+        return None, f'Como máximo {MAX_PLANES} planes por lote'
+
+    incluir, error = planificacion.leer_incluir(datos.get('include'))
+    if error:
+        return None, error
+
+    comunes = {}
+    for campo in CAMPOS_COMUNES:
+        if datos.get(campo):
+            is_valid, result = planificacion.validate_input(datos[campo], max_length=100)
+            if not is_valid:
+                return None, f'{campo}: {result}'
+            comunes[campo] = result
+
+    planes = []
+    vistos = set()
+    for entrada in entradas:
+        if destinos:
+            is_valid, result = planificacion.validate_input(entrada, max_length=100)
+            pregunta = itinerarios.pregunta_formulario(result, **comunes) if is_valid else None
+        else:
+            is_valid, result = planificacion.validate_input(entrada)
+            pregunta = result
+        if not is_valid:
+            return None, f'{str(entrada)[:50]}: {result}'
+        # Un destino repetido no se planifica dos veces
+        if normalizar(pregunta) in vistos:
+            continue
+        vistos.add(normalizar(pregunta))
+        planes.append({
+            'solicitado': result,
+            'pregunta': pregunta,
+            # Sesión nueva por plan: siempre es primera pregunta y se puede seguir conversando sobre ese destino
+            'session_id': f'{session_id}:{secrets.token_hex(6)}',
+            'incluir': incluir
+        })
+    return planes, None
+
+
+def resultado(plan, cuerpo=None, error=None):
+    """Entrada de la respuesta para un plan: su cuerpo de /api/planificar o su error"""
+    if error is None:
+        return dict(cuerpo, solicitado=plan['solicitado'], ok=True, codigo=200)
+    return dict(
+        planificacion.error_planificacion(error),
+        solicitado=plan['solicitado'],
+        session_id=plan['session_id'],
+        ok=False,
+        codigo=planificacion.codigo_error(error)
+    )
+
+
+def respuesta(resultados):
+    """Cuerpo y código HTTP del lote (error solo si fallaron todos los planes)"""
+    correctos = sum(1 for r in resultados if r['ok'])
+    cuerpo = {
+        'resultados': resultados,
+        'total': len(resultados),
+        'correctos': correctos,
+        'fallidos': len(resultados) - correctos
+    }
+    codigo = 200 if correctos or not resultados else resultados[0]['codigo']
+    return cuerpo, codigo
+
+
+def planificar(planes, plazo=None):
+    """
+    Planifica los planes de un lote a la vez (CONCURRENCIA como máximo)
+    Retorna (cuerpo, código HTTP)
+    """
+    plazo = plazo or plazos.Plazo()
+    executor = obtener_executor()
+    resultados = [None] * len(planes)
+    en_curso = {}
+    siguiente = 0
+    while siguiente < len(planes) or en_curso:
+        while siguiente < len(planes) and len(en_curso) < CONCURRENCIA:
+            plan = planes[siguiente]
+            futuro = executor.submit(
+                planificacion.planificar, plan['pregunta'], plan['session_id'], plazo, plan['incluir']
+            )
+            en_curso[futuro] = siguiente
+            siguiente += 1
+        hechos, _ = wait(en_curso, return_when=FIRST_COMPLETED)
+        for futuro in hechos:
+            i = en_curso.pop(futuro)
+            error = futuro.exception()
+            if error is not None:
+                logger.error(f"Error en el plan '{planes[i]['solicitado']}' del lote: {str(error)}")
+                resultados[i] = resultado(planes[i], error=error)
+            else:
+                resultados[i] = resultado(planes[i], futuro.result())
+    return respuesta(resultados)
@@ -0,0 +1,175 @@
+"""
+Métricas en formato Prometheus (GET /api/metrics)
+
+- viajeia_etapa_segundos{etapa}: histograma de latencia de cada etapa de la
+  planificación: destino (extracción y corrección), clima, fotos, tipo_cambio,
+  diferencia_horaria, gemini y serializacion.
+- viajeia_fallos_externos_total{servicio,tipo}: fallos de Weatherbit, Unsplash,
+  exchangerate-api y Gemini (timeout, error, http para 429/5xx y
+  circuito_abierto), contados en su cortacircuitos (viajeia/circuitos.py).
+- viajeia_peticiones_en_curso, viajeia_sesiones, viajeia_sesiones_bytes y
+  viajeia_cache_entradas{cache}: medidores por worker (etiqueta pid).
+
+Con varios workers de gunicorn cada proceso escribe sus valores en ficheros
+de PROMETHEUS_MULTIPROC_DIR (gunicorn_config.py lo prepara) y el worker que
+atiende /api/metrics los suma todos con el colector multiproceso de
+prometheus_client. Sin esa variable (un solo proceso) se exporta el registro
+del proceso.
+
+prometheus_client es opcional: sin él las mediciones no hacen nada y
+/api/metrics responde 503. En Vercel cada invocación es un proceso efímero y
+no se exponen métricas.
+"""
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+MULTIPROCESO = bool(os.getenv('PROMETHEUS_MULTIPROC_DIR'))
+# Segundos mínimos entre dos actualizaciones de los medidores de sesiones y caché en un worker
+INTERVALO_MEDIDORES = float(os.getenv('METRICAS_INTERVALO_MEDIDORES', '5'))
+
+# De milisegundos (caché, cálculo local) al plazo de la petición (viajeia/plazos.py)
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 50)
+
+try:
+    import prometheus_client  # dependencia opcional
+    from prometheus_client import Counter, Gauge, Histogram
+except ImportError:
+    prometheus_client = None
+
+DISPONIBLE = prometheus_client is not None
+
+if DISPONIBLE:
+    _etapas = Histogram(
+        'viajeia_etapa_segundos', 'Latencia de cada etapa de la planificación', ['etapa'], buckets=BUCKETS
+    )
+    _fallos = Counter(
+        'viajeia_fallos_externos', 'Fallos de los servicios externos por tipo', ['servicio', 'tipo']
+    )
+    # 'liveall': un valor por worker vivo (los de workers muertos se descartan)
+    _en_curso = Gauge(
+        'viajeia_peticiones_en_curso', 'Peticiones HTTP en curso en el worker', multiprocess_mode='liveall'
+    )
+    _sesiones = Gauge(
+        'viajeia_sesiones', 'Sesiones vigentes en el almacén de sesiones', multiprocess_mode='liveall'
+    )
+    _sesiones_bytes = Gauge(
+        'viajeia_sesiones_bytes', 'Bytes que ocupan las sesiones (memoria o SQLite)', multiprocess_mode='liveall'
+    )
+    _cache = Gauge(
+        'viajeia_cache_entradas', 'Entradas en memoria de cada caché del worker', ['cache'], multiprocess_mode='liveall'
+    )
+
+_lock = threading.Lock()
+_ultima_actualizacion = 0.0
+
+
+@contextmanager
+def etapa(nombre):
+    """Mide lo que tarda el bloque como una etapa (también si termina con excepción)"""
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        if DISPONIBLE:
+            _etapas.labels(nombre).observe(time.perf_counter() - inicio)
+
+
+def medir(nombre, funcion, *args, **kwargs):
+    """funcion(*args, **kwargs) medida como la etapa `nombre`"""
+    with etapa(nombre):
+        return funcion(*args, **kwargs)
+
+
+async def medir_async(nombre, corrutina):
+    """Equivalente asíncrono de medir() para una corrutina"""
+    with etapa(nombre):
+        return await corrutina
+
+
+def tipo_fallo(error):
+    """timeout si la excepción es de tiempo agotado (requests, httpx, Gemini); error si no"""
+    if error is None:
+        return 'error'
+    for clase in type(error).__mro__:
+        if clase is TimeoutError or 'Timeout' in clase.__name__ or clase.__name__ == 'DeadlineExceeded':
+            return 'timeout'
+    return 'error'
+
+
+def fallo_externo(servicio, tipo):
+    if DISPONIBLE:
+        _fallos.labels(servicio, tipo).inc()
+
+
+def empezar_peticion():
+    if DISPONIBLE:
+        _en_curso.inc()
+
+
+def terminar_peticion(actualizar=True):
+    """Fin de una petición; con actualizar, renueva los medidores si toca (ver actualizar_medidores)"""
+    if DISPONIBLE:
+        _en_curso.dec()
+        if actualizar:
+            actualizar_medidores()
+
+
+def medidores_vencidos():
+    """Indica si pasaron INTERVALO_MEDIDORES segundos desde la última actualización de los medidores"""
+    return DISPONIBLE and time.monotonic() - _ultima_actualizacion >= INTERVALO_MEDIDORES
+
+
+def actualizar_medidores(forzar=False):
+    """
+    Sesiones y tamaño de las cachés de este worker, como mucho una vez cada
+    INTERVALO_MEDIDORES segundos (con SQLite o Redis contar las sesiones es una consulta)
+    """
+    global _ultima_actualizacion
+    if not DISPONIBLE:
+        return
+    with _lock:
+        if not forzar and not medidores_vencidos():
+            return
+        _ultima_actualizacion = time.monotonic()
+
+    from viajeia import itinerarios, sesiones
+    from viajeia.cache import cache
+    try:
+        datos = sesiones.almacen.estadisticas()
+        if 'sesiones' in datos:
+            _sesiones.set(datos['sesiones'])
+        if 'bytes' in datos:
+            _sesiones_bytes.set(datos['bytes'])
+    except Exception as e:
+        logger.warning(f"Métricas: no se pudieron contar las sesiones: {str(e)}")
+    _cache.labels('enriquecimiento').set(cache.estadisticas()['entradas_memoria'])
+    _cache.labels('itinerarios').set(itinerarios.cache_itinerarios.estadisticas()['entradas_memoria'])
+
+
+def exportar():
+    """
+    Texto de exposición de Prometheus con las métricas de todos los workers
+    Retorna (cuerpo, content type); (None, None) sin prometheus_client
+    """
+    if not DISPONIBLE:
+        return None, None
+    actualizar_medidores(forzar=True)
+    if MULTIPROCESO:
+        from prometheus_client import CollectorRegistry, multiprocess
+        registro = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registro)
+    else:
+        registro = prometheus_client.REGISTRY
+    return prometheus_client.generate_latest(registro), prometheus_client.CONTENT_TYPE_LATEST
+
+
+def proceso_terminado(pid):
+    """Descarta los medidores de un worker que terminó (child_exit de gunicorn)"""
+    if DISPONIBLE and MULTIPROCESO:
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(pid)
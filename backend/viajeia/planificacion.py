@@ -0,0 +1,1003 @@
+"""
+Núcleo de planificación compartido por app.py (Flask), asgi.py y la función
+de Vercel (api/planificar.py)
+
+Resuelve la sesión y el destino, lanza el enriquecimiento (clima, fotos, tipo
+de cambio), construye el prompt y genera la respuesta con Gemini; cada punto
+de entrada solo se ocupa de HTTP. Para que el arranque en frío sea rápido,
+google.generativeai (~0,7 s de import) se importa y configura en la primera
+generación y no al importar este módulo, y las plantillas de prompt son
+constantes del módulo.
+
+Con GEMINI_SALIDA_ESTRUCTURADA (por defecto) la primera pregunta sin streaming
+pide a Gemini un JSON con las cinco secciones (viajeia/secciones.py) en lugar
+de reglas de formato en el prompt; la salida se valida aquí una sola vez y
+solo se vuelven a pedir las secciones que falten.
+"""
+import hashlib
+import logging
+import os
+import re
+import secrets
+import threading
+from collections import namedtuple
+from functools import lru_cache
+
+from viajeia import (
+    aproximado, circuitos, coalescencia, contexto, destinos, divisas, fotos, http_cliente, itinerarios, metricas,
+    plazos, secciones, sesiones, zonas_horarias
+)
+from viajeia.cache import cacheado
+from viajeia.enriquecimiento import Enriquecimiento
+from viajeia.gazetteer import gazetteer
+
+logger = logging.getLogger(__name__)
+
+GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
+# Opciones: 'gemini-2.0-flash', 'gemini-2.0-flash-exp', 'gemini-1.5-flash', 'gemini-pro'
+GEMINI_MODEL = os.getenv('GEMINI_MODEL', 'gemini-2.0-flash')
+# Primera pregunta como JSON con esquema (el streaming sigue en texto con títulos)
+SALIDA_ESTRUCTURADA = os.getenv('GEMINI_SALIDA_ESTRUCTURADA', 'true').lower() in ('1', 'true', 'yes')
+
+# APIs opcionales de enriquecimiento
+WEATHERBIT_API_KEY = os.getenv('WEATHERBIT_API_KEY', '')
+UNSPLASH_API_KEY = os.getenv('UNSPLASH_API_KEY', '')
+UNSPLASH_ACCESS_KEY = os.getenv('UNSPLASH_ACCESS_KEY', '')  # Para acceso público
+
+# Historial de conversaciones y destino principal por sesión, compartidos entre
+# workers (SESIONES_BACKEND: memoria, sqlite o redis; ver viajeia/sesiones.py)
+almacen_sesiones = sesiones.almacen
+
+_modelo = None
+_modelo_lock = threading.Lock()
+
+
+def modelo():
+    """Modelo de Gemini del proceso, creado (e importado) en la primera llamada"""
+    global _modelo
+    if _modelo is None:
+        with _modelo_lock:
+            if _modelo is None:
+                import google.generativeai as genai
+                genai.configure(api_key=GEMINI_API_KEY)
+                _modelo = genai.GenerativeModel(GEMINI_MODEL)
+    return _modelo
+
+
+def precalentar():
+    """
+    Importa google.generativeai y requests y construye los índices de destinos
+    sin crear el modelo ni sesiones HTTP. Con preload_app de gunicorn se llama en
+    el proceso maestro y los workers lo heredan ya hecho tras el fork
+    """
+    import google.generativeai  # noqa: F401
+    import requests  # noqa: F401
+    destinos.obtener_buscador()
+    aproximado._obtener_indice()
+    _patrones()
+
+
+# Plantillas de prompt (campos info_clima/pregunta y contexto_historial/pregunta), analizadas al final del bloque
+PROMPT_PRIMERA_PREGUNTA = """Eres Axl, un consultor personal de viajes entusiasta y amigable. Tu personalidad es:
+
+- Te presentas siempre como "Axl, tu consultor personal de viajes" 🧳
+- Eres muy entusiasta, amigable y positivo
+- Das respuestas organizadas y estructuradas
+- Usas emojis de viajes relevantes (✈️ 🧳 🗺️ 🏨 🍽️ 🎫 🌍 🏖️ 🏛️ 🎨 etc.)
+- Formateas el texto usando **texto** para negritas (el usuario verá esto resaltado)
+
+⚠️⚠️⚠️ ESTRUCTURA OBLIGATORIA - DEBES SEGUIRLA EXACTAMENTE ⚠️⚠️⚠️
+
+TU RESPUESTA DEBE COMENZAR INMEDIATAMENTE CON ESTA ESTRUCTURA EXACTA. NO AGREGUES INTRODUCCIÓN NI SALUDO ANTES DE LAS SECCIONES.
+
+FORMATO EXACTO OBLIGATORIO (copia y pega esta estructura, solo reemplaza el contenido entre corchetes):
+
+ALOJAMIENTO:
+[recomendaciones detalladas de hoteles, hostales, Airbnb, etc. con precios aproximados, ubicaciones y características. Usa bullets (•) para organizar.]
+
+COMIDA LOCAL:
+[recomendaciones de restaurantes, platos típicos, lugares para comer, precios aproximados, y experiencias gastronómicas. Usa bullets (•) para organizar.]
+
+LUGARES IMPERDIBLES:
+[lista de lugares que no se pueden perder, con descripciones breves, horarios y tips de visita. Usa bullets (•) para organizar.]
+
+CONSEJOS LOCALES:
+[tips especiales, advertencias, costumbres locales, qué evitar, transporte, seguridad, y cualquier información práctica importante. Usa bullets (•) para organizar.{info_clima}]
+
+ESTIMACIÓN DE COSTOS:
+[breakdown aproximado de costos diarios/semanales: alojamiento, comida, transporte, actividades, entretenimiento, etc. Usa bullets (•) para organizar.]
+
+REGLAS ESTRICTAS - DEBES SEGUIRLAS SIN EXCEPCIÓN:
+1. TU RESPUESTA DEBE COMENZAR DIRECTAMENTE CON "ALOJAMIENTO:" (sin introducción previa)
+2. DEBES usar EXACTAMENTE estos títulos en este orden exacto:
+   - ALOJAMIENTO:
+   - COMIDA LOCAL:
+   - LUGARES IMPERDIBLES:
+   - CONSEJOS LOCALES:
+   - ESTIMACIÓN DE COSTOS:
+3. Cada título DEBE estar en MAYÚSCULAS, seguido de DOS PUNTOS (:), y en su propia línea
+4. Después de cada título, DEBES incluir contenido detallado con bullets (•)
+5. NO respondas en un solo párrafo
+6. NO omitas ninguna sección
+7. NO cambies el orden de las secciones
+8. NO uses emojis en los títulos (solo el texto exacto: ALOJAMIENTO:, COMIDA LOCAL:, etc.)
+9. NO agregues texto antes de "ALOJAMIENTO:"
+10. Todas las 5 secciones son OBLIGATORIAS
+
+EJEMPLO DE FORMATO CORRECTO (tu respuesta debe verse así):
+ALOJAMIENTO:
+• Hotel XYZ - $100/noche - Ubicado en el centro
+• Hostal ABC - $30/noche - Ambiente joven y social
+
+COMIDA LOCAL:
+• Restaurante DEF - Platos típicos desde $15
+• Mercado local - Comida callejera desde $5
+
+LUGARES IMPERDIBLES:
+• Plaza Principal - Visita recomendada en la mañana
+• Museo de Arte - Abierto de 9am a 6pm
+
+CONSEJOS LOCALES:
+• Lleva efectivo para mercados locales
+• Evita taxis no oficiales
+
+ESTIMACIÓN DE COSTOS:
+• Alojamiento: $50-100/día
+• Comida: $20-40/día
+• Transporte: $10-20/día
+
+Pregunta del usuario: {pregunta}
+
+IMPORTANTE: Esta es la PRIMERA PREGUNTA. Tu respuesta DEBE comenzar directamente con "ALOJAMIENTO:" sin introducción. Responde EXACTAMENTE con las 5 secciones en el orden especificado. NO uses un solo párrafo. NO omitas ninguna sección."""
+
+
+# Primera pregunta con salida estructurada: el formato lo fija el esquema JSON, no el prompt
+PROMPT_PRIMERA_PREGUNTA_JSON = """Eres Axl, un consultor personal de viajes entusiasta y amigable. Usa emojis de viajes relevantes y **texto** para resaltar lo importante.
+
+Responde con las cinco secciones del viaje, cada una como una lista de recomendaciones concretas (una por elemento, sin viñetas):
+- alojamiento: hoteles, hostales, Airbnb, etc. con precios aproximados, ubicación y características
+- comida_local: restaurantes, platos típicos, lugares para comer y precios aproximados
+- lugares_imperdibles: lugares que no se pueden perder, con descripción breve, horarios y tips de visita
+- consejos_locales: costumbres, qué evitar, transporte, seguridad e información práctica{info_clima}
+- estimacion_costos: costos aproximados diarios o semanales de alojamiento, comida, transporte y actividades
+
+Pregunta del usuario: {pregunta}"""
+
+
+PROMPT_SEGUIMIENTO = """Eres Axl, un consultor personal de viajes entusiasta y amigable.{contexto_historial}
+
+El usuario está haciendo una pregunta de seguimiento sobre el mismo destino. Responde de manera conversacional, útil y CONCISA.
+
+⚠️⚠️⚠️ ESTA ES UNA PREGUNTA DE SEGUIMIENTO - RESPUESTA CONCISA ⚠️⚠️⚠️
+
+INSTRUCCIONES ESTRICTAS PARA PREGUNTAS DE SEGUIMIENTO:
+- Responde en MÁXIMO UN PÁRRAFO (no más de 4-5 oraciones)
+- Sé directo, específico y útil
+- Responde de forma natural y conversacional, como si estuvieras teniendo una charla
+- Usa **texto entre dos asteriscos** para resaltar información importante si es necesario
+- Incluye 1-2 emojis relevantes si aportan valor
+- NO uses bullets (•) ni listas - solo texto fluido en párrafo
+- NO uses estructura de secciones (no uses 🏨 🍽️ 📍 💡 💰)
+- NO repitas información que ya diste antes - sé conciso
+- Si la pregunta requiere información que ya diste, haz una referencia breve a la respuesta anterior
+- Mantén el tono entusiasta y amigable pero sé breve
+
+IMPORTANTE: Tu respuesta DEBE ser UN SOLO PÁRRAFO. No uses estructura de secciones, no uses bullets, solo texto fluido y natural en un párrafo continuo.
+
+Pregunta actual del usuario: {pregunta}
+
+Responde como Axl, siendo entusiasta, amigable, útil y CONCISO (máximo un párrafo, sin secciones)."""
+
+PLANTILLA_PRIMERA_PREGUNTA = contexto.Plantilla(PROMPT_PRIMERA_PREGUNTA)
+PLANTILLA_PRIMERA_PREGUNTA_JSON = contexto.Plantilla(PROMPT_PRIMERA_PREGUNTA_JSON)
+PLANTILLA_SEGUIMIENTO = contexto.Plantilla(PROMPT_SEGUIMIENTO)
+
+
+_CARACTERES_PELIGROSOS = re.compile(r'[<>]')
+
+
+def validate_input(text, max_length=2000):
+    """Validar y sanitizar entrada del usuario"""
+    if not text or not isinstance(text, str):
+        return False, "El texto no es válido"
+
+    if len(text.strip()) == 0:
+        return False, "El texto no puede estar vacío"
+
+    if len(text) > max_length:
+        return False, f"El texto es demasiado largo (máximo {max_length} caracteres)"
+
+    # Sanitizar: remover caracteres peligrosos pero permitir texto normal
+    sanitized = _CARACTERES_PELIGROSOS.sub('', text)
+
+    return True, sanitized
+
+
+# Partes opcionales de la respuesta que el cliente pide con 'include'; cada una
+# cuesta una consulta externa o un cálculo, y solo se calculan las pedidas.
+# Sin 'include': todas en la primera pregunta y ninguna en los seguimientos
+CAMPOS_OPCIONALES = ('clima', 'fotos', 'tipo_cambio', 'diferencia_horaria')
+# 'info_adicional' es el panel lateral completo
+_ALIAS_CAMPOS = {'info_adicional': ('tipo_cambio', 'diferencia_horaria')}
+
+
+def leer_incluir(valor):
+    """
+    Valida el parámetro 'include' (lista o texto separado por comas)
+    Retorna (campos, None), con campos None si no se indicó, o (None, mensaje de error)
+    """
+    if valor is None:
+        return None, None
+    if isinstance(valor, str):
+        valor = [nombre.strip() for nombre in valor.split(',') if nombre.strip()]
+    if not isinstance(valor, list) or not all(isinstance(nombre, str) for nombre in valor):
+        return None, "'include' debe ser una lista de campos"
+    campos = set()
+    for nombre in valor:
+        if nombre in _ALIAS_CAMPOS:
+            campos.update(_ALIAS_CAMPOS[nombre])
+        elif nombre in CAMPOS_OPCIONALES:
+            campos.add(nombre)
+        else:
+            validos = ', '.join(CAMPOS_OPCIONALES + tuple(_ALIAS_CAMPOS))
+            return None, f"Campo desconocido en 'include': {nombre[:30]} (válidos: {validos})"
+    return frozenset(campos), None
+
+
+# Largo máximo de un session_id enviado por el cliente
+MAX_SESSION_ID = 200
+
+
+def leer_session_id(valor):
+    """
+    Valida el session_id del cuerpo de una petición
+    null, ausente o vacío (el frontend empieza con sessionId = null) crea un id
+    aleatorio que el cliente recibe en la respuesta. Nunca se usa la IP: el
+    historial se lee solo con el id, y detrás de un mismo NAT o proxy todos
+    compartirían sesión
+    Retorna (session_id, None) o (None, mensaje de error)
+    """
+    if valor is None or (isinstance(valor, str) and not valor.strip()):
+        return secrets.token_hex(16), None
+    if not isinstance(valor, str):
+        return None, "'session_id' debe ser un texto"
+    if len(valor) > MAX_SESSION_ID:
+        return None, f"'session_id' es demasiado largo (máximo {MAX_SESSION_ID} caracteres)"
+    return valor, None
+
+
+URL_WEATHERBIT = "https://api.weatherbit.io/v2.0/current"
+
+
+def clave_clima(ciudad):
+    """Clave de la consulta de clima: el ID del gazetteer si la ciudad está, si no el nombre"""
+    destino = destinos.resolver(ciudad)
+    return destino.id if destino else ciudad.strip()
+
+
+def parametros_clima(clave):
+    """
+    Parámetros de Weatherbit API - Current Weather
+    Por coordenadas para los destinos del gazetteer (sin ambigüedad entre
+    ciudades homónimas) y por nombre para el resto
+    """
+    params = {
+        'key': WEATHERBIT_API_KEY,
+        'lang': 'es',
+        'units': 'M'  # Métrico (Celsius)
+    }
+    destino = gazetteer.por_id(clave)
+    if destino:
+        params['lat'] = destino.lat
+        params['lon'] = destino.lon
+    else:
+        params['city'] = clave
+    return params
+
+
+def procesar_clima(response, ciudad):
+    """
+    Interpreta la respuesta de Weatherbit (requests o httpx)
+    Retorna un diccionario con la información del clima o None si hay error
+    """
+    if response.status_code == 200:
+        data = response.json()
+        if data.get('data') and len(data['data']) > 0:
+            clima = data['data'][0]
+            return {
+                'temperatura': clima.get('temp', 'N/A'),
+                'descripcion': clima.get('weather', {}).get('description', 'N/A'),
+                'sensacion_termica': clima.get('app_temp', 'N/A'),
+                'humedad': clima.get('rh', 'N/A'),
+                'viento': clima.get('wind_spd', 'N/A'),
+                'ciudad': clima.get('city_name', ciudad),
+                'pais': clima.get('country_code', ''),
+                'icono': clima.get('weather', {}).get('icon', '')
+            }
+    elif response.status_code == 429:
+        logger.warning("Límite de rate de Weatherbit alcanzado")
+    else:
+        logger.warning(f"Weatherbit API error: {response.status_code}")
+
+    return None
+
+
+def obtener_clima_ciudad(ciudad):
+    """
+    Obtiene el clima actual de una ciudad usando Weatherbit API
+    Retorna un diccionario con la información del clima o None si hay error
+    """
+    if not WEATHERBIT_API_KEY:
+        return None
+    return clima_destino(clave_clima(ciudad))
+
+
+@cacheado('clima')
+def clima_destino(clave):
+    """Clima de una clave de clave_clima(): "Paris" y "París" comparten caché"""
+    try:
+        response = http_cliente.get(URL_WEATHERBIT, params=parametros_clima(clave), timeout=5)
+        return procesar_clima(response, clave)
+    except circuitos.CircuitoAbierto:
+        # No se cachea como fallo: se vuelve a consultar cuando el servicio se recupere
+        raise
+    except Exception as e:
+        logger.error(f"Error obteniendo clima: {str(e)}")
+
+    return None
+
+
+def obtener_tipo_cambio(base_currency='USD', target_currency='EUR'):
+    """
+    Obtiene el tipo de cambio desde la tabla local de tasas (exchangerate-api.com)
+    La tabla se descarga periódicamente; cada consulta es un cálculo en memoria
+    Retorna el tipo de cambio o None si hay error
+    """
+    try:
+        return divisas.tipo_cambio(base_currency, target_currency)
+    except Exception as e:
+        logger.error(f"Error obteniendo tipo de cambio: {str(e)}")
+
+    return None
+
+
+def moneda_destino(destino, base_currency='USD'):
+    """
+    Moneda local del destino para el panel de tipo de cambio
+    Si no se conoce (o coincide con la base) se usa EUR como referencia
+    """
+    encontrado = destinos.resolver(destino)
+    moneda = encontrado.moneda if encontrado else None
+    if not moneda or moneda == base_currency:
+        return 'EUR'
+    return moneda
+
+
+def obtener_diferencia_horaria(ciudad):
+    """
+    Obtiene la diferencia horaria de una ciudad con la base de datos tz local
+    Retorna información de zona horaria o None si la ciudad no es conocida
+    """
+    try:
+        return zonas_horarias.diferencia_horaria(ciudad)
+    except Exception as e:
+        logger.error(f"Error obteniendo diferencia horaria: {str(e)}")
+
+    return None
+
+
+def obtener_fotos_unsplash(destino, cantidad=3):
+    """
+    Obtiene fotos de un destino del pool de Unsplash (ver viajeia.fotos)
+    El pool se descarga una vez por destino y cada llamada rota el subconjunto
+    Retorna una lista de fotos o lista vacía si hay error
+    """
+    # Usar Access Key si está disponible, sino usar API Key
+    api_key = UNSPLASH_ACCESS_KEY or UNSPLASH_API_KEY
+
+    if not api_key:
+        return []
+
+    try:
+        fotos_destino = fotos.seleccionar(destino, cantidad)
+        logger.info(f"Unsplash: {len(fotos_destino)} fotos servidas para '{destino}'")
+        return fotos_destino
+    except Exception as e:
+        logger.error(f"Error obteniendo fotos de Unsplash: {str(e)}")
+
+    return []
+
+
+# Patrones de respaldo para destinos que no están en la tabla; se compilan en la
+# primera pregunta que los necesita (la mayoría de preguntas no llegan a usarlos)
+_NOMBRE = r'([A-ZÁÉÍÓÚÑ][a-záéíóúñ]+(?:\s+[A-ZÁÉÍÓÚÑ][a-záéíóúñ]+)*)'
+_PatronesDestino = namedtuple('_PatronesDestino', 'destino tras_a viaje_a cola cola_amplia')
+
+
+@lru_cache(maxsize=1)
+def _patrones():
+    return _PatronesDestino(
+        destino=[
+            re.compile(r'planear\s+un\s+viaje\s+a\s+' + _NOMBRE),  # "planear un viaje a Paris"
+            re.compile(r'viaje\s+a\s+' + _NOMBRE),  # "viaje a Paris"
+            re.compile(r'(?:a|en|desde|hacia|hasta)\s+' + _NOMBRE),  # "a Paris"
+            re.compile(r'viajar\s+(?:a|a|en)\s+' + _NOMBRE),  # "viajar a Paris"
+            re.compile(r'destino[:\s]+' + _NOMBRE),  # "destino: Paris"
+            re.compile(r'¿A\s+dónde\s+quieres\s+viajar\??\s*' + _NOMBRE),  # Para preguntas directas
+        ],
+        tras_a=re.compile(r'\b(?:a|en|viaje\s+a|viajar\s+a|planear\s+un\s+viaje\s+a)\s+([A-ZÁÉÍÓÚÑ][a-záéíóúñ]+(?:\s+[A-ZÁÉÍÓÚÑ][a-záéíóúñ]+)*)', re.IGNORECASE),
+        viaje_a=re.compile(r'(?:viaje|viajar|planear.*viaje).*?\ba\s+([A-ZÁÉÍÓÚÑ][a-záéíóúñ]+(?:\s+[a-záéíóúñ]+)*)', re.IGNORECASE),
+        cola=re.compile(r'\s+(desde|hasta|hacia|con|y|o|mi|el|la|los|las).*$', re.IGNORECASE),
+        cola_amplia=re.compile(r'\s+(desde|hasta|hacia|con|y|o|mi|el|la|los|las|un|una|unos|unas).*$', re.IGNORECASE),
+    )
+
+
+def extraer_destinos(pregunta):
+    """
+    Intenta extraer nombres de ciudades/destinos de la pregunta
+    Retorna una lista de posibles destinos
+    """
+    # Destinos conocidos: una sola pasada con el autómata de viajeia/destinos.py
+    # (sin acentos ni mayúsculas y con límite de palabra), en orden de aparición
+    destinos_encontrados = [texto.lower().title() for texto, _ in destinos.encontrar(pregunta)]
+
+    # Si no encontramos ciudades conocidas, intentar extraer después de palabras clave
+    if not destinos_encontrados:
+        patrones = _patrones()
+        # Patrón específico para el formulario: "Quiero planear un viaje a [destino] desde..."
+        for patron in patrones.destino:
+            matches = patron.findall(pregunta)
+            if matches:
+                # Limpiar el destino encontrado (remover palabras comunes que no son parte del nombre)
+                for match in matches:
+                    destino = patrones.cola.sub('', match.strip())
+                    if destino and len(destino) > 2:  # Asegurar que tiene al menos 3 caracteres
+                        destinos_encontrados.append(destino)
+                if destinos_encontrados:
+                    break
+
+    # Si aún no encontramos nada, intentar extraer cualquier palabra capitalizada después de "a"
+    if not destinos_encontrados:
+        match = patrones.tras_a.search(pregunta)
+        if match:
+            destino = patrones.cola.sub('', match.group(1).strip())
+            if destino and len(destino) > 2:
+                destinos_encontrados.append(destino)
+
+    # Si aún no encontramos nada, buscar "viaje a [palabra capitalizada]" de forma más flexible (último recurso)
+    if not destinos_encontrados:
+        match = patrones.viaje_a.search(pregunta)
+        if match:
+            destino = patrones.cola_amplia.sub('', match.group(1).strip())
+            if destino and len(destino) > 2:
+                destinos_encontrados.append(destino)
+
+    # Log para debugging
+    if destinos_encontrados:
+        logger.info(f"Destinos detectados: {destinos_encontrados}")
+    else:
+        logger.warning(f"No se detectaron destinos en: {pregunta[:100]}")
+
+    return destinos_encontrados
+
+
+def resolver_planificacion(pregunta, session_id, plazo=None, incluir=None):
+    """
+    Resuelve el estado de una planificación: historial, destinos y qué consultas
+    de enriquecimiento hacen falta (sin lanzarlas)
+    Sin plazo, la petición empieza uno nuevo; un lote comparte el suyo entre sus planes
+    incluir: campos opcionales pedidos (leer_incluir); None para los de por defecto
+    """
+    # Obtener historial de conversación y destino de la sesión si existen
+    historial, destino_sesion = almacen_sesiones.cargar(session_id)
+    es_primera_pregunta = len(historial) == 0
+    if incluir is None:
+        # Los seguimientos solo añaden texto al chat: por defecto, solo la respuesta
+        incluir = frozenset(CAMPOS_OPCIONALES) if es_primera_pregunta else frozenset()
+
+    logger.info(f"🔍 Sesión: {session_id}, Es primera pregunta: {es_primera_pregunta}, Historial: {len(historial)} preguntas")
+
+    # Intentar extraer destinos y obtener clima y fotos (solo en primera pregunta o si se menciona nuevo destino)
+    with metricas.etapa('destino'):
+        destinos = extraer_destinos(pregunta)
+        # Nombres que el gazetteer no reconoce: corrección aproximada ("Barselona"), o solo aviso si es dudosa
+        destinos, correccion_destino = aproximado.corregir(destinos)
+    destino_detectado = None
+
+    pedir_clima = False
+    pedir_fotos = False
+
+    # Solo buscar clima y fotos en primera pregunta
+    if destinos and es_primera_pregunta:
+        destino_principal = destinos[0]
+        destino_detectado = destino_principal
+
+        logger.info(f"🎯 Destino detectado: {destino_principal}")
+
+        # Obtener clima si se pidió y hay API key
+        if 'clima' in incluir:
+            if WEATHERBIT_API_KEY:
+                logger.info(f"🌤️ Buscando clima para: {destino_principal}")
+                pedir_clima = True
+            else:
+                logger.warning("⚠️ Weatherbit API key no configurada")
+
+        # Obtener fotos automáticamente si se pidieron y hay API key
+        if 'fotos' in incluir:
+            if UNSPLASH_ACCESS_KEY or UNSPLASH_API_KEY:
+                logger.info(f"📸 Buscando fotos para: {destino_principal}")
+                pedir_fotos = True
+            else:
+                logger.warning("⚠️ Unsplash API key no configurada - las fotos no se obtendrán")
+                logger.info("💡 Para habilitar fotos automáticas, agrega UNSPLASH_ACCESS_KEY a backend/.env")
+                logger.info("💡 Ver instrucciones en UNSPLASH_SETUP.md")
+    elif historial and not destinos:
+        # En preguntas de seguimiento, usar el destino de la primera pregunta si está disponible
+        if destino_sesion:
+            destino_detectado = destino_sesion
+            logger.info(f"📍 Usando destino de sesión anterior: {destino_detectado}")
+
+    # Información adicional para el panel lateral (solo si hay destino y se pidió)
+    destino_para_info = destino_detectado or destino_sesion or (destinos[0] if destinos else None)
+    if incluir.intersection(_ALIAS_CAMPOS['info_adicional']):
+        if destino_para_info:
+            logger.info(f"Obteniendo información adicional para: {destino_para_info}")
+        else:
+            logger.warning("No hay destino detectado para obtener información adicional")
+
+    return {
+        'pregunta': pregunta,
+        'session_id': session_id,
+        # Momento límite de la petición para todas sus esperas (ver viajeia/plazos.py)
+        'plazo': plazo or plazos.Plazo(),
+        'historial': historial,
+        # Resumen acumulado de la conversación para el contexto de los seguimientos
+        'resumen': almacen_sesiones.cargar_resumen(session_id) if historial else None,
+        'es_primera_pregunta': es_primera_pregunta,
+        'destino_detectado': destino_detectado,
+        'destino_sesion': destino_sesion,
+        'destino_para_info': destino_para_info,
+        'correccion_destino': correccion_destino,
+        'incluir': incluir,
+        'pedir_clima': pedir_clima,
+        'pedir_fotos': pedir_fotos,
+        # Tipo de cambio de USD a la moneda local del destino
+        'moneda': moneda_destino(destino_para_info) if destino_para_info and 'tipo_cambio' in incluir else None
+    }
+
+
+def preparar_planificacion(pregunta, session_id, plazo=None, incluir=None):
+    """
+    Primera etapa de una planificación: resuelve la sesión y el destino y lanza
+    a la vez todas las consultas externas (la petición solo espera a la más lenta)
+    """
+    plan = resolver_planificacion(pregunta, session_id, plazo, incluir)
+    enriquecimiento = Enriquecimiento()
+    destino = plan['destino_detectado']
+    if plan['pedir_clima']:
+        enriquecimiento.lanzar('clima', obtener_clima_ciudad, destino)
+    if plan['pedir_fotos']:
+        enriquecimiento.lanzar('fotos', obtener_fotos_unsplash, destino, cantidad=3)
+    if plan['moneda']:
+        enriquecimiento.lanzar('tipo_cambio', obtener_tipo_cambio, 'USD', plan['moneda'])
+    plan['enriquecimiento'] = enriquecimiento
+    return plan
+
+
+def formatear_info_clima(clima_data):
+    """Bloque de texto con el clima actual para el prompt (vacío si no hay clima)"""
+    if not clima_data:
+        return ""
+    return f"""
+
+INFORMACIÓN DEL CLIMA ACTUAL:
+🌡️ **Temperatura actual en {clima_data['ciudad']}**: {clima_data['temperatura']}°C
+🌤️ **Condiciones**: {clima_data['descripcion']}
+🌡️ **Sensación térmica**: {clima_data['sensacion_termica']}°C
+💧 **Humedad**: {clima_data['humedad']}%
+💨 **Viento**: {clima_data['viento']} m/s
+
+Usa esta información del clima para dar recomendaciones sobre qué ropa llevar y actividades apropiadas para las condiciones climáticas actuales."""
+
+
+def esperar_clima(plan):
+    """
+    Espera el clima, lo único que necesita el prompt, sin comerse el tiempo
+    reservado para Gemini
+    Retorna (clima_data, info_clima) con el bloque de texto para el prompt
+    """
+    enriquecimiento = plan['enriquecimiento']
+    if not enriquecimiento.lanzada('clima'):
+        return None, ""
+
+    espera = plan['plazo'].espera(reserva=plazos.RESERVA_GENERACION)
+    clima_data = enriquecimiento.resultado('clima', espera=espera)
+    if not clima_data:
+        logger.warning(f"⚠️ No se pudo obtener clima para {plan['destino_detectado']}")
+        return None, ""
+
+    logger.info(f"✅ Clima obtenido exitosamente para {plan['destino_detectado']}")
+    return clima_data, formatear_info_clima(clima_data)
+
+
+def construir_prompt(plan, info_clima="", estructurado=False):
+    """
+    Crea el prompt para Axl, el consultor personal de viajes
+    Deja en plan['uso_prompt'] su tamaño estimado (tokens del prompt y del contexto)
+    y en plan['estructurado'] si la primera pregunta usa salida estructurada
+    """
+    pregunta = plan['pregunta']
+    destino_sesion = plan['destino_sesion']
+    plan['estructurado'] = estructurado and plan['es_primera_pregunta']
+
+    if plan['estructurado']:
+        # Primera pregunta con esquema JSON: sin reglas de formato en el prompt
+        logger.info("📝 Generando prompt para PRIMERA PREGUNTA - salida estructurada")
+        prompt = PLANTILLA_PRIMERA_PREGUNTA_JSON.rellenar(info_clima=info_clima, pregunta=pregunta)
+        return registrar_prompt(plan, 'primera', prompt, {'tokens_contexto': 0})
+
+    if plan['es_primera_pregunta']:
+        # Primera pregunta: estructura completa requerida
+        logger.info("📝 Generando prompt para PRIMERA PREGUNTA - estructura completa obligatoria")
+        prompt = PLANTILLA_PRIMERA_PREGUNTA.rellenar(info_clima=info_clima, pregunta=pregunta)
+        return registrar_prompt(plan, 'primera', prompt, {'tokens_contexto': 0})
+
+    # Contexto del historial: resumen acumulado y turnos aún sin resumir, dentro del presupuesto de tokens
+    contexto_historial, uso = contexto.construir(plan['historial'], plan['resumen'])
+
+    # Agregar información del destino al contexto si existe
+    if destino_sesion:
+        contexto_historial += f"\n\nIMPORTANTE: El usuario está preguntando sobre {destino_sesion}. Cuando use palabras como 'allí', 'ese lugar', 'ese destino', 'el transporte allí', etc., se refiere a {destino_sesion}."
+
+    # Preguntas de seguimiento: respuesta libre y concisa (máximo un párrafo)
+    logger.info("📝 Generando prompt para PREGUNTA DE SEGUIMIENTO - respuesta concisa en un párrafo")
+    prompt = PLANTILLA_SEGUIMIENTO.rellenar(contexto_historial=contexto_historial, pregunta=pregunta)
+    return registrar_prompt(plan, 'seguimiento', prompt, uso)
+
+
+def registrar_prompt(plan, tipo, prompt, uso):
+    """Anota el tamaño del prompt en el plan y en las estadísticas; retorna el prompt"""
+    tokens = contexto.estimar_tokens(prompt)
+    plan['uso_prompt'] = dict(uso, tokens=tokens, caracteres=len(prompt))
+    contexto.registrar(tipo, tokens)
+    logger.info(f"📏 Prompt de {tipo}: ~{tokens} tokens ({uso['tokens_contexto']} de contexto)")
+    return prompt
+
+
+def texto_respuesta(plan, respuesta):
+    """
+    Texto de una respuesta generada o de la caché de itinerarios; deja en
+    plan['secciones'] las secciones ya separadas si es la primera pregunta
+    """
+    if not plan['es_primera_pregunta']:
+        plan['secciones'] = None
+        return respuesta
+    texto, plan['secciones'] = secciones.leer_itinerario(respuesta)
+    return texto
+
+
+def guardar_turno(plan, respuesta):
+    """
+    Guarda la interacción en el historial de la sesión (y su destino si es la primera pregunta)
+    Deja en plan['cursor'] el número del turno guardado
+    """
+    session_id = plan['session_id']
+
+    # Guardar destino en la sesión si es la primera pregunta y hay destino
+    destino = plan['destino_detectado'] if plan['es_primera_pregunta'] else None
+    if destino:
+        logger.info(f"💾 Destino guardado para sesión {session_id}: {destino}")
+
+    # El almacén limita el historial a 10 interacciones por sesión
+    plan['cursor'] = almacen_sesiones.agregar_turno(session_id, plan['pregunta'], respuesta, destino)
+    # El resumen acumulado se pone al día en segundo plano, fuera de la petición
+    contexto.programar_resumen(almacen_sesiones, session_id)
+
+
+def recoger_fotos(plan):
+    """Espera las fotos del destino (lista vacía si no se pidieron)"""
+    enriquecimiento = plan['enriquecimiento']
+    if not enriquecimiento.lanzada('fotos'):
+        return []
+
+    fotos_data = enriquecimiento.resultado('fotos', [], espera=plan['plazo'].espera())
+    if fotos_data:
+        logger.info(f"✅ Fotos obtenidas exitosamente: {len(fotos_data)} fotos para {plan['destino_detectado']}")
+    else:
+        logger.warning(f"⚠️ No se pudieron obtener fotos para {plan['destino_detectado']}")
+    return fotos_data
+
+
+def recoger_tipo_cambio(plan):
+    """Espera el tipo de cambio del destino (None si no se pidió, no hay destino o hubo error)"""
+    if not plan['enriquecimiento'].lanzada('tipo_cambio'):
+        return None
+
+    tipo_cambio = plan['enriquecimiento'].resultado('tipo_cambio', espera=plan['plazo'].espera())
+    if tipo_cambio:
+        logger.info(f"Tipo de cambio obtenido: {tipo_cambio}")
+    else:
+        logger.warning("No se pudo obtener tipo de cambio")
+    return tipo_cambio
+
+
+def calcular_diferencia_horaria(plan):
+    """Diferencia horaria del destino (cálculo local con zoneinfo, no se lanza en paralelo)"""
+    destino_para_info = plan['destino_para_info']
+    if not destino_para_info or 'diferencia_horaria' not in plan['incluir']:
+        return None
+
+    with metricas.etapa('diferencia_horaria'):
+        diferencia_horaria = obtener_diferencia_horaria(destino_para_info)
+    if diferencia_horaria:
+        logger.info(f"Diferencia horaria obtenida: {diferencia_horaria}")
+    else:
+        logger.warning(f"No se pudo obtener diferencia horaria para {destino_para_info}")
+    return diferencia_horaria
+
+
+def recoger_info_adicional(plan):
+    """Información para el panel lateral: tipo de cambio y diferencia horaria"""
+    info_adicional = {}
+    tipo_cambio = recoger_tipo_cambio(plan)
+    if tipo_cambio:
+        info_adicional['tipo_cambio'] = tipo_cambio
+    diferencia_horaria = calcular_diferencia_horaria(plan)
+    if diferencia_horaria:
+        info_adicional['diferencia_horaria'] = diferencia_horaria
+    return info_adicional
+
+
+def turno_historial(cursor, pregunta, respuesta):
+    """Turno del historial tal como se devuelve al frontend (respuesta truncada)"""
+    return {'cursor': cursor, 'pregunta': pregunta, 'respuesta': respuesta[:100] + '...' if len(respuesta) > 100 else respuesta}
+
+
+def historial_desde(session_id, desde=0):
+    """
+    Cuerpo de GET /api/sesion/<id>/historial?since=<cursor>: solo los turnos posteriores al cursor
+    Con reiniciar=True el cliente debe reemplazar su historial en vez de añadir: su
+    cursor ya salió de la ventana de MAX_TURNOS o es de una sesión que caducó
+    """
+    ultimo, turnos = almacen_sesiones.turnos_desde(session_id, desde)
+    reiniciar = desde > ultimo
+    if reiniciar:
+        ultimo, turnos = almacen_sesiones.turnos_desde(session_id)
+    elif turnos and turnos[0][0] > desde + 1:
+        reiniciar = True
+    return {
+        'session_id': session_id,
+        'cursor': ultimo,
+        'turnos': [turno_historial(*turno) for turno in turnos],
+        'reiniciar': reiniciar
+    }
+
+
+def leer_cursor(valor):
+    """Cursor de historial de un parámetro ?since= (0 si falta); None si no es válido"""
+    try:
+        cursor = int(valor or 0)
+    except (TypeError, ValueError):
+        return None
+    return cursor if cursor >= 0 else None
+
+
+def plazo_agotado(e):
+    """El error es del plazo de la petición o el timeout que Gemini recibió de él"""
+    return plazos.agotado(e)
+
+
+def codigo_error(e):
+    """Código HTTP de un fallo al planificar: 504 sin plazo, 503 con Gemini caído, si no 500"""
+    if plazo_agotado(e):
+        return 504
+    if isinstance(e, circuitos.CircuitoAbierto):
+        return 503
+    return 500
+
+
+def error_planificacion(e):
+    """Cuerpo JSON de error para un fallo al planificar (errores de Gemini diferenciados)"""
+    error_message = str(e)
+    details = error_message if os.getenv('FLASK_DEBUG', 'False').lower() == 'true' else None
+
+    if plazo_agotado(e):
+        return {
+            'error': 'La solicitud tardó demasiado. Por favor, intenta de nuevo.',
+            'details': details
+        }
+    if isinstance(e, circuitos.CircuitoAbierto):
+        return {
+            'error': 'El servicio de Gemini no está disponible en este momento. Por favor, intenta de nuevo en unos segundos.',
+            'details': details
+        }
+
+    # Manejar errores específicos de la API
+    if 'API_KEY' in error_message or 'quota' in error_message.lower() or 'permission' in error_message.lower():
+        return {
+            'error': 'Error con la API de Gemini. Por favor, verifica la configuración.',
+            'details': details
+        }
+    elif 'model' in error_message.lower() or 'not found' in error_message.lower():
+        return {
+            'error': f'Error con el modelo de Gemini. Verifica que el modelo esté disponible. Error: {error_message}',
+            'details': details
+        }
+    return {
+        'error': 'Error al procesar la solicitud. Por favor, intenta de nuevo.',
+        'details': details
+    }
+
+
+def clave_itinerario(plan):
+    """Clave del itinerario cacheado (solo primera pregunta con la plantilla del formulario)"""
+    if not plan['es_primera_pregunta']:
+        return None
+    return itinerarios.clave_itinerario(plan['pregunta'], plan['destino_detectado'])
+
+
+def opciones_generacion(plazo):
+    """
+    Argumentos de generate_content con el tiempo que le queda a la petición
+    como timeout; PlazoAgotado si ya no alcanza para una generación
+    """
+    if plazo is None:
+        return {}
+    return {'request_options': {'timeout': plazo.exigir(plazos.MINIMO_GENERACION, 'Gemini')}}
+
+
+def generar(prompt, plazo=None, configuracion=None):
+    """Texto completo de Gemini para un prompt (a través de su cortacircuitos)"""
+    opciones = opciones_generacion(plazo)
+    if configuracion:
+        opciones['generation_config'] = configuracion
+    with metricas.etapa('gemini'):
+        return circuitos.gemini.llamar(modelo().generate_content, prompt, **opciones).text
+
+
+def generar_itinerario(prompt, plazo=None):
+    """
+    Itinerario de primera pregunta con salida estructurada, ya validado
+    Si faltan secciones se piden solo esas en una segunda llamada (nunca se
+    regenera todo); retorna el itinerario de secciones.componer() (texto y secciones)
+    """
+    original = generar(prompt, plazo, secciones.configuracion())
+    encontradas = secciones.leer_salida(original)
+    faltan = secciones.faltantes(encontradas)
+    if not faltan or not encontradas:
+        return secciones.componer(encontradas, original)
+
+    logger.warning(f"⚠️ Faltan secciones en la salida estructurada: {faltan}; se piden solo esas")
+    try:
+        reparacion = generar(secciones.prompt_reparacion(prompt, faltan), plazo, secciones.configuracion(faltan))
+        encontradas.update(secciones.leer_salida(reparacion, faltan))
+    except Exception as e:
+        # Mejor un itinerario incompleto que ninguno
+        logger.error(f"Error pidiendo las secciones que faltan: {str(e)}")
+    return secciones.componer(encontradas, original, reparada=True)
+
+
+def clave_prompt(prompt):
+    """Clave de coalescencia de una generación que no tiene clave de itinerario"""
+    return 'gemini:' + hashlib.sha256(prompt.encode('utf-8')).hexdigest()
+
+
+def generar_compartido(clave, prompt, plazo=None, estructurado=False):
+    """
+    generar() (o generar_itinerario() con salida estructurada) sin repetir
+    generaciones en vuelo: si otra petición del proceso está generando el mismo
+    itinerario (o el mismo prompt) se espera su texto.
+    Con clave de itinerario el resultado además queda guardado en la caché.
+    La espera se recorta al plazo de esta petición (viajeia.coalescencia)
+    """
+    funcion = generar_itinerario if estructurado else generar
+    if clave:
+        return itinerarios.generar(clave, funcion, prompt, plazo)
+    return coalescencia.vuelos.ejecutar(clave_prompt(prompt), funcion, prompt, plazo, plazo_espera=plazo)
+
+
+def trozos_compartidos(clave, prompt, plazo=None):
+    """
+    trozos_gemini() coalescido: si la misma generación ya está en vuelo, espera
+    su texto completo y lo entrega en un solo trozo. El líder puede ser una
+    petición sin streaming con salida estructurada, que publica un itinerario
+    (texto y secciones): del stream solo sale su texto
+    """
+    clave = clave or clave_prompt(prompt)
+    vuelo, lider = coalescencia.vuelos.unirse(clave)
+    if not lider:
+        resultado = coalescencia.vuelos.esperar(clave, vuelo, plazo)
+        if resultado is not coalescencia.SIN_RESULTADO:
+            if isinstance(resultado, dict):
+                # Su texto tiene el formato canónico: el detector del stream saca las mismas secciones
+                resultado, _ = secciones.leer_itinerario(resultado)
+            yield resultado
+            return
+        yield from trozos_gemini(prompt, plazo)
+        return
+
+    partes = []
+    try:
+        for texto in trozos_gemini(prompt, plazo):
+            partes.append(texto)
+            yield texto
+    except Exception as e:
+        coalescencia.vuelos.terminar(clave, vuelo, error=e)
+        raise
+    except BaseException:
+        # El cliente cerró el stream: quien esperaba genera por su cuenta
+        coalescencia.vuelos.terminar(clave, vuelo, error=coalescencia.Cancelada(clave))
+        raise
+    coalescencia.vuelos.terminar(clave, vuelo, ''.join(partes))
+
+
+def trozos_gemini(prompt, plazo=None):
+    """Genera el texto de Gemini a medida que llega (streaming)"""
+    opciones = opciones_generacion(plazo)
+    circuitos.gemini.permitir()
+    try:
+        # La etapa dura hasta el último trozo
+        with metricas.etapa('gemini'):
+            for chunk in modelo().generate_content(prompt, stream=True, **opciones):
+                try:
+                    texto = chunk.text
+                except ValueError:
+                    # Trozos sin texto (p. ej. solo metadatos de cierre)
+                    continue
+                if texto:
+                    yield texto
+    except Exception as e:
+        circuitos.gemini.fallo(e)
+        raise
+    circuitos.gemini.exito()
+
+
+def respuesta_planificacion(plan, respuesta, cache_itinerario, clima_data, fotos_data, info_adicional):
+    """Cuerpo JSON de /api/planificar (mismo contrato en Flask, ASGI y Vercel)"""
+    return {
+        'respuesta': respuesta,
+        # Primera pregunta: las secciones ya separadas, para que el cliente no vuelva a partir el texto
+        'secciones': plan.get('secciones'),
+        'clima': clima_data,
+        'fotos': fotos_data,
+        'destino': plan['destino_para_info'],
+        'correccion_destino': plan['correccion_destino'],
+        'session_id': plan['session_id'],
+        'es_primera_pregunta': plan['es_primera_pregunta'],
+        'cache_itinerario': cache_itinerario,
+        'info_adicional': info_adicional if info_adicional else None,
+        # Solo el turno nuevo; el resto del historial, con GET /api/sesion/<id>/historial?since=
+        'turno': turno_historial(plan.get('cursor'), plan['pregunta'], respuesta),
+        'cursor': plan.get('cursor'),
+        'uso_prompt': plan.get('uso_prompt'),
+        # Campos opcionales que se calcularon (los demás van vacíos)
+        'include': sorted(plan['incluir'])
+    }
+
+
+def planificar(pregunta, session_id, plazo=None, incluir=None):
+    """
+    Planificación completa y síncrona de una pregunta ya validada
+    Retorna el cuerpo JSON de la respuesta; las excepciones las traduce cada
+    punto de entrada con error_planificacion() y codigo_error()
+    """
+    plan = preparar_planificacion(pregunta, session_id, plazo, incluir)
+    clima_data, info_clima = esperar_clima(plan)
+    prompt = construir_prompt(plan, info_clima, estructurado=SALIDA_ESTRUCTURADA)
+
+    # Primera pregunta con la plantilla del formulario: reutilizar un itinerario equivalente si existe
+    clave = clave_itinerario(plan)
+    respuesta = itinerarios.buscar(clave)
+    cache_itinerario = respuesta is not None
+    if cache_itinerario:
+        logger.info(f"⚡ Itinerario servido desde caché: {clave}")
+    else:
+        respuesta = generar_compartido(clave, prompt, plan['plazo'], plan['estructurado'])
+
+    respuesta = texto_respuesta(plan, respuesta)
+    guardar_turno(plan, respuesta)
+
+    # Recoger el resto del enriquecimiento (ya corría en paralelo con Gemini)
+    fotos_data = recoger_fotos(plan)
+    info_adicional = recoger_info_adicional(plan)
+    return respuesta_planificacion(plan, respuesta, cache_itinerario, clima_data, fotos_data, info_adicional)
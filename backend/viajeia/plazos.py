@@ -0,0 +1,87 @@
+"""
+Plazo total de una petición de planificación
+
+Cada petición nace con un Plazo de PLAZO segundos, por debajo del
+proxy_read_timeout de nginx (60 s en nginx.conf.example): así el usuario
+recibe la respuesta, o un error claro, antes de que el proxy corte con un 504.
+Todas las esperas de la petición se recortan al tiempo que le queda:
+
+- Las consultas de enriquecimiento (clima, fotos, tipo de cambio) ya corren
+  en paralelo; la petición deja de esperarlas cuando no queda tiempo y sigue
+  sin ellas. La consulta no se cancela: termina en segundo plano y su
+  resultado queda en la caché para la próxima petición.
+- El clima se espera como mucho hasta dejar RESERVA_GENERACION segundos
+  para Gemini.
+- La llamada a Gemini recibe el tiempo restante como timeout; si ya no queda
+  ni MINIMO_GENERACION, la petición falla enseguida con PlazoAgotado.
+"""
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+PLAZO = float(os.getenv('PLAZO_PETICION', '50'))
+# Segundos que la espera del clima deja libres para la generación de Gemini
+RESERVA_GENERACION = float(os.getenv('PLAZO_RESERVA_GENERACION', '30'))
+# Por debajo de esto no se empieza una generación
+MINIMO_GENERACION = float(os.getenv('PLAZO_MINIMO_GENERACION', '3'))
+
+_lock = threading.Lock()
+_omitidas = {}
+_agotados = 0
+
+
+class PlazoAgotado(Exception):
+    """No queda tiempo en el plazo de la petición para una llamada obligatoria"""
+
+
+class Plazo:
+    """Momento límite de una petición; restante() y espera() dicen cuánto se puede esperar aún"""
+
+    __slots__ = ('segundos', 'limite')
+
+    def __init__(self, segundos=PLAZO):
+        self.segundos = segundos
+        self.limite = time.monotonic() + segundos
+
+    def restante(self):
+        return max(self.limite - time.monotonic(), 0.0)
+
+    def espera(self, maximo=None, reserva=0):
+        """Segundos que se puede esperar algo opcional dejando `reserva` libres (0 si ya no hay)"""
+        segundos = max(self.restante() - reserva, 0.0)
+        return segundos if maximo is None else min(segundos, maximo)
+
+    def exigir(self, minimo, que):
+        """Tiempo restante para una llamada obligatoria; PlazoAgotado si no llega a `minimo`"""
+        global _agotados
+        restante = self.restante()
+        if restante < minimo:
+            with _lock:
+                _agotados += 1
+            raise PlazoAgotado(f'{que}: quedan {restante:.1f}s del plazo de {self.segundos:g}s')
+        return restante
+
+
+def agotado(error):
+    """El error es de un plazo (PlazoAgotado o el timeout que Gemini recibió de él)"""
+    return isinstance(error, PlazoAgotado) or 'deadline exceeded' in str(error).lower()
+
+
+def omitida(nombre):
+    """Registra una consulta opcional que la petición dejó de esperar por el plazo"""
+    with _lock:
+        _omitidas[nombre] = _omitidas.get(nombre, 0) + 1
+    logger.warning(f"⏱️ '{nombre}' omitida: no cabe en el plazo de la petición")
+
+
+def estadisticas():
+    with _lock:
+        return {
+            'plazo': PLAZO,
+            'reserva_generacion': RESERVA_GENERACION,
+            'omitidas': dict(_omitidas),
+            'agotados': _agotados
+        }
@@ -0,0 +1,245 @@
+"""
+Secciones del itinerario de primera pregunta
+
+Los títulos son los mismos que exige el prompt de texto. DetectorSecciones
+recibe el texto por trozos, tal como llega del streaming de Gemini, y avisa
+cada vez que una sección queda completa.
+
+Con salida estructurada (GEMINI_SALIDA_ESTRUCTURADA) Gemini responde un JSON
+con esquema(): una lista de viñetas por sección. leer_salida() lo valida una
+sola vez en el servidor; si faltan secciones se piden solo esas
+(prompt_reparacion) y componer() arma el itinerario: el texto con títulos,
+el mismo formato que el del streaming (el del historial), y las secciones ya
+separadas para el cliente. La caché de itinerarios guarda las dos cosas, así
+que un acierto no vuelve a partir el texto; solo una respuesta en modo texto
+se separa con leer_texto, una vez, al generarla.
+"""
+import json
+import logging
+import re
+import threading
+
+logger = logging.getLogger(__name__)
+
+SECCIONES = (
+    'ALOJAMIENTO',
+    'COMIDA LOCAL',
+    'LUGARES IMPERDIBLES',
+    'CONSEJOS LOCALES',
+    'ESTIMACIÓN DE COSTOS',
+)
+
+# Campo de cada sección en el JSON de la salida estructurada
+CAMPOS = {
+    'ALOJAMIENTO': 'alojamiento',
+    'COMIDA LOCAL': 'comida_local',
+    'LUGARES IMPERDIBLES': 'lugares_imperdibles',
+    'CONSEJOS LOCALES': 'consejos_locales',
+    'ESTIMACIÓN DE COSTOS': 'estimacion_costos',
+}
+
+# Marcador de viñeta al principio de una línea (•, -, * o 1.)
+_VINETA = re.compile(r'^(?:[•\-*]|\d+[.)])\s+')
+
+_lock = threading.Lock()
+_salidas = {'validas': 0, 'reparadas': 0, 'incompletas': 0, 'invalidas': 0}
+
+# Título en su propia línea, tolerando markdown alrededor ("**ALOJAMIENTO:**", "## ALOJAMIENTO:")
+_TITULO = re.compile(
+    r'^[#*\s]*(' + '|'.join(re.escape(s) for s in SECCIONES) + r')\**\s*:\**\s*(.*)$'
+)
+
+
+class SalidaInvalida(ValueError):
+    """La salida estructurada de Gemini no es un objeto JSON"""
+
+
+def vinetas(lineas):
+    """Texto de cada viñeta sin su marcador; las líneas vacías se descartan"""
+    return [_VINETA.sub('', linea.strip()) for linea in lineas if linea.strip()]
+
+
+def titulo(linea):
+    """(sección, resto de la línea) si la línea es un título de sección, si no None"""
+    encontrado = _TITULO.match(linea.strip())
+    return (encontrado.group(1), encontrado.group(2)) if encontrado else None
+
+
+class DetectorSecciones:
+    """Acumula texto por trozos y devuelve las secciones a medida que se completan"""
+
+    def __init__(self):
+        self._pendiente = ''
+        self._actual = None
+        self._lineas = []
+
+    def _procesar_linea(self, linea):
+        completadas = []
+        encontrado = titulo(linea)
+        if encontrado:
+            if self._actual:
+                completadas.append(self._cerrar())
+            self._actual, resto = encontrado
+            self._lineas = [resto] if resto else []
+        elif self._actual is not None:
+            self._lineas.append(linea)
+        return completadas
+
+    def _cerrar(self):
+        seccion = {
+            'nombre': self._actual,
+            'contenido': '\n'.join(self._lineas).strip(),
+            'items': vinetas(self._lineas)
+        }
+        self._actual = None
+        self._lineas = []
+        return seccion
+
+    def alimentar(self, texto):
+        """Procesa un trozo de texto; retorna la lista de secciones que terminó"""
+        self._pendiente += texto
+        *lineas, self._pendiente = self._pendiente.split('\n')
+        completadas = []
+        for linea in lineas:
+            completadas.extend(self._procesar_linea(linea))
+        return completadas
+
+    def terminar(self):
+        """Cierra el texto: retorna la última sección (y la línea pendiente) si quedaba abierta"""
+        completadas = []
+        if self._pendiente:
+            completadas.extend(self._procesar_linea(self._pendiente))
+            self._pendiente = ''
+        if self._actual:
+            completadas.append(self._cerrar())
+        return completadas
+
+
+def leer_texto(texto):
+    """Secciones de un texto con títulos, en orden: lista de {'nombre', 'contenido', 'items'}"""
+    detector = DetectorSecciones()
+    return detector.alimentar(texto) + detector.terminar()
+
+
+def esquema(nombres=SECCIONES):
+    """Esquema JSON de las secciones pedidas: una lista de viñetas (texto) por sección"""
+    return {
+        'type': 'object',
+        'properties': {CAMPOS[nombre]: {'type': 'array', 'items': {'type': 'string'}} for nombre in nombres},
+        'required': [CAMPOS[nombre] for nombre in nombres]
+    }
+
+
+def configuracion(nombres=SECCIONES):
+    """generation_config de Gemini para responder JSON con esquema(nombres)"""
+    return {'response_mime_type': 'application/json', 'response_schema': esquema(nombres)}
+
+
+def leer_json(texto, nombres=SECCIONES):
+    """
+    Secciones de una salida estructurada: diccionario nombre → viñetas
+    Las secciones ausentes o vacías no aparecen; SalidaInvalida si no es un objeto JSON
+    """
+    texto = texto.strip()
+    if texto.startswith('```'):
+        # Bloque de código markdown alrededor del JSON
+        texto = texto.strip('`').strip()
+        if texto.startswith('json'):
+            texto = texto[4:]
+    try:
+        datos = json.loads(texto)
+    except ValueError as e:
+        raise SalidaInvalida(f'JSON no válido: {str(e)}')
+    if not isinstance(datos, dict):
+        raise SalidaInvalida('se esperaba un objeto JSON')
+
+    secciones = {}
+    for nombre in nombres:
+        valor = datos.get(CAMPOS[nombre])
+        if isinstance(valor, str):
+            valor = valor.split('\n')
+        if isinstance(valor, list):
+            items = vinetas(item for item in valor if isinstance(item, str))
+            if items:
+                secciones[nombre] = items
+    return secciones
+
+
+def leer_salida(texto, nombres=SECCIONES):
+    """leer_json() que no falla: si la salida no es JSON se aprovechan los títulos que traiga el texto"""
+    try:
+        return leer_json(texto, nombres)
+    except SalidaInvalida as e:
+        logger.warning(f"⚠️ Salida estructurada no válida ({str(e)}); se buscan títulos en el texto")
+        return {s['nombre']: s['items'] for s in leer_texto(texto) if s['nombre'] in nombres and s['items']}
+
+
+def faltantes(secciones):
+    """Secciones obligatorias que no están, en orden"""
+    return [nombre for nombre in SECCIONES if nombre not in secciones]
+
+
+def prompt_reparacion(prompt, faltan):
+    """El mismo prompt pidiendo solo las secciones que faltan (mucho menos texto que regenerar)"""
+    campos = ', '.join(CAMPOS[nombre] for nombre in faltan)
+    return f"{prompt}\n\nResponde solo con estas secciones: {campos}."
+
+
+def texto(secciones):
+    """Texto con títulos y viñetas de las secciones (formato de la caché y del historial)"""
+    return '\n\n'.join(
+        f'{nombre}:\n' + '\n'.join(f'• {item}' for item in secciones[nombre])
+        for nombre in SECCIONES if nombre in secciones
+    )
+
+
+def separadas(secciones):
+    """Secciones para el cliente (como las de leer_texto) desde nombre → viñetas, sin pasar por el texto"""
+    return [
+        {
+            'nombre': nombre,
+            'contenido': '\n'.join(f'• {item}' for item in secciones[nombre]),
+            'items': list(secciones[nombre])
+        }
+        for nombre in SECCIONES if nombre in secciones
+    ]
+
+
+def itinerario(texto, secciones=None):
+    """Itinerario como lo guarda la caché: el texto y sus secciones separadas (None si no tiene)"""
+    return {'texto': texto, 'secciones': secciones or None}
+
+
+def leer_itinerario(valor):
+    """
+    (texto, secciones) de un itinerario; un texto suelto (modo texto o una
+    entrada de la caché anterior a las secciones guardadas) se separa aquí
+    """
+    if isinstance(valor, dict):
+        return valor['texto'], valor['secciones']
+    return valor, leer_texto(valor) or None
+
+
+def componer(secciones, original, reparada=False):
+    """
+    Itinerario final de la salida estructurada (ver itinerario()); sin ninguna
+    sección se deja la salida original para no perder la respuesta
+    """
+    if not secciones:
+        resultado = 'invalidas'
+    elif faltantes(secciones):
+        resultado = 'incompletas'
+    else:
+        resultado = 'reparadas' if reparada else 'validas'
+    with _lock:
+        _salidas[resultado] += 1
+    if resultado in ('invalidas', 'incompletas'):
+        logger.warning(f"⚠️ Itinerario estructurado ({resultado}): faltan {faltantes(secciones)}")
+    if not secciones:
+        return itinerario(original)
+    return itinerario(texto(secciones), separadas(secciones))
+
+
+def estadisticas():
+    with _lock:
+        return dict(_salidas)
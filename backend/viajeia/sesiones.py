@@ -0,0 +1,667 @@
+"""
+Almacén de sesiones de conversación
+
+Guarda por sesión las últimas MAX_TURNOS interacciones (pregunta, respuesta) y
+el destino principal. Con varios workers de gunicorn, o en Vercel, un
+seguimiento puede llegar a un proceso que nunca vio la sesión; si el almacén
+es solo de ese proceso la pregunta se trata como primera y se genera de nuevo
+un itinerario completo. Por eso hay tres backends con la misma interfaz:
+
+- 'memoria': diccionario del proceso (el comportamiento original)
+- 'sqlite': tabla SQLite en WAL compartida por los workers de la máquina
+- 'redis': cualquier servidor que hable el protocolo de Redis (necesita el
+  paquete redis); es el adecuado para Vercel o varias máquinas
+
+En los tres, añadir un turno y recortar a los últimos MAX_TURNOS es O(1) y
+las sesiones caducan SESIONES_TTL segundos después de su último uso.
+Se elige con SESIONES_BACKEND (por defecto redis si hay SESIONES_REDIS_URL,
+si no sqlite).
+
+Cada turno se guarda compacto: la pregunta y los primeros LARGO_RESUMEN
+caracteres de la respuesta, que es todo lo que leen el prompt y el historial
+resumido. El texto completo solo se conserva, comprimido con zlib, si
+SESIONES_TEXTO_COMPLETO está activo.
+
+Topes (SESIONES_MAX sesiones y SESIONES_MAX_BYTES de texto guardado) con
+desalojo:
+- 'memoria': LRU global del proceso (leer también cuenta como uso); se
+  aplican en cada escritura y 'bytes' en las estadísticas es la memoria
+  estimada del worker.
+- 'sqlite' (por defecto): las sesiones no ocupan memoria del worker; los topes
+  limitan la base compartida y se aplican en la purga periódica (cada
+  PURGA_CADA escrituras de un worker), así que pueden superarse un poco entre
+  purgas. Se desalojan las de escritura más antigua (leer no renueva la
+  sesión). 'bytes' son los bytes de texto guardados en la base, que se llevan
+  por sesión y en total en cada escritura: ni la purga ni las estadísticas
+  recorren la base.
+- 'redis': solo TTL; el tope de memoria es el del servidor (maxmemory con una
+  política allkeys-lru o volatile-lru).
+
+Cada sesión guarda además el resumen acumulado de la conversación que mantiene
+viajeia/contexto.py (un diccionario JSON), con el mismo TTL que los turnos.
+
+Los turnos se numeran por sesión (1, 2, 3...) y ese número es el cursor del
+historial: las respuestas solo traen el turno nuevo y su cursor, y
+GET /api/sesion/<id>/historial?since=<cursor> devuelve solo los turnos
+posteriores (turnos_desde).
+"""
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import zlib
+from base64 import b64decode, b64encode
+from collections import OrderedDict, deque
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+MAX_TURNOS = 10
+TTL = float(os.getenv('SESIONES_TTL', str(24 * 3600)))
+RUTA_DB = os.getenv('VIAJEIA_SESIONES_DB', str(Path(tempfile.gettempdir()) / 'viajeia_sesiones.sqlite3'))
+REDIS_URL = os.getenv('SESIONES_REDIS_URL', '')
+# Cada cuántas escrituras se borran las sesiones caducadas en SQLite
+PURGA_CADA = 256
+# Caracteres de la respuesta que usan construir_prompt (200) y turno_historial (100)
+LARGO_RESUMEN = 200
+TEXTO_COMPLETO = os.getenv('SESIONES_TEXTO_COMPLETO', 'true').lower() == 'true'
+# Topes de los backends 'memoria' (por worker) y 'sqlite' (de la base); desalojan las sesiones menos usadas
+MAX_BYTES = int(os.getenv('SESIONES_MAX_BYTES', str(32 * 1024 * 1024)))
+MAX_SESIONES = int(os.getenv('SESIONES_MAX', '20000'))
+
+
+def compactar(respuesta, completo=TEXTO_COMPLETO):
+    """Retorna (resumen, texto completo comprimido o None) de una respuesta"""
+    comprimido = None
+    if completo and len(respuesta) > LARGO_RESUMEN:
+        comprimido = zlib.compress(respuesta.encode('utf-8'), 6)
+    return respuesta[:LARGO_RESUMEN], comprimido
+
+
+def descomprimir(resumen, comprimido):
+    """Texto completo de un turno (el resumen si no se guardó completo)"""
+    return zlib.decompress(comprimido).decode('utf-8') if comprimido else resumen
+
+
+class AlmacenSesiones:
+    """Interfaz común de los backends de sesión"""
+
+    nombre = 'base'
+
+    def cargar(self, session_id):
+        """
+        Retorna (historial, destino): lista de (pregunta, resumen de la respuesta)
+        y destino o None
+        """
+        raise NotImplementedError
+
+    def turnos_completos(self, session_id):
+        """Lista de (pregunta, respuesta completa) de la sesión, si se guardó el texto"""
+        raise NotImplementedError
+
+    def agregar_turno(self, session_id, pregunta, respuesta, destino=None):
+        """
+        Añade un turno, recorta a los últimos MAX_TURNOS y renueva el TTL (y el destino si se da)
+        Retorna el número del turno en la sesión (su cursor)
+        """
+        raise NotImplementedError
+
+    def turnos_desde(self, session_id, desde=0):
+        """
+        Retorna (último cursor, turnos): los turnos aún guardados con cursor
+        mayor que `desde`, como (cursor, pregunta, resumen); (0, []) si la sesión no existe
+        """
+        raise NotImplementedError
+
+    def cargar_resumen(self, session_id):
+        """Resumen acumulado de la sesión (diccionario de viajeia.contexto) o None"""
+        raise NotImplementedError
+
+    def guardar_resumen(self, session_id, resumen):
+        """Guarda el resumen de una sesión existente (no renueva el TTL ni crea la sesión)"""
+        raise NotImplementedError
+
+    def borrar(self, session_id):
+        raise NotImplementedError
+
+    def estadisticas(self):
+        return {'backend': self.nombre, 'max_turnos': self.max_turnos, 'ttl': self.ttl}
+
+
+# Bytes fijos estimados de una sesión y de un turno (objetos de Python alrededor del texto)
+_BYTES_SESION = 400
+_BYTES_TURNO = 120
+
+
+def _tamano_turno(turno):
+    pregunta, resumen, comprimido = turno
+    return _BYTES_TURNO + len(pregunta) + len(resumen) + (len(comprimido) if comprimido else 0)
+
+
+def _tamano_resumen(resumen):
+    return len(json.dumps(resumen, ensure_ascii=False)) if resumen else 0
+
+
+def _bytes_texto(texto):
+    return len(texto.encode('utf-8'))
+
+
+# Bytes de un turno en SQLite (los mismos que suma _bytes_texto en Python)
+_BYTES_TURNO_SQL = (
+    'LENGTH(CAST(pregunta AS BLOB)) + LENGTH(CAST(respuesta AS BLOB)) + COALESCE(LENGTH(completo), 0)'
+)
+
+
+class _Sesion:
+    __slots__ = ('turnos', 'ultimo', 'destino', 'resumen', 'expira', 'bytes')
+
+    def __init__(self, max_turnos):
+        self.turnos = deque(maxlen=max_turnos)
+        # Número del último turno (los guardados son los len(turnos) últimos)
+        self.ultimo = 0
+        self.destino = None
+        self.resumen = None
+        self.expira = 0
+        self.bytes = _BYTES_SESION
+
+
+class AlmacenMemoria(AlmacenSesiones):
+    """
+    Sesiones en un LRU global del proceso
+    Cada uso mueve la sesión al final; las del principio son las más ociosas,
+    así que caducar por TTL y desalojar por tope de memoria solo mira la cabeza
+    """
+
+    nombre = 'memoria'
+
+    def __init__(self, max_turnos=MAX_TURNOS, ttl=TTL, max_bytes=MAX_BYTES, max_sesiones=MAX_SESIONES):
+        self.max_turnos = max_turnos
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.max_sesiones = max_sesiones
+        self._sesiones = OrderedDict()
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self._desalojos = 0
+        self._caducadas = 0
+
+    def _vigente(self, session_id, ahora):
+        sesion = self._sesiones.get(session_id)
+        if sesion is None:
+            return None
+        if sesion.expira <= ahora:
+            self._quitar(session_id)
+            self._caducadas += 1
+            return None
+        sesion.expira = ahora + self.ttl
+        self._sesiones.move_to_end(session_id)
+        return sesion
+
+    def _quitar(self, session_id):
+        sesion = self._sesiones.pop(session_id)
+        self._bytes -= sesion.bytes
+
+    def _podar(self, ahora):
+        # Primero las ociosas caducadas, luego las menos usadas hasta volver bajo los topes
+        while self._sesiones:
+            session_id, sesion = next(iter(self._sesiones.items()))
+            if sesion.expira <= ahora:
+                self._caducadas += 1
+            elif self._bytes > self.max_bytes or len(self._sesiones) > self.max_sesiones:
+                self._desalojos += 1
+            else:
+                break
+            self._quitar(session_id)
+
+    def cargar(self, session_id):
+        with self._lock:
+            sesion = self._vigente(session_id, time.time())
+            if sesion is None:
+                return [], None
+            return [(pregunta, resumen) for pregunta, resumen, _ in sesion.turnos], sesion.destino
+
+    def turnos_completos(self, session_id):
+        with self._lock:
+            sesion = self._vigente(session_id, time.time())
+            turnos = list(sesion.turnos) if sesion else []
+        return [(pregunta, descomprimir(resumen, comprimido)) for pregunta, resumen, comprimido in turnos]
+
+    def turnos_desde(self, session_id, desde=0):
+        with self._lock:
+            sesion = self._vigente(session_id, time.time())
+            if sesion is None:
+                return 0, []
+            primero = sesion.ultimo - len(sesion.turnos) + 1
+            return sesion.ultimo, [
+                (primero + i, pregunta, resumen)
+                for i, (pregunta, resumen, _) in enumerate(sesion.turnos)
+                if primero + i > desde
+            ]
+
+    def agregar_turno(self, session_id, pregunta, respuesta, destino=None):
+        ahora = time.time()
+        turno = (pregunta,) + compactar(respuesta)
+        with self._lock:
+            sesion = self._vigente(session_id, ahora)
+            if sesion is None:
+                sesion = self._sesiones[session_id] = _Sesion(self.max_turnos)
+                sesion.expira = ahora + self.ttl
+                self._bytes += sesion.bytes
+            if len(sesion.turnos) == self.max_turnos:
+                saliente = _tamano_turno(sesion.turnos[0])
+                sesion.bytes -= saliente
+                self._bytes -= saliente
+            sesion.turnos.append(turno)
+            sesion.ultimo += 1
+            tamano = _tamano_turno(turno)
+            sesion.bytes += tamano
+            self._bytes += tamano
+            if destino:
+                sesion.destino = destino
+            self._podar(ahora)
+            return sesion.ultimo
+
+    def cargar_resumen(self, session_id):
+        with self._lock:
+            sesion = self._sesiones.get(session_id)
+            if sesion is None or sesion.expira <= time.time():
+                return None
+            return sesion.resumen
+
+    def guardar_resumen(self, session_id, resumen):
+        with self._lock:
+            sesion = self._sesiones.get(session_id)
+            if sesion is None:
+                return
+            diferencia = _tamano_resumen(resumen) - _tamano_resumen(sesion.resumen)
+            sesion.resumen = resumen
+            sesion.bytes += diferencia
+            self._bytes += diferencia
+            self._podar(time.time())
+
+    def borrar(self, session_id):
+        with self._lock:
+            if session_id in self._sesiones:
+                self._quitar(session_id)
+
+    def estadisticas(self):
+        datos = super().estadisticas()
+        with self._lock:
+            datos['sesiones'] = len(self._sesiones)
+            datos['bytes'] = self._bytes
+            datos['desalojos'] = self._desalojos
+            datos['caducadas'] = self._caducadas
+        datos['max_bytes'] = self.max_bytes
+        datos['max_sesiones'] = self.max_sesiones
+        datos['texto_completo'] = TEXTO_COMPLETO
+        return datos
+
+
+class AlmacenSQLite(AlmacenSesiones):
+    """
+    Sesiones en SQLite (WAL) compartidas por los workers de la máquina
+    Cada turno lleva un número de secuencia por sesión: añadir es un INSERT y
+    recortar borra por clave primaria el turno que sale de la ventana.
+    Solo las escrituras renuevan expira (leer no escribe en la base), así que
+    ordenar por expira es ordenar por última escritura: la purga desaloja por
+    ahí, con el índice de expira, las que pasan de los topes. Cada sesión lleva
+    sus bytes en una columna y unos triggers mantienen los totales de la base
+    en la tabla sesiones_totales
+    """
+
+    nombre = 'sqlite'
+
+    def __init__(self, ruta_db=RUTA_DB, max_turnos=MAX_TURNOS, ttl=TTL, max_bytes=MAX_BYTES,
+                 max_sesiones=MAX_SESIONES, purga_cada=PURGA_CADA):
+        self.ruta_db = ruta_db
+        self.max_turnos = max_turnos
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.max_sesiones = max_sesiones
+        self.purga_cada = purga_cada
+        self._local = threading.local()
+        self._escrituras = 0
+        self._desalojos = 0
+        self._lock = threading.Lock()
+        self._conexion()
+
+    def _conexion(self):
+        """Conexión SQLite de este hilo y proceso"""
+        conexion = getattr(self._local, 'conexion', None)
+        if conexion is not None and self._local.pid == os.getpid():
+            return conexion
+        conexion = sqlite3.connect(self.ruta_db, timeout=2, isolation_level=None, check_same_thread=False)
+        conexion.execute('PRAGMA journal_mode=WAL')
+        conexion.execute('PRAGMA synchronous=NORMAL')
+        conexion.execute('BEGIN IMMEDIATE')
+        try:
+            self._crear_tablas(conexion)
+            conexion.execute('COMMIT')
+        except Exception:
+            conexion.execute('ROLLBACK')
+            raise
+        self._local.conexion = conexion
+        self._local.pid = os.getpid()
+        return conexion
+
+    def _crear_tablas(self, conexion):
+        conexion.execute(
+            'CREATE TABLE IF NOT EXISTS sesiones ('
+            'session_id TEXT PRIMARY KEY, destino TEXT, ultimo INTEGER NOT NULL, expira REAL NOT NULL)'
+        )
+        try:
+            # Bases creadas antes de que existiera el resumen acumulado
+            conexion.execute('ALTER TABLE sesiones ADD COLUMN resumen TEXT')
+        except sqlite3.OperationalError:
+            pass
+        conexion.execute(
+            'CREATE TABLE IF NOT EXISTS turnos ('
+            'session_id TEXT NOT NULL, seq INTEGER NOT NULL, pregunta TEXT NOT NULL, respuesta TEXT NOT NULL, '
+            'completo BLOB, PRIMARY KEY (session_id, seq)) WITHOUT ROWID'
+        )
+        try:
+            # Bases creadas antes de los topes: los bytes de cada sesión se calculan una vez
+            conexion.execute('ALTER TABLE sesiones ADD COLUMN bytes INTEGER NOT NULL DEFAULT 0')
+            conexion.execute(
+                'UPDATE sesiones SET bytes = COALESCE(LENGTH(CAST(resumen AS BLOB)), 0) + COALESCE(('
+                f'SELECT SUM({_BYTES_TURNO_SQL}) FROM turnos WHERE turnos.session_id = sesiones.session_id), 0)'
+            )
+        except sqlite3.OperationalError:
+            pass
+        conexion.execute('CREATE INDEX IF NOT EXISTS sesiones_expira ON sesiones (expira)')
+        conexion.execute(
+            'CREATE TABLE IF NOT EXISTS sesiones_totales ('
+            'id INTEGER PRIMARY KEY CHECK (id = 1), sesiones INTEGER NOT NULL, bytes INTEGER NOT NULL)'
+        )
+        conexion.execute(
+            'CREATE TRIGGER IF NOT EXISTS sesiones_alta AFTER INSERT ON sesiones BEGIN '
+            'UPDATE sesiones_totales SET sesiones = sesiones + 1, bytes = bytes + NEW.bytes; END'
+        )
+        conexion.execute(
+            'CREATE TRIGGER IF NOT EXISTS sesiones_baja AFTER DELETE ON sesiones BEGIN '
+            'UPDATE sesiones_totales SET sesiones = sesiones - 1, bytes = bytes - OLD.bytes; END'
+        )
+        conexion.execute(
+            'CREATE TRIGGER IF NOT EXISTS sesiones_bytes AFTER UPDATE OF bytes ON sesiones BEGIN '
+            'UPDATE sesiones_totales SET bytes = bytes + NEW.bytes - OLD.bytes; END'
+        )
+        conexion.execute(
+            'INSERT OR IGNORE INTO sesiones_totales (id, sesiones, bytes) '
+            'SELECT 1, COUNT(*), COALESCE(SUM(bytes), 0) FROM sesiones'
+        )
+
+    def _leer(self, session_id, columnas):
+        conexion = self._conexion()
+        fila = conexion.execute(
+            'SELECT destino, ultimo FROM sesiones WHERE session_id = ? AND expira > ?',
+            (session_id, time.time()),
+        ).fetchone()
+        if fila is None:
+            return [], None
+        destino, ultimo = fila
+        turnos = conexion.execute(
+            f'SELECT {columnas} FROM turnos WHERE session_id = ? AND seq > ? ORDER BY seq',
+            (session_id, ultimo - self.max_turnos),
+        ).fetchall()
+        return turnos, destino
+
+    def cargar(self, session_id):
+        turnos, destino = self._leer(session_id, 'pregunta, respuesta')
+        return [tuple(t) for t in turnos], destino
+
+    def turnos_completos(self, session_id):
+        turnos, _ = self._leer(session_id, 'pregunta, respuesta, completo')
+        return [(pregunta, descomprimir(resumen, completo)) for pregunta, resumen, completo in turnos]
+
+    def turnos_desde(self, session_id, desde=0):
+        conexion = self._conexion()
+        fila = conexion.execute(
+            'SELECT ultimo FROM sesiones WHERE session_id = ? AND expira > ?', (session_id, time.time())
+        ).fetchone()
+        if fila is None:
+            return 0, []
+        ultimo = fila[0]
+        turnos = conexion.execute(
+            'SELECT seq, pregunta, respuesta FROM turnos WHERE session_id = ? AND seq > ? ORDER BY seq',
+            (session_id, max(desde, ultimo - self.max_turnos)),
+        ).fetchall()
+        return ultimo, [tuple(t) for t in turnos]
+
+    def agregar_turno(self, session_id, pregunta, respuesta, destino=None):
+        conexion = self._conexion()
+        ahora = time.time()
+        resumen, completo = compactar(respuesta)
+        tamano = _bytes_texto(pregunta) + _bytes_texto(resumen) + (len(completo) if completo else 0)
+        with self._lock:
+            self._escrituras += 1
+            purgar = self._escrituras % self.purga_cada == 0
+        conexion.execute('BEGIN IMMEDIATE')
+        try:
+            fila = conexion.execute(
+                'SELECT ultimo, expira FROM sesiones WHERE session_id = ?', (session_id,)
+            ).fetchone()
+            if fila is not None and fila[1] <= ahora:
+                # Sesión caducada que aún no se purgó: empieza de cero
+                conexion.execute('DELETE FROM turnos WHERE session_id = ?', (session_id,))
+                conexion.execute('DELETE FROM sesiones WHERE session_id = ?', (session_id,))
+                fila = None
+            seq = (fila[0] if fila else 0) + 1
+            conexion.execute(
+                'INSERT INTO turnos (session_id, seq, pregunta, respuesta, completo) VALUES (?, ?, ?, ?, ?)',
+                (session_id, seq, pregunta, resumen, completo),
+            )
+            saliente = conexion.execute(
+                f'DELETE FROM turnos WHERE session_id = ? AND seq = ? RETURNING {_BYTES_TURNO_SQL}',
+                (session_id, seq - self.max_turnos),
+            ).fetchone()
+            tamano -= saliente[0] if saliente else 0
+            conexion.execute(
+                'INSERT INTO sesiones (session_id, destino, ultimo, expira, bytes) VALUES (?1, ?2, ?3, ?4, ?5) '
+                'ON CONFLICT(session_id) DO UPDATE SET '
+                'destino = COALESCE(excluded.destino, destino), ultimo = excluded.ultimo, expira = excluded.expira, '
+                'bytes = bytes + ?5',
+                (session_id, destino or None, seq, ahora + self.ttl, tamano),
+            )
+            conexion.execute('COMMIT')
+        except Exception:
+            conexion.execute('ROLLBACK')
+            raise
+        if purgar:
+            self._purgar(ahora)
+        return seq
+
+    def cargar_resumen(self, session_id):
+        fila = self._conexion().execute(
+            'SELECT resumen FROM sesiones WHERE session_id = ? AND expira > ?', (session_id, time.time())
+        ).fetchone()
+        return json.loads(fila[0]) if fila and fila[0] else None
+
+    def guardar_resumen(self, session_id, resumen):
+        texto = json.dumps(resumen, ensure_ascii=False)
+        self._conexion().execute(
+            'UPDATE sesiones SET bytes = bytes - COALESCE(LENGTH(CAST(resumen AS BLOB)), 0) + ?, resumen = ? '
+            'WHERE session_id = ?',
+            (_bytes_texto(texto), texto, session_id),
+        )
+
+    def _purgar(self, ahora):
+        """Borra las sesiones caducadas y, si aún se pasa de los topes, las menos usadas"""
+        conexion = self._conexion()
+        try:
+            conexion.execute(
+                'DELETE FROM turnos WHERE session_id IN (SELECT session_id FROM sesiones WHERE expira <= ?)', (ahora,)
+            )
+            conexion.execute('DELETE FROM sesiones WHERE expira <= ?', (ahora,))
+            self._desalojar(conexion)
+        except sqlite3.Error as e:
+            logger.warning(f"Error purgando sesiones caducadas: {str(e)}")
+
+    def _totales(self, conexion):
+        """(sesiones, bytes) guardados en la base, que mantienen los triggers"""
+        return conexion.execute('SELECT sesiones, bytes FROM sesiones_totales').fetchone() or (0, 0)
+
+    def _desalojar(self, conexion):
+        """Borra las de escritura más antigua mientras la base pase de los topes (O(desalojadas))"""
+        desalojadas = 0
+        conexion.execute('BEGIN IMMEDIATE')
+        try:
+            sobrantes, total = self._totales(conexion)
+            sobrantes -= self.max_sesiones
+            while sobrantes > 0 or total > self.max_bytes:
+                lote = []
+                for session_id, tamano in conexion.execute(
+                    'SELECT session_id, bytes FROM sesiones ORDER BY expira LIMIT ?', (max(sobrantes, 64),)
+                ).fetchall():
+                    if sobrantes <= 0 and total <= self.max_bytes:
+                        break
+                    lote.append((session_id,))
+                    sobrantes -= 1
+                    total -= tamano
+                if not lote:
+                    break
+                conexion.executemany('DELETE FROM turnos WHERE session_id = ?', lote)
+                conexion.executemany('DELETE FROM sesiones WHERE session_id = ?', lote)
+                desalojadas += len(lote)
+            conexion.execute('COMMIT')
+        except Exception:
+            conexion.execute('ROLLBACK')
+            raise
+        if desalojadas:
+            with self._lock:
+                self._desalojos += desalojadas
+            logger.info(f"Sesiones: {desalojadas} desalojadas por los topes de la base")
+
+    def borrar(self, session_id):
+        conexion = self._conexion()
+        conexion.execute('DELETE FROM turnos WHERE session_id = ?', (session_id,))
+        conexion.execute('DELETE FROM sesiones WHERE session_id = ?', (session_id,))
+
+    def estadisticas(self):
+        datos = super().estadisticas()
+        # Totales de la base compartida (el worker no guarda sesiones en memoria); las
+        # caducadas cuentan hasta la próxima purga
+        datos['sesiones'], datos['bytes'] = self._totales(self._conexion())
+        with self._lock:
+            datos['desalojos'] = self._desalojos
+        datos['max_bytes'] = self.max_bytes
+        datos['max_sesiones'] = self.max_sesiones
+        datos['texto_completo'] = TEXTO_COMPLETO
+        datos['disco'] = self.ruta_db
+        return datos
+
+
+class AlmacenRedis(AlmacenSesiones):
+    """
+    Sesiones en un servidor con protocolo Redis
+    El historial es una lista (RPUSH + LTRIM a los últimos MAX_TURNOS) y el
+    destino, el resumen y el número del último turno (INCR) claves aparte;
+    todas con EXPIRE, en una sola transacción.
+    Cada turno es [pregunta, resumen, texto completo comprimido en base64 o null]
+    """
+
+    nombre = 'redis'
+
+    def __init__(self, url=REDIS_URL, max_turnos=MAX_TURNOS, ttl=TTL, cliente=None, prefijo='viajeia:sesion:'):
+        self.max_turnos = max_turnos
+        self.ttl = ttl
+        self.prefijo = prefijo
+        if cliente is None:
+            import redis  # dependencia opcional, solo para este backend
+            cliente = redis.Redis.from_url(url)
+        self._redis = cliente
+
+    def _claves(self, session_id):
+        base = f'{self.prefijo}{session_id}'
+        return f'{base}:turnos', f'{base}:destino', f'{base}:resumen', f'{base}:ultimo'
+
+    def _leer(self, session_id):
+        clave_turnos, clave_destino, _, _ = self._claves(session_id)
+        pipe = self._redis.pipeline(transaction=False)
+        pipe.lrange(clave_turnos, 0, -1)
+        pipe.get(clave_destino)
+        turnos, destino = pipe.execute()
+        if isinstance(destino, bytes):
+            destino = destino.decode('utf-8')
+        return [json.loads(t) for t in turnos], destino
+
+    def cargar(self, session_id):
+        turnos, destino = self._leer(session_id)
+        return [(pregunta, resumen) for pregunta, resumen, _ in turnos], destino
+
+    def turnos_completos(self, session_id):
+        turnos, _ = self._leer(session_id)
+        return [
+            (pregunta, descomprimir(resumen, b64decode(completo) if completo else None))
+            for pregunta, resumen, completo in turnos
+        ]
+
+    def turnos_desde(self, session_id, desde=0):
+        clave_turnos, _, _, clave_ultimo = self._claves(session_id)
+        pipe = self._redis.pipeline(transaction=True)
+        pipe.lrange(clave_turnos, 0, -1)
+        pipe.get(clave_ultimo)
+        turnos, ultimo = pipe.execute()
+        if not turnos:
+            return 0, []
+        # Sesiones anteriores al contador: se numeran como si empezaran en 1
+        ultimo = max(int(ultimo or 0), len(turnos))
+        primero = ultimo - len(turnos) + 1
+        return ultimo, [
+            (primero + i, pregunta, resumen)
+            for i, (pregunta, resumen, _) in enumerate(json.loads(t) for t in turnos)
+            if primero + i > desde
+        ]
+
+    def agregar_turno(self, session_id, pregunta, respuesta, destino=None):
+        clave_turnos, clave_destino, clave_resumen, clave_ultimo = self._claves(session_id)
+        ttl = max(1, int(self.ttl))
+        resumen, completo = compactar(respuesta)
+        turno = [pregunta, resumen, b64encode(completo).decode('ascii') if completo else None]
+        pipe = self._redis.pipeline(transaction=True)
+        pipe.incr(clave_ultimo)
+        pipe.expire(clave_ultimo, ttl)
+        pipe.rpush(clave_turnos, json.dumps(turno, ensure_ascii=False))
+        pipe.ltrim(clave_turnos, -self.max_turnos, -1)
+        pipe.expire(clave_turnos, ttl)
+        if destino:
+            pipe.set(clave_destino, destino, ex=ttl)
+        else:
+            pipe.expire(clave_destino, ttl)
+        pipe.expire(clave_resumen, ttl)
+        return pipe.execute()[0]
+
+    def cargar_resumen(self, session_id):
+        resumen = self._redis.get(self._claves(session_id)[2])
+        return json.loads(resumen) if resumen else None
+
+    def guardar_resumen(self, session_id, resumen):
+        clave_turnos, _, clave_resumen, _ = self._claves(session_id)
+        # Mismo TTL restante que los turnos; si la sesión ya caducó no se guarda
+        ttl = self._redis.ttl(clave_turnos)
+        if ttl and ttl > 0:
+            self._redis.set(clave_resumen, json.dumps(resumen, ensure_ascii=False), ex=ttl)
+
+    def borrar(self, session_id):
+        self._redis.delete(*self._claves(session_id))
+
+
+def crear_almacen(backend=None):
+    """
+    Crea el almacén configurado con SESIONES_BACKEND
+    Si el backend elegido no está disponible se usa el de memoria
+    """
+    backend = (backend or os.getenv('SESIONES_BACKEND') or ('redis' if REDIS_URL else 'sqlite')).lower()
+    try:
+        if backend == 'redis':
+            return AlmacenRedis()
+        if backend == 'sqlite' and RUTA_DB != 'off':
+            return AlmacenSQLite()
+    except Exception as e:
+        logger.warning(f"Almacén de sesiones '{backend}' no disponible, usando memoria: {str(e)}")
+    return AlmacenMemoria()
+
+
+almacen = crear_almacen()
@@ -0,0 +1,41 @@
+"""
+Diferencia horaria calculada en proceso
+
+La ciudad se resuelve a su zona IANA con el gazetteer local
+(viajeia.destinos.resolver) y el desfase UTC y la hora local salen de la base
+de datos tz del sistema (o del paquete tzdata), sin llamadas de red.
+"""
+from datetime import datetime
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from viajeia import destinos
+
+
+def formatear_offset(desfase):
+    """Formatea un timedelta como '+HH:MM' / '-HH:MM' (formato que espera el frontend)"""
+    minutos = int(desfase.total_seconds() // 60)
+    signo = '-' if minutos < 0 else '+'
+    horas, minutos = divmod(abs(minutos), 60)
+    return f'{signo}{horas:02d}:{minutos:02d}'
+
+
+def diferencia_horaria(ciudad):
+    """
+    Zona horaria, desfase UTC y hora local actuales de una ciudad
+    Retorna None si la ciudad no está en el gazetteer o la zona no existe
+    """
+    destino = destinos.resolver(ciudad)
+    if not destino:
+        return None
+    zona = destino.zona
+    try:
+        dt = datetime.now(ZoneInfo(zona))
+    except ZoneInfoNotFoundError:
+        return None
+    return {
+        'timezone': zona,
+        'utc_offset': formatear_offset(dt.utcoffset()),
+        'datetime': dt.isoformat(),
+        'hora_actual': dt.strftime('%H:%M:%S'),
+        'ciudad': ciudad
+    }
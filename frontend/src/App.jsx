@@ -1,39 +1,65 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import axios from 'axios';
 import jsPDF from 'jspdf';
 import html2canvas from 'html2canvas';
 import './App.css';
 
+// Función auxiliar para procesar negritas en un texto
+const processBold = (text, lineIndex) => {
+  const parts = [];
+  let lastIndex = 0;
+  const boldRegex = /\*\*(.*?)\*\*/g;
+  let match;
+  let boldIndex = 0;
+  
+  while ((match = boldRegex.exec(text)) !== null) {
+    // Agregar texto antes del match
+    if (match.index > lastIndex) {
+      parts.push(text.substring(lastIndex, match.index));
+    }
+    // Agregar texto en negrita
+    parts.push(<strong key={`bold-${lineIndex}-${boldIndex++}`}>{match[1]}</strong>);
+    lastIndex = match.index + match[0].length;
+  }
+  
+  // Agregar texto restante
+  if (lastIndex < text.length) {
+    parts.push(text.substring(lastIndex));
+  }
+  
+  return parts.length > 0 ? parts : text;
+};
+
+// Emoji de cada sección del itinerario (nombres tal como los envía el backend)
+const EMOJIS_SECCIONES = {
+  'ALOJAMIENTO': '🏨',
+  'COMIDA LOCAL': '🍽️',
+  'LUGARES IMPERDIBLES': '📍',
+  'CONSEJOS LOCALES': '💡',
+  'ESTIMACIÓN DE COSTOS': '💰'
+};
+
+// Secciones ya separadas por el backend (campo 'secciones' de la respuesta): no hace falta partir el texto
+const renderSecciones = (secciones) => secciones.map((seccion, index) => (
+  <div key={`section-${index}`} className="response-section">
+    <div className="section-header">
+      <span className="section-symbol">{EMOJIS_SECCIONES[seccion.nombre] || '•'}</span>
+      <span className="section-title">{seccion.nombre}</span>
+    </div>
+    <div className="section-content">
+      {seccion.items.map((item, idx) => (
+        <div key={idx} className="response-bullet">
+          • {processBold(item, `${index}-${idx}`)}
+        </div>
+      ))}
+    </div>
+  </div>
+));
+
 // Función para renderizar markdown simple (negritas y bullets)
 const renderMarkdown = (text) => {
   if (!text) return '';
   
-  // Función auxiliar para procesar negritas en un texto
-  const processBold = (text, lineIndex) => {
-    const parts = [];
-    let lastIndex = 0;
-    const boldRegex = /\*\*(.*?)\*\*/g;
-    let match;
-    let boldIndex = 0;
-    
-    while ((match = boldRegex.exec(text)) !== null) {
-      // Agregar texto antes del match
-      if (match.index > lastIndex) {
-        parts.push(text.substring(lastIndex, match.index));
-      }
-      // Agregar texto en negrita
-      parts.push(<strong key={`bold-${lineIndex}-${boldIndex++}`}>{match[1]}</strong>);
-      lastIndex = match.index + match[0].length;
-    }
-    
-    // Agregar texto restante
-    if (lastIndex < text.length) {
-      parts.push(text.substring(lastIndex));
-    }
-    
-    return parts.length > 0 ? parts : text;
-  };
-  
   // Dividir por líneas
   const lines = text.split('\n');
   const result = [];
@@ -160,6 +186,8 @@ function App() {
   const [infoAdicional, setInfoAdicional] = useState(null);
   const [horaActual, setHoraActual] = useState(new Date());
   const [historial, setHistorial] = useState([]);
+  // Cursor del último turno del historial; en un ref para que una respuesta no lea uno viejo
+  const historialCursor = useRef(0);
   const [favoritos, setFavoritos] = useState([]);
   
   // Cargar favoritos desde localStorage al iniciar
@@ -377,96 +405,28 @@ function App() {
         }
         
         if (item.respuesta) {
-          let respuestaTexto = item.respuesta;
-          
-          // Detectar secciones estructuradas
-          const secciones = [
-            { nombre: 'ALOJAMIENTO:', emoji: '🏨' },
-            { nombre: 'COMIDA LOCAL:', emoji: '🍽️' },
-            { nombre: 'LUGARES IMPERDIBLES:', emoji: '📍' },
-            { nombre: 'CONSEJOS LOCALES:', emoji: '💡' },
-            { nombre: 'ESTIMACIÓN DE COSTOS:', emoji: '💰' }
-          ];
-          
-          let tieneSecciones = false;
-          for (const seccion of secciones) {
-            if (respuestaTexto.includes(seccion.nombre)) {
-              tieneSecciones = true;
-              break;
-            }
-          }
-          
-          if (tieneSecciones) {
-            // Procesar respuesta con secciones estructuradas usando tablas
-            const lineas = respuestaTexto.split('\n');
-            let contenidoSeccion = '';
-            let seccionActual = null;
-            
-            for (let i = 0; i < lineas.length; i++) {
-              const linea = lineas[i].trim();
-              
-              // Verificar si es inicio de sección
-              let esInicioSeccion = false;
-              for (const seccion of secciones) {
-                if (linea.includes(seccion.nombre)) {
-                  // Cerrar sección anterior si existe
-                  if (seccionActual) {
-                    htmlContent += `
-                      <table class="pdf-section-table">
-                        <tr>
-                          <td class="pdf-section-header">${seccionActual.emoji} ${seccionActual.nombre}</td>
-                        </tr>
-                        <tr>
-                          <td class="pdf-section-content">
-                            <ul>${contenidoSeccion}</ul>
-                          </td>
-                        </tr>
-                      </table>
-                    `;
-                    contenidoSeccion = '';
-                  }
-                  
-                  esInicioSeccion = true;
-                  seccionActual = seccion;
-                  break;
-                }
-              }
-              
-              if (!esInicioSeccion && seccionActual && linea) {
-                // Procesar contenido de la sección
-                let textoProcesado = linea.replace(/\*\*(.*?)\*\*/g, '<strong>$1</strong>');
-                
-                // Detectar bullets
-                if (linea.match(/^[•\-\x2A]\s+(.+)/)) {
-                  contenidoSeccion += `<li>${textoProcesado.replace(/^[•\-\x2A]\s+/, '')}</li>`;
-                } else if (linea.trim() && !linea.match(/^ALOJAMIENTO:|^COMIDA LOCAL:|^LUGARES IMPERDIBLES:|^CONSEJOS LOCALES:|^ESTIMACIÓN DE COSTOS:/)) {
-                  contenidoSeccion += `<li>${textoProcesado}</li>`;
-                }
-              } else if (!esInicioSeccion && !seccionActual && linea) {
-                // Texto fuera de secciones
-                let textoProcesado = linea.replace(/\*\*(.*?)\*\*/g, '<strong>$1</strong>');
-                htmlContent += `<p style="line-height: 1.6; margin: 10px 0;">${textoProcesado}</p>`;
-              }
-            }
-            
-            // Cerrar última sección
-            if (seccionActual && contenidoSeccion) {
+          if (item.secciones) {
+            // Secciones ya separadas por el backend: una tabla por sección
+            item.secciones.forEach(seccion => {
+              const elementos = seccion.items
+                .map(texto => `<li>${texto.replace(/\*\*(.*?)\*\*/g, '<strong>$1</strong>')}</li>`)
+                .join('');
               htmlContent += `
                 <table class="pdf-section-table">
                   <tr>
-                    <td class="pdf-section-header">${seccionActual.emoji} ${seccionActual.nombre}</td>
+                    <td class="pdf-section-header">${EMOJIS_SECCIONES[seccion.nombre] || '•'} ${seccion.nombre}:</td>
                   </tr>
                   <tr>
                     <td class="pdf-section-content">
-                      <ul>${contenidoSeccion}</ul>
+                      <ul>${elementos}</ul>
                     </td>
                   </tr>
                 </table>
               `;
-            }
+            });
           } else {
             // Respuesta sin estructura de secciones
-            let textoProcesado = respuestaTexto.replace(/\*\*(.*?)\*\*/g, '<strong>$1</strong>');
+            let textoProcesado = item.respuesta.replace(/\*\*(.*?)\*\*/g, '<strong>$1</strong>');
             textoProcesado = textoProcesado.replace(/\n/g, '<br>');
             htmlContent += `<div style="line-height: 1.6; margin: 15px 0;">${textoProcesado}</div>`;
           }
@@ -550,9 +510,11 @@ function App() {
       // En producción (Vercel), usar rutas relativas. En desarrollo, usar la URL configurada o localhost
       const apiUrl = process.env.REACT_APP_API_URL || 
                      (process.env.NODE_ENV === 'production' ? '' : 'http://localhost:5000');
+      // Esta vista renueva el panel lateral aunque la sesión ya tenga preguntas
       const res = await axios.post(`${apiUrl}/api/planificar`, {
         pregunta: question,
-        session_id: sessionId
+        session_id: sessionId,
+        include: ['clima', 'fotos', 'info_adicional']
       });
       console.log('Respuesta del backend:', res.data);
       console.log('Clima recibido:', res.data.clima);
@@ -563,19 +525,20 @@ function App() {
       setResponses([{
         pregunta: formData.destino ? `Quiero planear un viaje a ${formData.destino}` : '',
         respuesta: res.data.respuesta,
+        secciones: res.data.secciones,
         esPrimera: true
       }]);
       setClima(res.data.clima || null);
       setFotos(res.data.fotos || []);
       setDestino(res.data.destino || null);
       setInfoAdicional(res.data.info_adicional || null);
-      setHistorial(res.data.historial || []);
+      actualizarHistorial(res.data);
       
       // Debug: verificar qué se está guardando
       console.log('Estado actualizado - Clima:', res.data.clima);
       console.log('Estado actualizado - Fotos:', res.data.fotos?.length || 0);
       console.log('Estado actualizado - Info adicional:', res.data.info_adicional);
-      console.log('Historial recibido:', res.data.historial);
+      console.log('Turno recibido:', res.data.cursor, res.data.turno);
       if (res.data.session_id) {
         setSessionId(res.data.session_id);
       }
@@ -589,6 +552,29 @@ function App() {
     }
   };
 
+  // Historial incremental: cada respuesta trae solo el turno nuevo y su cursor;
+  // si falta algún turno intermedio (otra pestaña, otra pregunta) se piden solo los que faltan
+  const actualizarHistorial = async (data) => {
+    if (!data.turno || !data.cursor) return;
+    if (data.cursor === historialCursor.current + 1) {
+      historialCursor.current = data.cursor;
+      setHistorial(prev => [...prev, data.turno].slice(-10));
+      return;
+    }
+    try {
+      const apiUrl = process.env.REACT_APP_API_URL || 
+                     (process.env.NODE_ENV === 'production' ? '' : 'http://localhost:5000');
+      const res = await axios.get(
+        `${apiUrl}/api/sesion/${encodeURIComponent(data.session_id)}/historial`,
+        { params: { since: historialCursor.current } }
+      );
+      historialCursor.current = res.data.cursor;
+      setHistorial(prev => (res.data.reiniciar ? res.data.turnos : [...prev, ...res.data.turnos]).slice(-10));
+    } catch (err) {
+      console.error('Error actualizando historial:', err);
+    }
+  };
+
   const handleClear = () => {
     setQuestion('');
     setFollowUpQuestion('');
@@ -612,6 +598,8 @@ function App() {
       // En producción (Vercel), usar rutas relativas. En desarrollo, usar la URL configurada o localhost
       const apiUrl = process.env.REACT_APP_API_URL || 
                      (process.env.NODE_ENV === 'production' ? '' : 'http://localhost:5000');
+      // Sin include, un seguimiento solo trae la respuesta: el backend no consulta
+      // clima, fotos, tipo de cambio ni diferencia horaria que aquí no se usan
       const res = await axios.post(`${apiUrl}/api/planificar`, {
         pregunta: followUpQuestion,
         session_id: sessionId
@@ -631,7 +619,7 @@ function App() {
       
       // NO actualizar clima, fotos, destino ni info adicional - mantener los de la primera pregunta
       // Solo actualizar historial y session_id
-      if (res.data.historial) setHistorial(res.data.historial);
+      actualizarHistorial(res.data);
       if (res.data.session_id) setSessionId(res.data.session_id);
       setFollowUpQuestion('');
     } catch (err) {
@@ -673,8 +661,11 @@ function App() {
       // En producción (Vercel), usar rutas relativas. En desarrollo, usar la URL configurada o localhost
       const apiUrl = process.env.REACT_APP_API_URL || 
                      (process.env.NODE_ENV === 'production' ? '' : 'http://localhost:5000');
+      // Como handleSubmit: la primera respuesta llena el panel lateral y sigue la sesión actual
       const res = await axios.post(`${apiUrl}/api/planificar`, {
-        pregunta: preguntaInicial
+        pregunta: preguntaInicial,
+        session_id: sessionId,
+        include: ['clima', 'fotos', 'info_adicional']
       });
       console.log('Respuesta del backend:', res.data);
       console.log('Clima recibido:', res.data.clima);
@@ -685,12 +676,15 @@ function App() {
       setResponses([{
         pregunta: formData.destino ? `Quiero planear un viaje a ${formData.destino}` : '',
         respuesta: res.data.respuesta,
+        secciones: res.data.secciones,
         esPrimera: true
       }]);
       setClima(res.data.clima || null);
       setFotos(res.data.fotos || []);
       setDestino(res.data.destino || null);
       setInfoAdicional(res.data.info_adicional || null);
+      actualizarHistorial(res.data);
+      if (res.data.session_id) setSessionId(res.data.session_id);
     } catch (err) {
       console.error('Error:', err);
       const errorMessage = err.response?.data?.error || 
@@ -1202,6 +1196,7 @@ function App() {
                                 setSessionId(null);
                                 setInfoAdicional(null);
                                 setHistorial([]);
+                                historialCursor.current = 0;
                                 setFollowUpQuestion('');
                               }}
                               aria-label="Cerrar chat"
@@ -1212,7 +1207,7 @@ function App() {
                         </div>
                       </div>
                       <div className="response-content">
-                        {renderMarkdown(item.respuesta)}
+                        {item.secciones ? renderSecciones(item.secciones) : renderMarkdown(item.respuesta)}
                       </div>
                     </div>
                   );
@@ -1243,7 +1238,7 @@ function App() {
                         </div>
                         <button
                           className="history-download-btn"
-                          onClick={() => generarPDF({ pregunta: item.pregunta, respuesta: item.respuesta })}
+                          onClick={() => generarPDF({ pregunta: item.pregunta, respuesta: item.respuesta, secciones: item.secciones })}
                           title="Descargar esta conversación en PDF"
                         >
                           📥